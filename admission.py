@@ -0,0 +1,367 @@
+"""Admission control in front of the model backend.
+
+Without it a burst of submissions goes straight upstream, overruns the API
+quota and every caller gets a 429 together. The Scheduler instead holds calls
+in a queue and releases them only while the requests-per-minute and
+tokens-per-minute buckets (and a cap on concurrent calls) have room, so the
+upstream sees a steady rate just under quota.
+
+Waiting calls are ordered by lane, then fairly across users:
+
+* lanes are strictly prioritised - an interactive call always goes before a
+  bulk one that is still waiting;
+* within a lane, users take turns (round robin), so one user's 500-item batch
+  doesn't starve everybody else's.
+
+The lane and user of a call come from the surrounding context (see
+`calling_as`), so they reach the backend without being threaded through every
+function in between. When the queue is full, QueueFull carries a Retry-After
+estimate and the position the call would have had: the calls ahead spread over
+the concurrent slots at the mean call duration seen so far, or over the
+request rate when that is slower.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+ANONYMOUS = 'anonymous'
+
+# Seconds to retry after when neither concurrency nor request rate is limited
+DEFAULT_RETRY_AFTER_SECONDS = 5
+# Weight of the latest call in the running mean call duration
+CALL_SECONDS_SMOOTHING = 0.2
+
+_caller = contextvars.ContextVar('admission_caller', default=(INTERACTIVE, ANONYMOUS))
+
+
+@contextmanager
+def calling_as(lane, user):
+    """Attributes model calls made inside the block to this lane and user."""
+    token = _caller.set((lane if lane in LANES else INTERACTIVE, user or ANONYMOUS))
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def current_caller():
+    return _caller.get()
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler already holds its maximum number of waiting calls."""
+
+    def __init__(self, retry_after, position):
+        super().__init__(f'Model call queue is full (position {position}, retry after {retry_after}s)')
+        self.retry_after = retry_after
+        self.position = position
+
+
+class TokenBucket:
+    """Refills at `per_minute` units per minute up to `per_minute` units; 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # A single call bigger than the whole bucket waits for a full bucket rather than forever
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def adjust(self, amount):
+        """Charges (or refunds) the difference between an estimate and the actual usage."""
+        if self.capacity:
+            self.level = min(self.capacity, self.level - amount)
+
+
+class _Ticket:
+    __slots__ = ('lane', 'user', 'tokens', 'waker', 'admitted', 'admitted_at')
+
+    def __init__(self, lane, user, tokens, waker=None):
+        self.lane = lane
+        self.user = user
+        self.tokens = tokens
+        self.waker = waker  # set for coroutines, which can't wait on the condition
+        self.admitted = False
+        self.admitted_at = None
+
+
+class Scheduler:
+    """Token-bucket admission with priority lanes and per-user round robin.
+
+    requests_per_minute / tokens_per_minute: upstream quota to stay under (0 = unlimited).
+    max_concurrent: calls allowed upstream at once (0 = unlimited).
+    max_queued: calls allowed to wait; beyond that acquire() raises QueueFull.
+    call_seconds: expected duration of a call, until calls have been timed.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_concurrent=0, max_queued=500,
+                 call_seconds=60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.call_seconds = call_seconds
+        self._lanes = {lane: OrderedDict() for lane in LANES}  # lane -> user -> deque of tickets
+        self._queued = 0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def queued(self):
+        return self._queued
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def _head(self):
+        for lane in LANES:
+            users = self._lanes[lane]
+            if users:
+                return users[next(iter(users))][0]
+        return None
+
+    def _position(self, lane):
+        """Where a new call in this lane would join the queue (1 = next)."""
+        ahead = 0
+        for other in LANES:
+            ahead += sum(len(tickets) for tickets in self._lanes[other].values())
+            if other == lane:
+                break
+        return ahead + 1
+
+    def _retry_after(self, position):
+        waits = []
+        if self.max_concurrent:
+            waits.append(position * self.call_seconds / self.max_concurrent)
+        if self.requests.rate:
+            waits.append(position / self.requests.rate)
+        if not waits:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        return max(1, int(max(waits) + 0.999))
+
+    def _dispatch(self, ticket):
+        users = self._lanes[ticket.lane]
+        tickets = users[ticket.user]
+        tickets.popleft()
+        if tickets:
+            users.move_to_end(ticket.user)  # the user's next call waits for everyone else's turn
+        else:
+            del users[ticket.user]
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        self._queued -= 1
+        self._in_flight += 1
+        ticket.admitted = True
+        ticket.admitted_at = time.monotonic()
+
+    def _wait_time(self, ticket, now):
+        if self.max_concurrent and self._in_flight >= self.max_concurrent:
+            return None  # woken by release()
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+
+    def _enqueue(self, tokens, waker=None):
+        lane, user = current_caller()
+        if self._queued >= self.max_queued:
+            position = self._position(lane)
+            raise QueueFull(self._retry_after(position), position)
+        ticket = _Ticket(lane, user, tokens, waker)
+        self._lanes[lane].setdefault(user, deque()).append(ticket)
+        self._queued += 1
+        return ticket
+
+    def _try_dispatch(self, ticket):
+        """Admits the ticket if it is at the head and there is room; otherwise returns how long to wait."""
+        if self._head() is not ticket:
+            return False, None
+        wait = self._wait_time(ticket, time.monotonic())
+        if wait == 0:
+            self._dispatch(ticket)
+            self._notify()
+            return True, 0
+        return False, wait
+
+    def _abandon(self, ticket):
+        if ticket.admitted:
+            return
+        tickets = self._lanes[ticket.lane].get(ticket.user)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._lanes[ticket.lane][ticket.user]
+            self._queued -= 1
+        self._notify()
+
+    def _notify(self):
+        self._condition.notify_all()
+        head = self._head()
+        if head is not None and head.waker is not None:
+            head.waker()
+
+    @staticmethod
+    def _until(deadline, wait):
+        if deadline is None:
+            return wait
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError('Timed out waiting for model capacity')
+        return remaining if wait is None else min(wait, remaining)
+
+    def acquire(self, tokens, timeout=None):
+        """Blocks until the current caller may make a call estimated at `tokens` tokens."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            ticket = self._enqueue(tokens)
+            try:
+                while True:
+                    admitted, wait = self._try_dispatch(ticket)
+                    if admitted:
+                        return ticket
+                    self._condition.wait(self._until(deadline, wait))
+            except BaseException:
+                self._abandon(ticket)
+                raise
+
+    async def acquire_async(self, tokens, timeout=None):
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            ticket = self._enqueue(tokens, waker=lambda: loop.call_soon_threadsafe(wake.set))
+        try:
+            while True:
+                wake.clear()
+                with self._condition:
+                    admitted, wait = self._try_dispatch(ticket)
+                if admitted:
+                    return ticket
+                wait = self._until(deadline, wait)
+                try:
+                    await asyncio.wait_for(wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._condition:
+                self._abandon(ticket)
+            raise
+
+    def release(self, ticket, actual_tokens=None):
+        with self._condition:
+            self._in_flight -= 1
+            elapsed = time.monotonic() - ticket.admitted_at
+            self.call_seconds += CALL_SECONDS_SMOOTHING * (elapsed - self.call_seconds)
+            if actual_tokens is not None:
+                self.tokens.adjust(actual_tokens - ticket.tokens)
+            self._notify()
+
+    @contextmanager
+    def slot(self, tokens, timeout=None):
+        """acquire() / release() as a context manager; yields a dict to record actual usage in."""
+        ticket = self.acquire(tokens, timeout)
+        usage = {}
+        try:
+            yield usage
+        finally:
+            self.release(ticket, usage.get('tokens'))
+
+    @asynccontextmanager
+    async def slot_async(self, tokens, timeout=None):
+        ticket = await self.acquire_async(tokens, timeout)
+        usage = {}
+        try:
+            yield usage
+        finally:
+            self.release(ticket, usage.get('tokens'))
+
+
+def usage_tokens(response):
+    """Total tokens charged for a response, from its usage metadata, or None."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    total = getattr(usage, 'total_token_count', None)
+    if total:
+        return total
+    return (getattr(usage, 'prompt_token_count', 0) or 0) + (getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+class AdmittedBackend:
+    """Wraps a backend so every call (each retry and hedge included) is admitted by a Scheduler."""
+
+    def __init__(self, backend, scheduler, estimate_tokens):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.estimate_tokens = estimate_tokens
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def is_configured(self):
+        return self.backend.is_configured
+
+    def _remaining(self, started, timeout):
+        return None if timeout is None else timeout - (time.monotonic() - started)
+
+    def generate(self, user_prompt, timeout=None):
+        started = time.monotonic()
+        with self.scheduler.slot(self.estimate_tokens(user_prompt), timeout) as usage:
+            response = self.backend.generate(user_prompt, timeout=self._remaining(started, timeout))
+            usage['tokens'] = usage_tokens(response)
+        return response
+
+    def stream(self, user_prompt, timeout=None):
+        started = time.monotonic()
+        with self.scheduler.slot(self.estimate_tokens(user_prompt), timeout):
+            yield from self.backend.stream(user_prompt, timeout=self._remaining(started, timeout))
+
+    async def agenerate(self, user_prompt, timeout=None):
+        started = time.monotonic()
+        async with self.scheduler.slot_async(self.estimate_tokens(user_prompt), timeout) as usage:
+            response = await self.backend.agenerate(user_prompt, timeout=self._remaining(started, timeout))
+            usage['tokens'] = usage_tokens(response)
+        return response
+
+    async def astream(self, user_prompt, timeout=None):
+        started = time.monotonic()
+        async with self.scheduler.slot_async(self.estimate_tokens(user_prompt), timeout):
+            async for text in self.backend.astream(user_prompt, timeout=self._remaining(started, timeout)):
+                yield text
+
+
+_admitted = {}
+_admitted_lock = threading.Lock()
+
+
+def admitted(backend, scheduler, estimate_tokens):
+    """Returns the shared AdmittedBackend for a (shared) backend instance."""
+    with _admitted_lock:
+        wrapped = _admitted.get(id(backend))
+        if wrapped is None or wrapped.backend is not backend:
+            wrapped = _admitted[id(backend)] = AdmittedBackend(backend, scheduler, estimate_tokens)
+    return wrapped
@@ -1,381 +1,1190 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, abort, current_app, g, has_request_context, render_template, request, jsonify, send_from_directory, stream_with_context, url_for
+from werkzeug.security import safe_join
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import mimetypes
 import os
-import google.generativeai as genai
-
-app = Flask(__name__)
-
-# Configure a secret key for session management (optional, but good practice)
-app.config['SECRET_KEY'] = os.urandom(24)
+import tempfile
+import threading
+import time
+
+import admission
+import assets
+import batch
+import config
+import history
+import incremental
+import jobs
+import llm_backends
+import long_transcripts
+import metrics
+import modes
+import near_duplicates
+import preflight
+import prefix_cache
+import prompt
+import report_parser
+import result_cache
+import scoring
+import speakers
+import transcript_files
+import transcripts
+import upstream
+
+# The routes; create_app() registers them on a new Flask app
+bp = Blueprint('funnelbot', __name__)
+
+# The Flask app's own logger (app.logger), usable from job and window threads outside an app context
+logger = logging.getLogger('app')
+
+# Where Flask puts the instance folder of an app created from this module
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# 'gemini' for the real model, 'fake' for canned reports (load tests, offline development)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
 
 # Configure Gemini API Key
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
+if not GEMINI_API_KEY and LLM_BACKEND == 'gemini':
     print("Warning: GEMINI_API_KEY environment variable not set.")
     # Potentially raise an error or use a default/test key if appropriate
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-@app.route('/')
+elif GEMINI_API_KEY:
+    # The SDK itself is imported when the first model client is created (see warm_up)
+    llm_backends.configure_gemini(GEMINI_API_KEY, os.environ.get('GEMINI_API_ENDPOINT'))
+
+# Everything that changes the model's output for a given transcript is part of the cache key
+PROMPT_VERSION = f'{prompt.PROMPT_VERSION}#{prompt.RUBRIC_FINGERPRINT}'
+# Sampling settings shared by every analysis mode; modes.py sets the model, output cap and thinking budget
+GENERATION_CONFIG = {'temperature': 0, 'top_p': 0.1}
+
+NO_CONTENT_ERROR = 'AI service returned no content.'
+NEED_SPEAKER_ROLES = "NEED_SPEAKER_ROLES: Please specify which speaker(s) is/are the sales rep(s) and which is/are the merchant(s) so I can evaluate the call."
+SENTINEL_RESPONSES = (NEED_SPEAKER_ROLES, "DATA_NOT_REDACTED", "UNSUPPORTED_INPUT")
+
+# Answer obvious sentinel cases (card numbers, unmatched speaker labels, non-transcripts) without a model call
+PREFLIGHT_ENABLED = os.environ.get('PREFLIGHT_ENABLED', 'true').lower() == 'true'
+PREFLIGHT_PII_CHECKS = tuple(check.strip() for check in os.environ.get(
+    'PREFLIGHT_PII_CHECKS', ','.join(preflight.DEFAULT_PII_CHECKS)).split(',') if check.strip())
+PREFLIGHT_SENTINELS = {
+    preflight.DATA_NOT_REDACTED: "DATA_NOT_REDACTED",
+    preflight.NEED_SPEAKER_ROLES: NEED_SPEAKER_ROLES,
+    preflight.UNSUPPORTED_INPUT: "UNSUPPORTED_INPUT",
+}
+
+# Work out which speaker labels are reps and which merchants before the model call (see speakers.py)
+SPEAKER_INFERENCE_ENABLED = os.environ.get('SPEAKER_INFERENCE_ENABLED', 'true').lower() == 'true'
+
+# Every successful analysis is kept here for the history and leaderboard endpoints
+HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', 'true').lower() == 'true'
+analysis_history = history.HistoryStore(
+    os.environ.get('HISTORY_PATH', os.path.join(INSTANCE_PATH, 'history.sqlite3')))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Transcripts similar to an analysed one (relabelled, trimmed, re-exported) are answered with its result
+NEAR_DUPLICATE_ENABLED = os.environ.get('NEAR_DUPLICATE_ENABLED', 'true').lower() == 'true'
+similar_transcripts = near_duplicates.NearDuplicateIndex(
+    os.environ.get('NEAR_DUPLICATE_PATH', os.path.join(INSTANCE_PATH, 'near_duplicates.sqlite3')),
+    threshold=float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.85)),
+)
+
+# A transcript that extends an analysed one is analysed incrementally: only its new utterances go to the model
+INCREMENTAL_ENABLED = os.environ.get('INCREMENTAL_ENABLED', 'true').lower() == 'true'
+funnel_states = incremental.FunnelStateStore(
+    os.environ.get('FUNNEL_STATE_PATH', os.path.join(INSTANCE_PATH, 'funnel_states.sqlite3')),
+    max_entries=int(os.environ.get('FUNNEL_STATE_MAX_ENTRIES', 5000)),
+)
+
+BATCH_DEFAULT_PARALLELISM = int(os.environ.get('BATCH_DEFAULT_PARALLELISM', 4))
+BATCH_MAX_PARALLELISM = int(os.environ.get('BATCH_MAX_PARALLELISM', 8))
+
+# Largest request body POST /analyze/upload reads
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+
+# Transcripts longer than this (after normalisation) are analysed as concurrent overlapping windows
+LONG_TRANSCRIPT_CHARS = int(os.environ.get('LONG_TRANSCRIPT_CHARS', 30000))
+LONG_TRANSCRIPT_WINDOW_CHARS = int(os.environ.get('LONG_TRANSCRIPT_WINDOW_CHARS', 20000))
+LONG_TRANSCRIPT_OVERLAP = int(os.environ.get('LONG_TRANSCRIPT_OVERLAP', 6))
+LONG_TRANSCRIPT_PARALLELISM = int(os.environ.get('LONG_TRANSCRIPT_PARALLELISM', 4))
+
+# Served at /metrics; see metrics.py
+REQUEST_SECONDS = metrics.Histogram(
+    'funnelbot_request_duration_seconds', 'Time to respond, by route and status (time to headers for streams).',
+    ['route', 'status'])
+PHASE_SECONDS = metrics.Histogram(
+    'funnelbot_phase_duration_seconds', 'Time spent per analysis phase: prompt_build, model_wait, post_process, ...',
+    ['phase'])
+ANALYSES = metrics.Counter(
+    'funnelbot_analyses_total',
+    'Analyses by outcome: success, a sentinel (e.g. NEED_SPEAKER_ROLES), blocked, rate_limited, timeout, api_error.',
+    ['outcome'])
+PREFLIGHT_ANSWERS = metrics.Counter(
+    'funnelbot_preflight_answers_total', 'Sentinel answers given by the local pre-checks without a model call.', ['code'])
+MODEL_TOKENS = metrics.Counter(
+    'funnelbot_model_tokens_total', 'Tokens reported in model usage metadata: input, cached_input, output, thinking.',
+    ['kind'])
+CACHE_LOOKUPS = metrics.Counter('funnelbot_result_cache_lookups_total', 'Result cache lookups by result.', ['result'])
+NEAR_DUPLICATE_ANSWERS = metrics.Counter(
+    'funnelbot_near_duplicate_answers_total', 'Analyses answered with the earlier result of a near-duplicate transcript.')
+ANALYSES_IN_FLIGHT = metrics.TrackedGauge('funnelbot_analyses_in_flight', 'Analyses currently being served.')
+metrics.Gauge('funnelbot_result_cache_hit_ratio', 'Share of result cache lookups that were hits.',
+              lambda: CACHE_LOOKUPS.value(result='hit') / max(1, CACHE_LOOKUPS.value(result='hit') + CACHE_LOOKUPS.value(result='miss')))
+
+# Phase timings for requests served outside Flask (see asgi.py); Flask requests keep them on `g`
+phase_timings = contextvars.ContextVar('phase_timings', default=None)
+
+@contextmanager
+def timed(phase):
+    """Adds the block's duration to the current request's Server-Timing header."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=phase)
+        # Background jobs run outside a request and aren't reported in a header
+        timings = g.setdefault('phase_timings', {}) if has_request_context() else phase_timings.get()
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0) + elapsed * 1000
+
+def server_timing(timings):
+    return ', '.join(f'{phase};dur={ms:.2f}' for phase, ms in timings.items())
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def record_request_duration(response):
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route=route, status=response.status_code)
+    return response
+
+@bp.after_app_request
+def add_server_timing(response):
+    timings = g.get('phase_timings')
+    if timings:
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response
+
+@bp.after_app_request
+def compress_response(response):
+    """Gzip/brotli-encodes JSON, HTML and text responses for clients that accept it.
+
+    Streams (SSE, NDJSON) and files sent from disk are left alone; the static
+    assets are precompressed at build time instead.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not assets.is_compressible(response.mimetype)):
+        return response
+    data = response.get_data()
+    if len(data) < assets.MIN_COMPRESS_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = assets.preferred_encoding(request.headers.get('Accept-Encoding'), assets.response_codings())
+    if coding:
+        response.set_data(assets.compress(data, coding))
+        response.headers['Content-Encoding'] = coding
+    return response
+
+@bp.app_context_processor
+def asset_helpers():
+    # Built by create_app() when ASSETS_ENABLED; served under /assets with immutable caching
+    asset_manifest = current_app.config['ASSET_MANIFEST']
+
+    def asset_url(path):
+        """URL of the built (hashed) copy of a static file, or the plain static URL without a build."""
+        built = asset_manifest.get(path)
+        return url_for('funnelbot.get_asset', filename=built) if built else url_for('static', filename=path)
+
+    def has_asset(path):
+        return path in asset_manifest or os.path.isfile(os.path.join(current_app.static_folder, path))
+
+    return {'asset_url': asset_url, 'has_asset': has_asset}
+
+@bp.route('/assets/<path:filename>', methods=['GET'])
+def get_asset(filename):
+    """Serves a built asset, picking its .br or .gz variant when the client accepts one."""
+    build_dir = current_app.config['ASSET_BUILD_DIR']
+    path = safe_join(build_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    available = [coding for coding, suffix in (('br', '.br'), ('gzip', '.gz')) if os.path.isfile(path + suffix)]
+    coding = assets.preferred_encoding(request.headers.get('Accept-Encoding'), available)
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(coding, '')
+    response = send_from_directory(build_dir, filename + suffix, mimetype=mimetypes.guess_type(filename)[0])
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = assets.IMMUTABLE
+    return response
+
+@bp.route('/')
 def index():
     """Serves the main HTML page."""
     return render_template('index.html')
 
-@app.route('/analyze', methods=['POST'])
+# The rubric is sent as a reusable system prefix; 'gemini' caches it provider-side, 'local' doesn't
+rubric_prefix = prefix_cache.get_prefix_cache(
+    os.environ.get('PREFIX_CACHE', 'gemini' if GEMINI_API_KEY else 'local'))
+
+def backend_options(name):
+    """Constructor options for the configured backend, read from the environment."""
+    if name == 'fake':
+        return {'latency': float(os.environ.get('FAKE_LLM_LATENCY', 0)),
+                'reports_dir': os.environ.get('FAKE_LLM_REPORTS_DIR')}
+    return {'api_key': GEMINI_API_KEY, 'prefix': rubric_prefix,
+            'native_async': not os.environ.get('GEMINI_API_ENDPOINT')}
+
+# Deadline, retry and hedging rules for every model call (UPSTREAM_HEDGE_PERCENTILE=0 turns hedging off)
+UPSTREAM_POLICY = upstream.CallPolicy(
+    deadline_seconds=float(os.environ.get('UPSTREAM_DEADLINE_SECONDS', 300)),
+    max_attempts=int(os.environ.get('UPSTREAM_MAX_ATTEMPTS', 3)),
+    backoff_base_seconds=float(os.environ.get('UPSTREAM_BACKOFF_BASE_SECONDS', 1)),
+    backoff_max_seconds=float(os.environ.get('UPSTREAM_BACKOFF_MAX_SECONDS', 30)),
+    hedge_percentile=float(os.environ.get('UPSTREAM_HEDGE_PERCENTILE', 0)),
+    hedge_min_samples=int(os.environ.get('UPSTREAM_HEDGE_MIN_SAMPLES', 20)),
+)
+
+# Shared on-disk result cache; every worker process on the host points at the same file.
+# A fill's lease outlives the model calls it waits on: an incremental analysis may make two (see
+# run_incremental_analysis), and the windows of a long transcript are leased one by one.
+results = result_cache.ResultCache(
+    os.environ.get('RESULT_CACHE_PATH', os.path.join(INSTANCE_PATH, 'result_cache.sqlite3')),
+    max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000)),
+    ttl_seconds=int(os.environ.get('RESULT_CACHE_TTL_SECONDS', 7 * 24 * 3600)),
+    lease_seconds=2 * UPSTREAM_POLICY.longest_call_seconds,
+)
+
+# Keeps calls under the upstream quota; interactive requests go before bulk work, users take turns (0 = no limit)
+scheduler = admission.Scheduler(
+    requests_per_minute=int(os.environ.get('ADMISSION_RPM', 900)),
+    tokens_per_minute=int(os.environ.get('ADMISSION_TPM', 900000)),
+    max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', 64)),
+    max_queued=int(os.environ.get('ADMISSION_MAX_QUEUED', 500)),
+    call_seconds=float(os.environ.get('ADMISSION_CALL_SECONDS', 60)),
+)
+# Output plus thinking tokens reserved per call until the real usage is known
+ADMISSION_OUTPUT_TOKENS_EST = int(os.environ.get('ADMISSION_OUTPUT_TOKENS_EST', 8000))
+RUBRIC_TOKENS_EST = transcripts.estimate_tokens(prompt.RUBRIC)
+
+def estimate_call_tokens(user_prompt):
+    return RUBRIC_TOKENS_EST + transcripts.estimate_tokens(user_prompt) + ADMISSION_OUTPUT_TOKENS_EST
+
+def model_backend(mode):
+    """The shared backend of one analysis mode, without admission control or retries."""
+    return llm_backends.get_backend(LLM_BACKEND, mode.model, modes.generation_config(mode, GENERATION_CONFIG),
+                                    **backend_options(LLM_BACKEND))
+
+def get_backend():
+    """Returns the shared model backend for the current analysis mode (see modes.using)."""
+    backend = model_backend(modes.current())
+    # Every attempt (retries and hedges included) passes admission control
+    backend = admission.admitted(backend, scheduler, estimate_call_tokens)
+    return upstream.resilient(backend, UPSTREAM_POLICY, logger=logger)
+
+def request_user():
+    """Who a request is from, for fair queuing: the X-User-Id header, else the client address."""
+    return request.headers.get('X-User-Id') or request.remote_addr
+
+def request_team():
+    """The optional team an analysis is recorded under: `team` in the JSON body, form or query."""
+    data = request.get_json(silent=True)
+    team = data.get('team') if isinstance(data, dict) else None
+    return team or request.values.get('team')
+
+def forces_reanalysis(value):
+    """Reads a `force_reanalysis` flag sent as JSON or as a form/query string."""
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+def analysis_options(data):
+    """Reads the optional analysis settings from a request body or form.
+
+    `force_reanalysis` skips near-duplicate reuse and incremental analysis
+    (a fresh analysis of the whole transcript), `mode` is quick, standard,
+    thorough or auto and `latency_target_seconds` caps the mode auto picks.
+    Without either the mode is modes.DEFAULT; a latency target alone means
+    auto. Returns (options, None), options being keyword arguments for
+    analyse(), or (None, (payload, status)) on a validation error.
+    """
+    latency_target = data.get('latency_target_seconds')
+    requested = data.get('mode') or (modes.AUTO if latency_target not in (None, '') else modes.DEFAULT)
+    if requested != modes.AUTO and requested not in modes.MODES:
+        return None, ({'error': f"mode must be one of: {', '.join([modes.AUTO, *modes.MODES])}."}, 400)
+    if latency_target in (None, ''):
+        latency_target = None
+    else:
+        try:
+            latency_target = float(latency_target)
+        except (TypeError, ValueError):
+            latency_target = 0
+        if not latency_target > 0:
+            return None, ({'error': 'latency_target_seconds must be a positive number.'}, 400)
+    return {'reuse_similar': not forces_reanalysis(data.get('force_reanalysis')),
+            'mode': requested, 'latency_target': latency_target}, None
+
+def request_analysis_options():
+    """analysis_options() for the JSON body, or the form and query string of an upload."""
+    data = request.get_json(silent=True)
+    return analysis_options(data if isinstance(data, dict) else request.values)
+
+def queue_full_response(e):
+    response = jsonify({'error': 'The AI service is at capacity. Please try again shortly.',
+                        'queue_position': e.position, 'retry_after_seconds': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def build_payload(text, response):
+    """Turns the model's text into the /analyze JSON payload and HTTP status."""
+    # The response from Gemini should be plain text as per instructions
+    # Check for specific error strings the model might return based on instructions
+    if text in SENTINEL_RESPONSES:
+        return {'analysis_text': text, 'is_error': True}, 200
+    
+    # Check if there's content in the response
+    if not text:
+        logger.error(f"Gemini API returned an empty or malformed response: {response}")
+        # Check for prompt feedback if available
+        prompt_feedback_msg = ""
+        if hasattr(response, 'prompt_feedback') and response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
+            prompt_feedback_msg = f" (Reason: {response.prompt_feedback.block_reason_message})"
+        return {'error': f'{NO_CONTENT_ERROR}{prompt_feedback_msg}'}, 500
+
+    # Parse once here so the payload (and every cached copy of it) carries the structured report
+    with timed('post_process'):
+        report = report_parser.parse_report(text)
+        # Redo the model's score arithmetic locally rather than re-running the analysis when it is off
+        report, score_issues = scoring.rescore(report)
+        if score_issues:
+            logger.warning(f"Corrected score arithmetic in model output: {score_issues}")
+            text = scoring.correct_text(text, report)
+    return {'analysis_text': text, 'report': report, 'score_issues': score_issues}, 200
+
+def error_payload(e):
+    """Maps an exception raised while analysing to an error payload and HTTP status."""
+    logger.error(f"Error processing request: {e}")
+    if isinstance(e, admission.QueueFull):
+        return {'error': 'The AI service is at capacity. Please try again shortly.',
+                'queue_position': e.position, 'retry_after_seconds': e.retry_after}, 429
+    if isinstance(e, upstream.DeadlineExceeded):
+        return {'error': 'The AI service took too long to respond. Please try again.'}, 504
+    if upstream.is_retryable(e):
+        return {'error': 'The AI service is busy or unavailable. Please try again shortly.'}, 503
+    # Check if it's a Google API error for more specific feedback
+    if hasattr(e, 'args') and e.args and isinstance(e.args[0], str) and "API key not valid" in e.args[0]:
+        return {'error': 'Invalid Gemini API Key. Please check your configuration.'}, 500
+    return {'error': f'An error occurred processing your request: {str(e)}'}, 500
+
+def parse_analysis_request():
+    """Reads and validates the JSON body shared by the analysis endpoints.
+
+    Returns (fields, None) on success or (None, (payload, status)) on a validation error.
+    """
+    return analysis_fields(request.get_json())
+
+def analysis_fields(data):
+    """Validates a decoded analysis request body; same return value as parse_analysis_request()."""
+    transcript = data.get('transcript')
+    sales_rep_names = data.get('sales_rep_names')
+    # Default to 'Customer' if not provided; resolve_speakers() swaps in the transcript's merchant labels
+    merchant_names = data.get('merchant_names', 'Customer')
+
+    if not transcript:
+        return None, ({'error': 'No transcript provided.'}, 400)
+    if not sales_rep_names:
+        return None, ({'error': 'Sales Rep name(s) not provided.'}, 400)
+    return (transcript, sales_rep_names, merchant_names), None
+
+def cache_key(transcript, sales_rep_names, merchant_names, mode=None):
+    version = f'{PROMPT_VERSION}|{mode}' if mode else PROMPT_VERSION
+    analysis_mode = modes.current()
+    return result_cache.make_key(version, f'{LLM_BACKEND}:{analysis_mode.model}',
+                                 modes.generation_config(analysis_mode, GENERATION_CONFIG),
+                                 transcript, sales_rep_names, merchant_names)
+
+def result_key(fields, earlier=None):
+    """The cache key normalised fields are analysed (and recorded) under.
+
+    An incremental analysis depends on the earlier state it continues, so that is part of its key.
+    """
+    if earlier is not None:
+        return cache_key(*fields, mode=f"incremental|{earlier['result_key']}")
+    return cache_key(*fields, mode='windowed' if is_long(fields[0]) else None)
+
+def run_analysis(transcript, sales_rep_names, merchant_names):
+    """Calls Gemini for one transcript and returns the JSON payload and HTTP status."""
+    with timed('prompt_build'):
+        user_prompt = prompt.build_user_prompt(transcript, sales_rep_names, merchant_names)
+    return run_prompt(user_prompt)
+
+def run_prompt(user_prompt):
+    """Sends one per-call prompt to the model and returns the JSON payload and HTTP status."""
+    # Check if API key is configured before making API call 
+    backend = get_backend()
+    if not backend.is_configured:
+        logger.error("Gemini API key not configured.")
+        return {'error': 'AI service not configured. API key is missing.'}, 500
+
+    # Make the API call
+    with timed('model_wait'):
+        response = backend.generate(user_prompt)
+    record_usage(response)
+    return build_payload(response.text, response)
+
+def record_usage(response):
+    """Adds a model response's usage metadata to the token counters."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    cached = getattr(usage, 'cached_content_token_count', 0) or 0
+    counts = {
+        'input': (getattr(usage, 'prompt_token_count', 0) or 0) - cached,
+        'cached_input': cached,
+        'output': getattr(usage, 'candidates_token_count', 0) or 0,
+        'thinking': getattr(usage, 'thoughts_token_count', 0) or 0,
+    }
+    for kind, count in counts.items():
+        if count:
+            MODEL_TOKENS.inc(count, kind=kind)
+
+def outcome_of(payload, status):
+    """The funnelbot_analyses_total outcome label for an analysis payload."""
+    if status == 200:
+        return payload['analysis_text'].split(':')[0] if payload.get('is_error') else 'success'
+    if status == 429:
+        return 'rate_limited'
+    if status == 504:
+        return 'timeout'
+    if status == 400:
+        return 'invalid'
+    return 'blocked' if payload.get('error', '').startswith(NO_CONTENT_ERROR) else 'api_error'
+
+def record_outcome(payload, status, hit=None):
+    ANALYSES.inc(outcome=outcome_of(payload, status))
+    if payload.get('near_duplicate'):
+        NEAR_DUPLICATE_ANSWERS.inc()
+    if payload.get('preflight'):
+        PREFLIGHT_ANSWERS.inc(code=payload['preflight']['code'])
+    if hit is not None:
+        CACHE_LOOKUPS.inc(result='hit' if hit else 'miss')
+
+def record_error(e):
+    """Counts an analysis that raised instead of returning a payload."""
+    if isinstance(e, admission.QueueFull):
+        ANALYSES.inc(outcome='rate_limited')
+    elif isinstance(e, upstream.DeadlineExceeded):
+        ANALYSES.inc(outcome='timeout')
+    else:
+        ANALYSES.inc(outcome='api_error')
+
+def record_result(fields, payload, status, earlier=None):
+    """Adds a successful analysis of normalised fields to the history, near-duplicate index and funnel states (never raises)."""
+    if status != 200 or payload.get('is_error') or payload.get('near_duplicate') or not payload.get('analysis_text'):
+        return
+    # A continuation that fell back to a full analysis is recorded as one
+    key = result_key(fields, earlier if payload.get('incremental') else None)
+    try:
+        if HISTORY_ENABLED:
+            # A continuation replaces the analysis of the call's first part, rather than counting the call twice
+            analysis_history.record(key, PROMPT_VERSION, fields[1], fields[2], payload,
+                                    supersedes=earlier['result_key'] if payload.get('incremental') else None)
+        if NEAR_DUPLICATE_ENABLED:
+            similar_transcripts.add(key, near_duplicate_version(fields), fields[0])
+        if INCREMENTAL_ENABLED and payload.get('report'):
+            funnel_states.add(key, incremental_version(), fields[1], fields[2],
+                              transcripts.parse_utterances(fields[0]), payload['report'])
+    except Exception as e:
+        logger.error(f"Could not record analysis result: {e}")
+
+def near_duplicate_version(fields):
+    """Near-duplicates only answer for each other within one prompt version and analysis mode, for the same names.
+
+    The index leaves speaker labels out, so without the names a relabelled call
+    scored for one rep would be served to another.
+    """
+    return (f'{PROMPT_VERSION}|{modes.current().name}'
+            f'|{transcripts.normalise_names(fields[1])}|{transcripts.normalise_names(fields[2])}')
+
+def incremental_version():
+    """Funnel states are only continued within one prompt version and backend."""
+    return f'{PROMPT_VERSION}|{LLM_BACKEND}'
+
+def earlier_state(fields, utterances):
+    """The funnel state of an analysed transcript that normalised fields extend, or None (see incremental.py)."""
+    if not INCREMENTAL_ENABLED or not utterances:
+        return None
+    with timed('incremental_lookup'):
+        return funnel_states.find(incremental_version(), fields[1], fields[2], utterances)
+
+def run_incremental_analysis(fields, earlier):
+    """Analyses only the utterances after an earlier analysed transcript and merges the reports.
+
+    When the model can't place the new utterances on their own (see
+    incremental.PARTIAL_SENTINELS), the whole transcript is analysed instead.
+    """
+    utterances = transcripts.parse_utterances(fields[0])
+    logger.info(f"Transcript extends an earlier one: analysing {len(utterances) - earlier['resume_at']}"
+                f" of {len(utterances)} utterances")
+    payload, status = incremental.continue_analysis(earlier, utterances, fields, run_prompt)
+    if status == 200 and payload.get('is_error') and payload['analysis_text'].split(':')[0] in incremental.PARTIAL_SENTINELS:
+        logger.info(f"{payload['analysis_text'].split(':')[0]} for the new utterances; analysing the whole transcript")
+        return run_long_analysis(*fields) if is_long(fields[0]) else run_analysis(*fields)
+    return payload, status
+
+def earlier_result(key):
+    """The payload stored for a result key, from the result cache or else the history, or None."""
+    cached = results.get(key)
+    if cached is not None:
+        return cached[0]
+    entry = analysis_history.find(key) if HISTORY_ENABLED else None
+    if entry is None:
+        return None
+    payload, status = build_payload(entry['analysis_text'], None)
+    return payload if status == 200 else None
+
+def near_duplicate_payload(fields):
+    """Returns the earlier result for a near-duplicate of an analysed transcript, or None.
+
+    The payload carries `near_duplicate` ({similarity, analysed_at, threshold}) so
+    the client can say so and offer a fresh analysis (force_reanalysis).
+    """
+    if not NEAR_DUPLICATE_ENABLED:
+        return None
+    with timed('near_duplicate'):
+        match = similar_transcripts.find(fields[0], near_duplicate_version(fields))
+        if match is None or match['result_key'] == result_key(fields):
+            return None  # exact repeats are answered by the result cache
+        payload = earlier_result(match['result_key'])
+    if payload is None:
+        similar_transcripts.remove(match['result_key'])
+        return None
+    logger.info(f"Near-duplicate transcript ({match['similarity']:.0%} similar); returning the earlier result")
+    return dict(payload, near_duplicate={'similarity': match['similarity'], 'analysed_at': match['created_at'],
+                                         'threshold': similar_transcripts.threshold})
+
+def normalise_fields(fields, parsed=None):
+    """Swaps the raw transcript for its compact canonical form; returns (fields, utterances, stats).
+
+    `parsed` is the transcript's utterances when they are already known (see /analyze/upload).
+    """
+    transcript, sales_rep_names, merchant_names = fields
+    with timed('normalise'):
+        compact_transcript, utterances, stats = transcripts.normalise(transcript, parsed)
+    logger.info(f"Transcript normalised: ~{stats['saved_tokens_est']} input tokens saved ({stats['saved_pct']}%)")
+    return (compact_transcript, sales_rep_names, merchant_names), utterances, stats
+
+def resolve_speakers(fields, utterances):
+    """Infers the speaker roles of normalised fields; returns (fields, utterances, roles).
+
+    When the roles are clear, rep labels that only loosely match a rep name are
+    renamed to it and the merchant labels become the merchant names, so the
+    prompt names the transcript's speakers exactly. `roles` (see
+    speakers.infer_roles) is None when inference is off or nobody is labelled.
+    """
+    if not SPEAKER_INFERENCE_ENABLED or not utterances:
+        return fields, utterances, None
+    transcript, sales_rep_names, merchant_names = fields
+    with timed('speaker_roles'):
+        roles = speakers.infer_roles(utterances, sales_rep_names, merchant_names)
+        if roles['resolved']:
+            relabelled = speakers.relabel(utterances, roles, sales_rep_names)
+            if relabelled is not utterances:
+                utterances, transcript = relabelled, transcripts.compact(relabelled)
+            merchant_names = ', '.join(roles['merchants'])
+    return (transcript, sales_rep_names, merchant_names), utterances, roles
+
+def preflight_payload(raw_transcript, utterances, sales_rep_names, roles=None):
+    """Returns the sentinel payload when local checks can answer the request, else None.
+
+    Unsettled speaker `roles` come back as `speaker_roles`, the proposed mapping for the user to confirm.
+    """
+    if not PREFLIGHT_ENABLED:
+        return None
+    with timed('preflight'):
+        outcome = preflight.check(raw_transcript, utterances, sales_rep_names, PREFLIGHT_PII_CHECKS, roles)
+    if outcome is None:
+        return None
+    code, reason = outcome
+    logger.info(f"Preflight answered {code} without a model call: {reason}")
+    payload = {'analysis_text': PREFLIGHT_SENTINELS[code], 'is_error': True, 'preflight': {'code': code, 'reason': reason}}
+    if code == preflight.NEED_SPEAKER_ROLES and roles is not None:
+        payload['speaker_roles'] = roles
+    return payload
+
+def analyse_window(fields):
+    """Analyses one window of a long transcript; windows are cached like whole transcripts."""
+    (payload, status), _ = results.get_or_compute(
+        cache_key(*fields),
+        lambda: run_analysis(*fields),
+        cacheable=lambda result: result[1] == 200,
+    )
+    return payload, status
+
+def run_long_analysis(transcript, sales_rep_names, merchant_names):
+    """Analyses a long transcript as concurrent overlapping windows and merges the reports."""
+    utterances = transcripts.parse_utterances(transcript)
+    windows = long_transcripts.split_windows(utterances, sales_rep_names,
+                                             LONG_TRANSCRIPT_WINDOW_CHARS, LONG_TRANSCRIPT_OVERLAP)
+    if len(windows) < 2:
+        return run_analysis(transcript, sales_rep_names, merchant_names)
+    logger.info(f"Long transcript: analysing {len(windows)} windows concurrently")
+    with timed('model_wait'):
+        return long_transcripts.analyse_windows(windows, (transcript, sales_rep_names, merchant_names),
+                                                analyse_window, LONG_TRANSCRIPT_PARALLELISM)
+
+def is_long(transcript):
+    return len(transcript) > LONG_TRANSCRIPT_CHARS
+
+def choose_mode(fields, utterances, requested=modes.DEFAULT, latency_target=None, earlier=None):
+    """Routes normalised fields to an analysis mode (see modes.route).
+
+    An incremental analysis (`earlier`, see earlier_state) is routed by the size of its new utterances.
+    """
+    if earlier is None:
+        tokens = transcripts.estimate_tokens(fields[0])
+    else:
+        utterances = utterances[earlier['resume_at']:]
+        tokens = transcripts.estimate_tokens(transcripts.compact(utterances))
+    mode, reason = modes.route(tokens, len(utterances), latency_target, requested)
+    logger.info(f"Analysis mode {mode.name} ({reason})")
+    return mode
+
+def analyse_normalised(fields, earlier=None):
+    """Like analyse(), for fields whose transcript is already in canonical form.
+
+    With `earlier` (see earlier_state) only the utterances after it are analysed.
+    """
+    if earlier is not None:
+        compute = lambda: run_incremental_analysis(fields, earlier)
+    elif is_long(fields[0]):
+        compute = lambda: run_long_analysis(*fields)
+    else:
+        compute = lambda: run_analysis(*fields)
+    # Identical requests (including ones still in flight) share a single model call
+    return results.get_or_compute(result_key(fields, earlier), compute, cacheable=lambda result: result[1] == 200)
+
+class AnalysisPlan:
+    """What an analysis request comes to before its model call; built by plan_analysis().
+
+    analyse(), event_stream_response() and their coroutine versions in asgi.py
+    share the plan and the steps after the call (finish_analysis and the
+    *_events helpers); only the model call itself differs between them.
+    """
+
+    def __init__(self, fields, stats, roles, blocked=None, earlier=None, mode=None):
+        self.fields = fields  # normalised
+        self.stats = stats
+        self.roles = roles
+        self.blocked = blocked  # the preflight sentinel payload
+        self.earlier = earlier  # see earlier_state
+        self.mode = mode
+        self.key = None
+        self.cached = None  # (payload, status), only looked up when asked to
+        self.similar = None  # a near-duplicate's payload
+
+    @property
+    def merged(self):
+        """Windowed and incremental analyses are merged at the end, so they have nothing to stream."""
+        return is_long(self.fields[0]) or self.earlier is not None
+
+    @property
+    def cache_status(self):
+        return 'NEAR' if self.similar is not None else ('HIT' if self.cached is not None else 'MISS')
+
+    def shape(self, payload):
+        """A successful payload with the request's transcript stats, analysis mode and speaker roles."""
+        return dict(payload, transcript_stats=self.stats, analysis_mode=self.mode.name, speaker_roles=self.roles)
+
+def plan_analysis(fields, reuse_similar=True, mode=modes.DEFAULT, latency_target=None, parsed=None, check_cache=False):
+    """Everything before the model call: normalisation, speaker roles, preflight, mode routing and lookups.
+
+    With reuse_similar the earlier state and near-duplicate lookups run (see
+    analyse); with check_cache the result cache is read too, for callers that
+    don't go through results.get_or_compute.
+    """
+    raw_transcript = fields[0]
+    fields, utterances, stats = normalise_fields(fields, parsed)
+    fields, utterances, roles = resolve_speakers(fields, utterances)
+    plan = AnalysisPlan(fields, stats, roles, blocked=preflight_payload(raw_transcript, utterances, fields[1], roles))
+    if not plan.blocked and reuse_similar:
+        plan.earlier = earlier_state(fields, utterances)
+    plan.mode = choose_mode(fields, utterances, mode, latency_target, plan.earlier)
+    if plan.blocked:
+        return plan
+    with modes.using(plan.mode):
+        plan.key = result_key(fields, plan.earlier)
+        plan.cached = results.get(plan.key) if check_cache else None
+        if reuse_similar and plan.earlier is None and plan.cached is None:
+            plan.similar = near_duplicate_payload(fields)
+    return plan
+
+def answered_payload(plan):
+    """((payload, status), hit) when a plan is answered without a model call (preflight, near-duplicate), else None."""
+    if plan.blocked:
+        record_outcome(plan.blocked, 200)
+        return (plan.blocked, 200), False
+    if plan.similar is not None:
+        record_outcome(plan.similar, 200)
+        return (plan.shape(plan.similar), 200), True
+    return None
+
+def finish_analysis(plan, payload, status, hit):
+    """Records the outcome of a plan's model call; returns the payload to send."""
+    record_outcome(payload, status, hit)
+    with modes.using(plan.mode):
+        record_result(plan.fields, payload, status, plan.earlier)
+    return plan.shape(payload) if status == 200 else payload
+
+def analyse(fields, reuse_similar=True, mode=modes.DEFAULT, latency_target=None, parsed=None):
+    """Runs an analysis through the result cache and returns ((payload, status), hit).
+
+    With reuse_similar, a transcript extending an analysed one is analysed
+    incrementally (flagged with `incremental`), and a near-duplicate of an
+    earlier transcript gets that transcript's result (flagged with
+    `near_duplicate`) instead of a model call. `mode` and `latency_target` choose the analysis mode (see choose_mode);
+    `parsed` is passed on to normalise_fields().
+    """
+    with ANALYSES_IN_FLIGHT.track():
+        try:
+            plan = plan_analysis(fields, reuse_similar, mode, latency_target, parsed)
+            answered = answered_payload(plan)
+            if answered:
+                return answered
+            with modes.using(plan.mode):
+                (payload, status), hit = analyse_normalised(plan.fields, plan.earlier)
+        except Exception as e:
+            record_error(e)
+            raise
+    return (finish_analysis(plan, payload, status, hit), status), hit
+
+def run_job(fields, **options):
+    """Job-queue entry point: like analyse() but never raises."""
+    try:
+        return analyse(fields, **options)[0]
+    except Exception as e:
+        return error_payload(e)
+
+# Background analyses; jobs.sqlite3 is shared so any worker can answer GET /jobs/<id>.
+# A job unchanged for longer than its model calls can take (plus a margin) was lost with its process.
+analysis_jobs = jobs.JobQueue(
+    os.environ.get('JOB_STORE_PATH', os.path.join(INSTANCE_PATH, 'jobs.sqlite3')),
+    run_job,
+    max_workers=int(os.environ.get('JOB_WORKERS', 4)),
+    max_queued=int(os.environ.get('JOB_MAX_QUEUED', 200)),
+    ttl_seconds=int(os.environ.get('JOB_TTL_SECONDS', 24 * 3600)),
+    stale_seconds=float(os.environ.get('JOB_STALE_SECONDS', results.lease_seconds + 300)),
+)
+
+metrics.Gauge('funnelbot_model_calls_in_flight', 'Model calls admitted and not yet finished.', lambda: scheduler.in_flight)
+metrics.Gauge('funnelbot_model_calls_queued', 'Model calls waiting for admission.', lambda: scheduler.queued)
+metrics.Gauge('funnelbot_jobs_pending', 'Background jobs queued or running in this process.', lambda: analysis_jobs.pending)
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text-format metrics for this worker process."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def cache_status(payload, hit):
+    """X-Cache value: NEAR for a near-duplicate's earlier result, else HIT or MISS."""
+    return 'NEAR' if payload.get('near_duplicate') else ('HIT' if hit else 'MISS')
+
+@bp.route('/analyze', methods=['POST'])
 def analyze_transcript():
     """Receives transcript data and speaker roles, calls Gemini API."""
     if request.method == 'POST':
         try:
-            data = request.get_json()
-            transcript = data.get('transcript')
-            sales_rep_names = data.get('sales_rep_names')
-            merchant_names = data.get('merchant_names', 'Customer')  # Default to 'Customer' if not provided
-
-            if not transcript:
-                return jsonify({'error': 'No transcript provided.'}), 400
-            if not sales_rep_names:
-                return jsonify({'error': 'Sales Rep name(s) not provided.'}), 400
-
-            # Construct the prompt for Gemini
-            # Using f-string with triple quotes for multi-line string
-            prompt = f"""# Funnel‑Coach‑Gem v1‑2025‑05‑21 (Rev 7)‑explore‑100pt (Explore‑stage calls)
-
-## ROLE
-
-You are a revenue‑enablement coach. As a revenue‑enablement coach, your evaluation of these Explore‑stage calls is critical because this stage is designed to build trust, thoroughly understand the merchant's business, establish their needs and wants, identify barriers, and ultimately gain the merchant's acceptance of requirements. Evaluate **Explore‑stage** sales‑call transcripts for:
-
-* Effective use of the **funneling technique**
-* How thoroughly the seller uncovers **pains**, **motivations**, and secures **commitments**
-
----
-
-## 1 Pre‑check: Speaker roles
-
-**Inspect the speaker labels first.** Based on the user's input: Sales Rep(s): {sales_rep_names}. Merchant(s): {merchant_names}.
-
-If it is **not explicitly clear** from the transcript who the sales‑rep(s) is/are and who the merchant(s) is/are, even with this information:
-
-1. **Do NOT score the call.**
-2. Respond **exactly** with:
-
-```
-NEED_SPEAKER_ROLES: Please specify which speaker(s) is/are the sales rep(s) and which is/are the merchant(s) so I can evaluate the call.
-```
-
-3. Wait for clarification, then continue.
-
-Only proceed once roles are unambiguous.
-
----
-
-## 2 Funneling technique definition
-
-The funnel technique progresses from broad to specific: starting with Thinking questions (Triggers), moving to multiple Explore questions to gather details, then to Narrow/Confirm questions to verify understanding, and often concluding with a Sweeper question.
-
-| Stage                | Purpose & Typical Use                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                           | Typical form                                                                                       |
-| -------------------- | ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------- | -------------------------------------------------------------------------------------------------- |
-| **Thinking**         | Wide and unbiased questions that will result in long answers. Normally used to start a new funnel or to provoke thinking during an existing funnel.                                                                                                                                                                                                                                                                                                                                                                             | Open "How/Why" question (e.g., "How do payments affect your company goals?")                       |
-|                      | **Non-Examples / Common Pitfalls for Thinking Questions:**  - A question that primarily seeks factual recall (e.g., "What system do you use?") is typically Explore, not Thinking.  - A question that is very narrow or seeks a yes/no answer is likely Narrow/Confirm.                                                                                                                                                                                                                                                         |                                                                                                    |
-| **Explore (broad)**  | In response to a trigger, in‑order to learn more about a topic. Normally used to drill deeper during an existing funnel, or to start a new funnel in response to a trigger.                                                                                                                                                                                                                                                                                                                                                     | Who, what, when, where, why, which, how (e.g., "When did this start happening?")                   |
-|                      | **Non-Examples / Common Pitfalls for Explore Questions:**  - A simple statement like 'That's interesting' or 'Tell me more' (without a question mark or interrogative structure) is not an Explore question. It must be phrased as a question.  - A question that is primarily seeking a yes/no answer to validate information (e.g., 'So, you're saying X is the main issue?') is a Narrow/Confirm question.                                                                                                                   |                                                                                                    |
-| **Narrow / Confirm** | Narrow questions to confirm something. Normally used at the end of funnels, or if there is no need for a funnel, in response to something said by the customer.                                                                                                                                                                                                                                                                                                                                                                 | If / do / is / are style (e.g., "If you fix this problem, will it help you to achieve your goal?") |
-|                      | **Non-Examples / Common Pitfalls for Narrow/Confirm Questions:**  - An open‑ended question like 'What are your thoughts on that solution?' is likely Thinking or Explore, not Narrow/Confirm. Narrow/Confirm questions are typically closed‑ended and seek specific validation of information already discussed.  - Simply repeating a merchant's statement as a statement (e.g., "So, APMs are costing you sales.") is not a Narrow/Confirm question unless phrased interrogatively (e.g., "So, are APMs costing you sales?"). |                                                                                                    |
-| **Sweeper**          | Surface anything missed or summarise problem/next steps.                                                                                                                                                                                                                                                                                                                                                                                                                                                                        | "Is there anything else we should cover?" / summary statement                                      |
-|                      | **Non-Examples / Common Pitfalls for Sweeper Questions:**  - A question that introduces a completely new topic is likely a Thinking question, not a Sweeper.  - A generic closing like "Thanks for your time" is not a Sweeper question/statement for scoring purposes unless it also explicitly asks if anything was missed or summarises.                                                                                                                                                                                     |                                                                                                    |
-
-**Classification rules:**
-
-1. *Each seller utterance can belong to **one and only one** question category (Thinking, Explore, Narrow/Confirm, or Sweeper). Never double‑classify the same question.*
-2. *If an utterance contains **two or more distinct questions**, classify the **first interrogative clause** only; ignore the rest for scoring.*
-
-A **successful (complete) funnel** = **Thinking ➜ Explore ➜ ≥ 1 Narrow/Confirm** question asked by the **sales rep**.
-
----
-
-## 3 Input assumptions
-
-* Transcript is plain text.
-* Each line begins with a speaker name followed by a colon (e.g., `Alice:`).
-* Timestamps like `[00:03:21]` are optional.
-* **No un‑redacted card data or personal identifiers.** If detected, respond exactly with `DATA_NOT_REDACTED`.
-
----
-
-## 4 Scoring rubric (0 – 100 pts) — Strictly deterministic. Points are awarded only when criteria are demonstrably and fully met as per the definitions. Failure to meet a criterion results in zero points for that specific item, ensuring that poor performance is accurately reflected in a lower score.
-
-| Category                 | Criteria                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                   | Points                                      |
-| ------------------------ | ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------ | ------------------------------------------- |
-| **Question type & flow** | **(Total 30 pts)** (See Point Calculation in Section 4.2 for detailed scoring logic)                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                       | **(Total 30 pts)**                          |
-|                          | ≥ 1 **Thinking** question asked by rep anywhere in the call                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                | **+5**                                      |
-|                          | ≥ 1 **Explore** (broad) question asked by rep anywhere in the call                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                         | **+5**                                      |
-|                          | ≥ 1 **Narrow / Confirm** question asked by rep anywhere in the call                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                        | **+5**                                      |
-|                          | ≥ 1 **Sweeper** question or summarising statement asked by rep anywhere in the call                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                        | **+5**                                      |
-|                          | Funnel order compliance: **All** funnels initiated by a Thinking question from the rep must strictly follow the Thinking ➜ Explore ➜ Narrow/Confirm order. (Order: Next rep question in funnel is Explore, then ≥1 Narrow/Confirm in that funnel). If any funnel breaks this order, 0 pts.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                 | **+10**                                     |
-| **Funnel execution**     | **(Total 20 pts)** (See Point Calculation in Section 4.2 for detailed scoring logic)                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                       | **(Total 20 pts)**                          |
-|                          | Each complete funnel (defined as a rep‑initiated Thinking question ➜ followed by ≥1 rep Explore question ➜ followed by ≥1 rep Narrow/Confirm question, all within the same identified funnel) scores +10 points. This applies to funnels anywhere in the call.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                             | **+10 ea** (max 2 funnels, so 20 pts total) |
-| **Pain discovery**       | **(Total 15 pts)** The goal here is to differentiate between merely identifying a problem and truly understanding its business implications.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                               | **(Total 15 pts)**                          |
-|                          | **Tier 1: Problem Acknowledged & Confirmed by Rep**  Criteria to Meet Tier 1 for +10 pts:  (a) Prospect Articulates a Problem: The prospect explicitly states a specific problem, challenge, point of friction, or dissatisfaction they are currently experiencing (e.g., "Our current software is too slow," "We're missing deadlines," "It's hard to get accurate data").  (b) Rep Confirms Understanding: Within the Rep's next **3 sales‑rep turns** (merchant turns do not count) within the same funnel, the Rep acknowledges the stated problem, often by rephrasing or summarising it (e.g., "So, the speed of your current software is a concern," "Okay, so missed deadlines are an issue you're facing"). Simple acknowledgements like 'I see,' 'Okay,' 'Got it,' 'Makes sense' do NOT count as a qualifying restatement or clarification for these points.  (c) Relevance: The identified problem is in an area where your product/service could potentially offer a solution. | **+10**                                     |
-|                          | **Tier 2: Impact Explored - First Instance of Probing & Articulation**  Criteria to Meet for +2.5 pts (must meet all Tier 1 criteria for this pain first):  (a) Probing for Consequences: The rep asks questions to uncover the effects or results of the Tier 1 problem (e.g., "What happens as a result of that manual data entry?", "How does that increased churn affect your overall business goals?", "Can you give me an example of how that data inaccuracy has impacted a decision?").  (b) AND Prospect Articulates Impact: The prospect describes specific negative outcomes. These could be: Operational (Wasted time, inefficiencies), Financial (Increased costs, lost revenue), Strategic (Inability to meet goals, competitive disadvantage), Team/Personal (Frustration, low morale).  (c) AND Clear Link Between Problem and Impact: The conversation clearly connects the initially stated problem to these broader business consequences.                              | **+2.5**                                    |
-|                          | **Tier 2: Impact Explored - Second Instance OR Quantification/Qualification**  Criteria to Meet for +2.5 pts (must meet all Tier 1 criteria for the respective pain(s) first): EITHER:  (a) The Rep successfully explores impact (Rep probes & Prospect articulates specific negative outcomes with a clear link, as defined above) for a second, different Tier 1 pain.  (b) OR For a previously explored impact (where criteria (a) and (b) of the first Tier 2 instance were met), the Rep guides the prospect to provide some measure of the impact (Quantification/Qualification) or establish its scale/urgency (e.g., Prospect: "...Last month, this actually led to us overstocking a product line, costing us about £10,000," or "It costs us about 10 hours per employee per week," or "This is a top priority for our VP to solve this quarter").  (Cumulative max +5 for Tier 2 impact exploration across all pains).                                                          | **+2.5** (cumulative max +5 for depth)      |
-| **Motivation probing**   | **(Total 10 pts)** A "good score" here means the rep has gone beyond the "what's wrong" (pain) to understand the "why act" and "what's the desired future state."                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                          | **(Total 10 pts)**                          |
-|                          | **Core Business Objectives & Desired Future State Identified**  Criteria for +4 pts: The Rep successfully:  (a) Identifies Core Business Objectives/Goals: Uncovers specific, strategic business goals or objectives that the prospect's organization is trying to achieve (e.g., "increase market share," "reduce operational costs by X%," "improve customer retention by Y points").  (b) AND Understands Desired Outcomes/Future State: Helps the prospect paint a picture of the positive future state once the pains are resolved and motivations are addressed.                                                                                                                                                                                                                                                                                                                                                                                                                     | **+4**                                      |
-|                          | **Link Between Pain Resolution & Objectives OR Urgency Explored**  Criteria for +3 pts: For an identified objective/future state, the Rep successfully EITHER:  (a) Links Pain Resolution to Achieving Objectives: The conversation clearly connects solving the identified pain(s) directly to the attainment of these broader business objectives or the realisation of a desired future state.  (b) OR Uncovers Compelling Reasons to Act (Urgency/Priority): Explores why this is important now.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                       | **+3**                                      |
-|                          | **Comprehensive Understanding Confirmed OR Personal Wins Explored (Tactfully)**  Criteria for +3 pts: The Rep EITHER:  (a) Confirmation and Validation: Summarises their understanding of the motivations and desired outcomes, and the prospect confirms this understanding.  (b) OR (Bonus/If appropriate and (a) is covered) Identifies Personal Wins: If confirmation is robust, tactfully uncovers what achieving these outcomes means for the key individual(s) personally (e.g., recognition, reduced stress, ability to focus on more strategic work, career advancement).                                                                                                                                                                                                                                                                                                                                                                                                         | **+3** (cumulative max +6 for depth)        |
-| **Commitment**           |                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                            | **(Total 15 pts)**                          |
-|                          | Specific commitment requested                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                              | **+7**                                      |
-|                          | Commitment explicitly agreed by Merchant (unconditional). **Conditional or tentative language** ('if', 'might', 'need to check', 'subject to') **does NOT qualify** for these points.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                      | **+8**                                      |
-| **Call wrap‑up**         | Component Scoring (Total 10 pts):                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                          | **(Total 10 pts)**                          |
-|                          | Rep explicitly states at least one specific, actionable next step for the Sales Rep.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                       | **+3**                                      |
-|                          | Rep explicitly states at least one specific, actionable next step for the Merchant (if appropriate for the situation).                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                     | **+3**                                      |
-|                          | Rep provides a specific, concrete timeframe (e.g., 'by end of day Tuesday,' 'within 24 hours,' 'next week on Thursday') for at least one of the key next actions discussed.                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                | **+4**                                      |
-
-Total Score: Sum of all earned points. Max possible score = 100.
-
-> **Transparency Tip** – Note the exact point contribution of each criterion in the *Category breakdown* so reps see where they won or lost points. For example, for Call wrap‑up, show points earned for each component if not all are met (e.g., 6/10 if timeframe is missing).
-
-**Interpretation bands**
-
-* **95‑100** = Exceptional
-* **80‑94** = Strong
-* **65‑79** = Solid
-* **50‑64** = Needs Improvement
-* **0‑49** = Major Coaching Required
-
-## 4.1  Few-Shot Examples for Question Classification (Apply these strictly)
-
-These examples illustrate how to classify questions based on context.
-
-**Example 1: Meeting Introduction Silence**
-
-Scenario: You are in the Introduction of the meeting and there is a two-second silence.
-Recommended Rep Question: "What would you like to achieve during our meeting today?"
-Classification: Thinking.
-Rationale for LLM: This question is broad, open-ended, and designed to provoke reflection on goals for the meeting, fitting the definition of a Thinking question. It's suitable for starting a discussion or a new funnel.
-
-**Example 2: Merchant States a "Big Fraud Problem"**
-
-Merchant Statement: "We have a big fraud problem."
-Rep Question Option A: "How do you define big?"
-Classification A: Explore.
-Rationale A for LLM: This question directly seeks to understand the specifics and scope of the stated "trigger" (the fraud problem). It drills deeper into the merchant's statement.
-
-Rep Question Option B: "How is this affecting your resource capacity?"
-Classification B: Thinking.
-Rationale B for LLM: This question aims to broaden the understanding of the problem's impact and provokes wider reflection beyond just the definition of "big." It could initiate a new line of inquiry or funnel.
-
-Guidance for LLM: When a merchant statement could lead to multiple valid question types, analyze the Rep's chosen question. If it directly seeks more detail about the specifics of the trigger, classify as Explore. If it seeks to understand broader implications, consequences, or provokes wider reflection, classify as Thinking.
-
-**Example 3: Merchant States Potential Revenue Gain**
-
-Merchant Statement: "If you can make us an extra $1m sales revenue per year through higher Acceptance Rates, this is great!"
-Rep Question Option A: "How would you re-invest this money?"
-Classification A: Thinking.
-Rationale A for LLM: This is a broad, open-ended question designed to make the merchant reflect on the wider implications and value of the stated benefit.
-
-Rep Question Option B: "If we can evidence this increase with a similar merchant, would you give us a share of wallet?"
-Classification B: Narrow/Confirm. (Also relates to Commitment).
-Rationale B for LLM: This is a narrow, yes/no style question aimed at confirming a specific condition and potentially securing a soft commitment.
-
-**Example 4: Merchant States Team Size**
-
-Merchant Statement: "We have a payments team of 5 people here."
-Rep Question: "What does the team focus most of their time on?"
-Classification: Explore.
-Rationale for LLM: This question seeks to learn more about the topic (the payments team) introduced by the merchant, fitting the Explore definition.
-
-**Example 5: Merchant Summarises a Pain at Funnel End**
-
-Merchant Statement: "So ultimately our lack of APMs is costing us sales."
-Rep Question: "So if we can help you to offer a greater range of APMs, we will be helping you to enhance sales revenue?"
-Classification: Narrow/Confirm.
-Rationale for LLM: The rep is rephrasing the merchant's summary of the pain into a question to validate understanding, fitting the Narrow/Confirm definition.
-
----
-
-## 4.2 Structured analysis procedure (MUST follow in order)
-
-1. **Role check** – Confirm sales‑rep vs merchant roles were provided; if unclear, trigger `NEED_SPEAKER_ROLES` and halt.
-2. **Utterance list** – Iterate through the transcript top‑to‑bottom, extracting only **sales‑rep** utterances (ignore merchant lines except for identifying merchant‑stated pains, motivations, or commitment agreements). Number rep utterances sequentially (R1, R2, R3...).
-3. **Question tagging** – For each rep utterance:
-
-   * Classify it as **Thinking**, **Explore**, **Narrow/Confirm**, **Sweeper**, or **Other** (e.g., statement, transition, rapport‑building) strictly applying the definitions in Section 2 and logic from Few‑Shot Examples. Apply the one‑question‑one‑category rule and the first‑question‑only rule for multi‑question utterances.
-4. **Funnel grouping** – Create a new funnel (F1, F2, …) every time you identify a **Thinking** question from the rep. Assign all subsequent rep Explore → Narrow/Confirm → Sweeper questions to that funnel **until** the next Thinking question or end of transcript.
-5. **Insights capture (per funnel)** – Consistently focus on these three pillars for each funnel:
-
-   * **Pains** – What is the Merchant's PAIN? (See Tier 1 definition for qualifying articulation).
-   * **Motivations** – What is driving the merchant? (See Motivation criteria).
-   * **Commitment** – What COMMITMENTS were sought and obtained? Note if merely requested or explicitly accepted.
-6. **Missed Opportunity Identification (for feedback, not scoring)** – Identify and list any instances where the merchant expresses a pain or motivation and the rep asks **no follow‑up question within their next 3 sales‑rep turns** *unless* one of those turns is answering a direct merchant question unrelated to the pain/motivation. These go in "Missed Opportunities".
-7. **Point calculation** –
-
-   * Add points exactly as defined in the Scoring rubric.
-   * **Question type & flow (Total 30 pts)**:
-
-     * Presence of question types (up to +20 pts) awarded as before.
-     * Funnel order compliance (+10 pts):
-
-       1. Evaluate **every** funnel Fi.
-       2. If Fi has Thinking ➜ Explore ➜ ≥1 Narrow/Confirm in that order, Fi passes; else whole criterion fails.
-       3. Award +10 only if **all** funnels pass. Any single failure yields 0 for this criterion.
-   * **Funnel execution (Total up to 20 pts)**: unchanged except now all funnels considered.
-   * Other categories – unchanged.
-   * **Rounding**: Only Motivation‑probing and Pain‑discovery depth can introduce 0.5 values. Round the **final total** half‑up to the nearest integer after capping at 100.
-8. **Band assignment** – Map the final numeric score to its interpretation band.
-9. **Output assembly** – Populate funnel summaries, aggregate lists, score header, category breakdown, and coaching tips exactly as per the template.
-10. **Consistency check** – Verify totals and uniqueness of question classification.
-
----
-
-## 5 Output format (plain text – no JSON)
-
-*Number each funnel chronologically as **F1, F2, …** based on its Thinking question. Tag every question, pain, motivation, commitment, and missed opportunity with its funnel identifier where applicable.*
-
-```
-Final Score: 88/100  (Strong)
-
-Category breakdown:
-• Question type & flow  –  25/30
-• Funnel execution      –  20/20
-• Pain discovery        –  12.5/15
-• Motivation probing    –  7/10
-• Commitment            –  15/15
-• Call wrap‑up          –  7/10  (e.g., Rep step + Merchant step, but no timeframe)
-
-Funnel summaries:
-### F1 (Points earned for execution: +10)
-- Thinking: "How has your current process for X been impacting your team's efficiency?"
-- Explore: "What are the main challenges you've faced with that?"
-- Narrow / Confirm: "So, if you had a system that automated X, that would save you roughly 10 hours a week, is that right?"
-- Narrow / Confirm (Pain Tier 2 Impact): "And is that 10-hour saving something that would significantly impact other project timelines?"
-- Pains: "We're losing a lot of time on manual data entry for X." (Merchant - Tier 1 Pain)
-- Pains: "This means our reports are always late, impacting decisions." (Merchant - Tier 2 Impact)
-- Motivations: "We need to free up our team to focus on more strategic tasks." (Merchant - Core Motivation/Desired Outcome)
-- Commitment: "Yes, sending over the proposal by EOD sounds good." (Merchant agreement to Rep request)
-
-### F2 (Points earned for execution: +10)
-- Thinking: "Why is addressing Y a priority for you now?"
-- Explore: "Who else is involved in feeling the impact of Y?"
-- Narrow / Confirm: "Is the main goal here to reduce costs associated with Y by Q3?" (Links Pain to Objective/Urgency)
-- Additional Question (Motivation Link/Urgency): "When you mention hitting growth targets, how directly does solving Y contribute to that specific goal?"
-- Pains: "The current solution for Y is too expensive and inflexible." (Merchant - Tier 1 Pain)
-- Motivations: "We have a new budget cycle starting and need to show cost savings. Hitting growth targets is paramount." (Merchant - Core Objective & Urgency)
-- Commitment: "A follow-up meeting next Tuesday with Sarah would be great." (Merchant agreement)
-
-Aggregate lists (tagged):
-
-Thinking questions:
-• (F1) "How has your current process for X been impacting your team's efficiency?"
-• (F2) "Why is addressing Y a priority for you now?"
-
-Explore questions:
-• (F1) "What are the main challenges you've faced with that?"
-• (F2) "Who else is involved in feeling the impact of Y?"
-
-Narrow / Confirm questions:
-• (F1) "So, if you had a system that automated X, that would save you roughly 10 hours a week, is that right?"
-• (F1) "And is that 10-hour saving something that would significantly impact other project timelines?"
-• (F2) "Is the main goal here to reduce costs associated with Y by Q3?"
-
-Sweeper questions / statements:
-• (General) "Before we wrap up, was there anything else you hoped to cover today?"
-
-Pain points identified:
-• (F1) Tier 1: "We're losing a lot of time on manual data entry for X."
-• (F1) Tier 2 Impact: "This means our reports are always late, impacting decisions."
-• (F2) Tier 1: "The current solution for Y is too expensive and inflexible."
-
-Motivations uncovered:
-• (F1) Core Motivation/Desired Outcome: "We need to free up our team to focus on more strategic tasks."
-• (F2) Core Objective & Urgency: "We have a new budget cycle starting and need to show cost savings. Hitting growth targets is paramount."
-
-Commitments obtained:
-• (F1) Rep requested proposal review, Merchant agreed: "Yes, sending over the proposal by EOD sounds good."
-• (F2) Rep requested follow-up meeting, Merchant agreed: "A follow-up meeting next Tuesday with Sarah would be great."
-
-Missed Opportunities (for feedback only):
-• (F1) Merchant mentioned "integrating with our CRM is a nightmare" (Potential Tier 1 Pain) but Rep did not ask a follow-up question in the next 2 turns to confirm or explore impact.
-
-Coaching tips:
-Great job on executing two complete funnels (F1, F2) and securing clear commitments! For instance, in F1, when the merchant stated the pain "We're losing a lot of time on manual data entry for X," you effectively confirmed it and then explored the impact by asking about the 10-hour saving's effect on timelines, earning Tier 1 and Tier 2 points. One area for improvement: in F1, when the merchant mentioned "integrating with our CRM is a nightmare," this was a missed opportunity to explore that pain further according to Tier 1 criteria. Consider asking, "Could you tell me more about the CRM integration challenges?" to acknowledge and understand that specific problem. In the call wrap-up, you clearly stated next steps for both yourself and the merchant, earning 6 points. To get the full 10 points next time, ensure you also provide a specific timeframe for one of those key actions. For motivation probing in F2, you successfully uncovered core objectives ("hitting growth targets") and urgency ("new budget cycle"). To further strengthen, ensure you always try to get explicit confirmation of your summarized understanding of all motivations, as per the criteria.
-```
-
-*Use headings and bullet points exactly as shown above; do **not** output JSON or any other machine‑readable markup.*
-
----
-
-## 6 Style rules
-
-* Quote all utterances verbatim in bullet lists.
-* Use **British spelling**.
-* Never fabricate dialogue.
-* If transcript exceeds context length, analyse the earliest portion that contains at least the first two complete funnels if possible, or up to the first 15 rep utterances if two funnels aren't present that early.
-* If the input is not a transcript or is nonsensical, respond `UNSUPPORTED_INPUT`.
-
----
-
-## Version tag
-
-`Funnel‑Coach‑Gem v1‑2025‑05‑21 (Rev 7)‑explore‑100pt`
-
----
-
-## CALL TRANSCRIPT TO ANALYZE:
-
-Sales Rep(s) indicated as: {sales_rep_names}
-Merchant(s) indicated as: {merchant_names}
-
-```text
-{transcript}
-```
-
-## ANALYSIS AND EVALUATION:
-(Begin your analysis here, following all rules and formatting specified above)
-
-"""
-
-            # Check if API key is configured before making API call 
-            if not GEMINI_API_KEY:
-                app.logger.error("Gemini API key not configured.")
-                return jsonify({'error': 'AI service not configured. API key is missing.'}), 500
-
-            # Use the experimental model with a very low temperature (0.01) for highly consistent outputs
-            model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20', 
-                                         generation_config=genai.GenerationConfig(
-                                             temperature=0,
-                                             top_p=0.1  # Added top_p parameter set to 0.2
-                                         ))
-            
-            # Make the API call
-            response = model.generate_content(prompt)
-            
-            # The response from Gemini should be plain text as per instructions
-            # Check for specific error strings the model might return based on instructions
-            if response.text == "NEED_SPEAKER_ROLES: Please specify which speaker(s) is/are the sales rep(s) and which is/are the merchant(s) so I can evaluate the call.":
-                return jsonify({'analysis_text': response.text, 'is_error': True})
-            elif response.text == "DATA_NOT_REDACTED":
-                return jsonify({'analysis_text': response.text, 'is_error': True})
-            elif response.text == "UNSUPPORTED_INPUT":
-                return jsonify({'analysis_text': response.text, 'is_error': True})
-            
-            # Check if there's content in the response
-            if not hasattr(response, 'text') or not response.text:
-                app.logger.error(f"Gemini API returned an empty or malformed response: {response}")
-                # Check for prompt feedback if available
-                prompt_feedback_msg = ""
-                if hasattr(response, 'prompt_feedback') and response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
-                    prompt_feedback_msg = f" (Reason: {response.prompt_feedback.block_reason_message})"
-                return jsonify({'error': f'AI service returned no content.{prompt_feedback_msg}'}), 500
-
-            return jsonify({'analysis_text': response.text})
+            with timed('json_parse'):
+                fields, invalid = parse_analysis_request()
+                if not invalid:
+                    options, invalid = request_analysis_options()
+            if invalid:
+                return jsonify(invalid[0]), invalid[1]
+            return analysis_response(fields, options, request_team())
 
         except Exception as e:
-            app.logger.error(f"Error processing request: {e}")
-            # Check if it's a Google API error for more specific feedback
-            if hasattr(e, 'args') and e.args and isinstance(e.args[0], str) and "API key not valid" in e.args[0]:
-                 return jsonify({'error': 'Invalid Gemini API Key. Please check your configuration.'}), 500
-            return jsonify({'error': f'An error occurred processing your request: {str(e)}'}), 500
+            payload, status = error_payload(e)
+            return jsonify(payload), status
+
+def analysis_response(fields, options, team):
+    """Runs one interactive analysis and returns the /analyze JSON response."""
+    try:
+        with admission.calling_as(admission.INTERACTIVE, request_user()), history.for_team(team):
+            (payload, status), hit = analyse(fields, **options)
+    except admission.QueueFull as e:
+        return queue_full_response(e)
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+
+    with timed('serialise'):
+        response = jsonify(payload)
+    response.headers['X-Cache'] = cache_status(payload, hit)
+    return response, status
+
+@bp.route('/rescore', methods=['POST'])
+def rescore_report():
+    """Re-checks the score arithmetic of an existing report without calling the model.
+
+    Body: {"analysis_text": ...}. Returns the same analysis_text/report/score_issues
+    fields as /analyze, with the header and category totals corrected.
+    """
+    data = request.get_json(silent=True) or {}
+    text = data.get('analysis_text')
+    if not text:
+        return jsonify({'error': 'No analysis_text provided.'}), 400
+    if text in SENTINEL_RESPONSES:
+        return jsonify({'analysis_text': text, 'is_error': True})
+    payload, status = build_payload(text, None)
+    return jsonify(payload), status
+
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues an analysis (same body as /analyze) and returns its job id straight away."""
+    try:
+        fields, invalid = parse_analysis_request()
+        if not invalid:
+            options, invalid = request_analysis_options()
+        if invalid:
+            return jsonify(invalid[0]), invalid[1]
+        with admission.calling_as(admission.INTERACTIVE, request_user()), history.for_team(request_team()):
+            job_id = analysis_jobs.submit(fields, **options)
+    except jobs.QueueFull:
+        response = jsonify({'error': 'Too many analyses are queued. Please try again shortly.'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+
+    status_url = url_for('funnelbot.get_job', job_id=job_id)
+    response = jsonify({'job_id': job_id, 'status': jobs.QUEUED, 'status_url': status_url})
+    response.headers['Location'] = status_url
+    return response, 202
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Reports a job's status, and its /analyze-style result once finished."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job)
+
+@bp.route('/batch', methods=['POST'])
+def analyze_batch():
+    """Analyses an uploaded JSONL or zip of transcripts and streams NDJSON results.
+
+    Upload the file as multipart field `file`; `parallelism` (query or form) sets
+    the number of concurrent model calls. Results stream back as each item finishes.
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No batch file provided.'}), 400
+    try:
+        parallelism = int(request.values.get('parallelism', BATCH_DEFAULT_PARALLELISM))
+    except ValueError:
+        return jsonify({'error': 'parallelism must be an integer.'}), 400
+    parallelism = max(1, min(parallelism, BATCH_MAX_PARALLELISM))
+    options, invalid = analysis_options(request.values)
+    if invalid:
+        return jsonify(invalid[0]), invalid[1]
+
+    # The upload is closed when the request ends, before the stream has been consumed,
+    # so keep our own on-disk copy for the generator to read from
+    source = tempfile.TemporaryFile()
+    upload.save(source)
+    source.seek(0)
+    filename = upload.filename
+    user = request_user()
+    team = request_team()
+
+    def analyse_bulk(fields):
+        # Batch items queue behind interactive requests for model capacity
+        with admission.calling_as(admission.BULK, user), history.for_team(team):
+            return analyse(fields, **options)
+
+    def generate():
+        try:
+            for record in batch.run_batch(batch.read_items(source, filename), analyse_bulk, parallelism):
+                yield json.dumps(record) + '\n'
+        except Exception as e:
+            payload, status = error_payload(e)
+            yield json.dumps(dict(payload, status=status)) + '\n'
+        finally:
+            source.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON data field."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@bp.route('/analyze/stream', methods=['POST'])
+def analyze_transcript_stream():
+    """Same input as /analyze, but streams the report as server-sent events.
+
+    Emits `chunk` events with {"text": ...} as the model generates, then a single
+    `done` event carrying the same payload /analyze would return (or `error`).
+    """
+    try:
+        fields, invalid = parse_analysis_request()
+        if not invalid:
+            options, invalid = request_analysis_options()
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+    if invalid:
+        return jsonify(invalid[0]), invalid[1]
+    return event_stream_response(fields, options, request_team())
+
+def stream_backend(plan):
+    """The backend a plan's model output is streamed from; returns (backend, None) or (None, (payload, status))."""
+    with modes.using(plan.mode):
+        backend = get_backend()
+    if not backend.is_configured:
+        logger.error("Gemini API key not configured.")
+        return None, ({'error': 'AI service not configured. API key is missing.'}, 500)
+    return backend, None
+
+def answered_events(plan):
+    """The events of a streamed request answered without a model call (preflight, cache, near-duplicate), else None."""
+    if plan.blocked:
+        record_outcome(plan.blocked, 200)
+        return [sse_event('chunk', {'text': plan.blocked['analysis_text']}), sse_event('done', plan.blocked)]
+    if plan.cached is not None:
+        payload, _ = plan.cached
+        record_outcome(payload, 200, hit=True)
+        record_result(plan.fields, payload, 200, plan.earlier)
+        chunks = [sse_event('chunk', {'text': payload['analysis_text']})] if payload.get('analysis_text') else []
+        return chunks + [sse_event('done', plan.shape(payload))]
+    if plan.similar is not None:
+        record_outcome(plan.similar, 200)
+        return [sse_event('chunk', {'text': plan.similar['analysis_text']}), sse_event('done', plan.shape(plan.similar))]
+    return None
+
+def merged_events(plan):
+    """Runs a windowed or incremental analysis (see AnalysisPlan.merged) and returns its events."""
+    hit = None
+    try:
+        (payload, status), hit = analyse_normalised(plan.fields, plan.earlier)
+    except Exception as e:
+        payload, status = error_payload(e)
+    payload = finish_analysis(plan, payload, status, hit)
+    chunks = [sse_event('chunk', {'text': payload['analysis_text']})] if status == 200 and payload.get('analysis_text') else []
+    return chunks + [sse_event('done' if status == 200 else 'error', payload)]
+
+def streamed_event(plan, text):
+    """Caches and records the full text of a streamed model call; returns the closing event."""
+    payload, status = build_payload(text, None)
+    if status == 200:
+        results.set(plan.key, [payload, status])
+    payload = finish_analysis(plan, payload, status, hit=False)
+    return sse_event('done' if status == 200 else 'error', payload)
+
+def failed_event(e):
+    payload, status = error_payload(e)
+    record_outcome(payload, status)
+    return sse_event('error', payload)
+
+def event_stream_response(fields, options, team):
+    """Runs one interactive analysis as the /analyze/stream server-sent events response."""
+    plan = plan_analysis(fields, options['reuse_similar'], options['mode'], options['latency_target'],
+                         options.get('parsed'), check_cache=True)
+    backend, unavailable = stream_backend(plan)
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1]
+    user = request_user()
+
+    def events():
+        answered = answered_events(plan)
+        if answered is None and plan.merged:
+            answered = merged_events(plan)
+        if answered is not None:
+            yield from answered
+            return
+        try:
+            parts = []
+            for text in backend.stream(prompt.build_user_prompt(*plan.fields)):
+                parts.append(text)
+                yield sse_event('chunk', {'text': text})
+            yield streamed_event(plan, ''.join(parts))
+        except Exception as e:
+            yield failed_event(e)
+
+    def generate():
+        with admission.calling_as(admission.INTERACTIVE, user), history.for_team(team), \
+                modes.using(plan.mode), ANALYSES_IN_FLIGHT.track():
+            yield from events()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Cache'] = plan.cache_status
+    return response
+
+@bp.route('/analyze/upload', methods=['POST'])
+def analyze_upload():
+    """Analyses an uploaded transcript file, parsed as the upload arrives.
+
+    Send multipart/form-data with the file as `file` (WebVTT, SRT, plain text
+    or DOCX) and the other /analyze fields as form fields. Responds like
+    /analyze, or like /analyze/stream when the request accepts text/event-stream.
+    """
+    try:
+        with timed('upload_parse'):
+            form, upload = transcript_files.read_upload(request.stream, request.content_type,
+                                                        max_bytes=UPLOAD_MAX_BYTES)
+    except transcript_files.InvalidTranscriptFile as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+    if not upload['utterances']:
+        return jsonify({'error': 'No speaker-labelled lines were found in the transcript file.'}), 400
+    logger.info(f"Parsed {upload['format']} upload: {len(upload['utterances'])} utterances")
+
+    fields, invalid = analysis_fields(dict(form, transcript=transcripts.compact(upload['utterances'])))
+    if not invalid:
+        options, invalid = analysis_options(form)
+    if invalid:
+        return jsonify(invalid[0]), invalid[1]
+    options['parsed'] = upload['utterances']
+    team = form.get('team') or request.args.get('team')
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        return event_stream_response(fields, options, team)
+    return analysis_response(fields, options, team)
+
+def query_int(name, default, minimum, maximum):
+    """Reads an integer query parameter clamped to [minimum, maximum]; raises ValueError if malformed."""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    return max(minimum, min(int(value), maximum))
+
+def query_time(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, '') else None
+
+@bp.route('/history', methods=['GET'])
+def get_history():
+    """Lists recorded analyses, newest first, without calling the model.
+
+    Query: rep, team, since/until (Unix seconds), limit, cursor (the `next_cursor`
+    of the previous page). Entries carry scores but not the report text; fetch
+    /history/<id> for that.
+    """
+    try:
+        limit = query_int('limit', HISTORY_PAGE_SIZE, 1, HISTORY_MAX_PAGE_SIZE)
+        since, until = query_time('since'), query_time('until')
+        cursor = request.args.get('cursor')
+        before = None
+        if cursor:
+            created_at, analysis_id = cursor.split(':')
+            before = (float(created_at), int(analysis_id))
+    except ValueError:
+        return jsonify({'error': 'limit, since, until and cursor must be numeric.'}), 400
+
+    entries, next_cursor = analysis_history.history(request.args.get('rep'), request.args.get('team'),
+                                                    since, until, before, limit)
+    return jsonify({'analyses': entries,
+                    'next_cursor': f'{next_cursor[0]!r}:{next_cursor[1]}' if next_cursor else None})
+
+@bp.route('/history/<int:analysis_id>', methods=['GET'])
+def get_history_entry(analysis_id):
+    """One recorded analysis including its report text."""
+    entry = analysis_history.get(analysis_id)
+    if entry is None:
+        return jsonify({'error': 'Analysis not found.'}), 404
+    return jsonify(entry)
+
+@bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Reps (by=rep, the default) or teams (by=team) ranked by average final score.
+
+    Query: team (reps of one team), min_analyses, limit, offset. Served from the
+    rollup tables, so it costs the same however long the history is.
+    """
+    scope = request.args.get('by', history.REP)
+    if scope not in history.SCOPES:
+        return jsonify({'error': f"by must be one of: {', '.join(history.SCOPES)}."}), 400
+    try:
+        limit = query_int('limit', HISTORY_PAGE_SIZE, 1, HISTORY_MAX_PAGE_SIZE)
+        offset = query_int('offset', 0, 0, 10 ** 9)
+        min_analyses = query_int('min_analyses', 1, 1, 10 ** 9)
+    except ValueError:
+        return jsonify({'error': 'limit, offset and min_analyses must be integers.'}), 400
+
+    entries, total = analysis_history.leaderboard(scope, request.args.get('team'), min_analyses, offset, limit)
+    return jsonify({'by': scope, 'entries': entries, 'total': total, 'offset': offset, 'limit': limit})
+
+_warm_up_lock = threading.Lock()
+# The process warm_up() last completed in; a forked worker starts out cold
+_warmed_up_pid = None
+
+def warm_up():
+    """Gets this process ready to serve analyses; does the work once per process.
+
+    Creates the backend of every analysis mode along with its model client, so
+    the Gemini SDK import and the conversion of the rubric into each model's
+    system instruction happen here rather than in the first requests. Called by
+    create_app(), or in each worker once it has started (gunicorn.conf.py, the
+    ASGI lifespan); /readyz reports the process ready only after it has run.
+    """
+    global _warmed_up_pid
+    with _warm_up_lock:
+        if _warmed_up_pid == os.getpid():
+            return
+        start = time.perf_counter()
+        for mode in modes.ORDER:
+            with modes.using(mode):
+                get_backend()  # the admission and retry wrappers are memoised too
+            model_backend(mode).warm_up()
+        _warmed_up_pid = os.getpid()
+    logger.info(f"Process {os.getpid()} warmed up in {time.perf_counter() - start:.2f}s")
+
+@bp.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness probe: 200 whenever the process can answer at all."""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once this process has warmed up and can call the model, else 503.
+
+    Load balancers and autoscalers should only send traffic to an instance after
+    this succeeds.
+    """
+    checks = {
+        'warmed_up': _warmed_up_pid == os.getpid(),
+        'model_configured': model_backend(modes.STANDARD).is_configured,
+    }
+    ready = all(checks.values())
+    return jsonify({'status': 'ready' if ready else 'unavailable', 'checks': checks}), 200 if ready else 503
+
+def create_app(config_object=None):
+    """Builds the Flask app from a config.Config class, or the name of one (default: APP_CONFIG).
+
+    Runs once per process - or once in total when a preforking server creates
+    the app before forking its workers, which then only need warm_up().
+    """
+    if not isinstance(config_object, type):
+        config_object = config.get_config(config_object)
+    app = Flask(__name__, instance_path=INSTANCE_PATH)
+    app.config.from_object(config_object)
+    if not app.config['ASSET_BUILD_DIR']:
+        app.config['ASSET_BUILD_DIR'] = os.path.join(app.instance_path, 'assets')
+    app.config['ASSET_MANIFEST'] = (assets.build(app.static_folder, app.config['ASSET_BUILD_DIR'])
+                                    if app.config['ASSETS_ENABLED'] else {})
+    app.register_blueprint(bp)
+    app.logger.info(f"App created with {config_object.__name__}")
+    if app.config['WARM_UP_ON_CREATE']:
+        warm_up()
+    return app
 
 if __name__ == '__main__':
-    # Note: Debug mode should be False in a production environment
-    debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    # The Flask development server; run.sh serves production traffic with gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 5000))
-    app.run(debug=debug_mode, host='0.0.0.0', port=port) 
\ No newline at end of file
+    create_app('development').run(host='0.0.0.0', port=port)
\ No newline at end of file
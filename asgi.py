@@ -0,0 +1,217 @@
+"""ASGI entry point: the analysis routes as coroutines, everything else from the Flask app.
+
+Under the threaded server every in-flight analysis holds a thread for the whole
+multi-minute model call. Here POST /analyze and POST /analyze/stream run on
+the event loop: the model call is awaited (see the backends' agenerate and
+astream), so thousands of calls can wait on the network in one process at the
+cost of a coroutine each. Routes, request bodies, status codes, payloads and
+headers (X-Cache, Server-Timing, Retry-After) are the same as app.py's, and so
+are the steps before and after the model call: both run app.plan_analysis(),
+app.finish_analysis() and the app.*_events helpers (in a worker thread here,
+as they read and write SQLite). Only the model call is awaited differently.
+The remaining routes are served by the Flask app itself, mounted as WSGI.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --loop uvloop --http httptools
+(run.sh does this when SERVER_MODE=asgi.)
+
+Windowed analysis of very long transcripts, and incremental analysis of
+extended ones, still run in a worker thread.
+Each uvicorn worker warms up (app.warm_up) during lifespan startup, before it
+accepts requests.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import admission
+import app
+import assets
+import history
+import modes
+import prompt
+
+# Threads for blocking work the coroutines hand off: SQLite cache calls and windowed analyses
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 64))
+# Threads serving the mounted Flask routes (jobs, batch, static files, ...)
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+
+
+def json_response(payload, status=200, headers=None, accept_encoding=None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = dict(headers or {})
+    if len(body) >= assets.MIN_COMPRESS_BYTES:
+        # Same rule as app.compress_response()
+        headers['Vary'] = 'Accept-Encoding'
+        coding = assets.preferred_encoding(accept_encoding, assets.response_codings())
+        if coding:
+            body = assets.compress(body, coding)
+            headers['Content-Encoding'] = coding
+    response = Response(body, status_code=status, media_type='application/json', headers=headers)
+    retry_after = payload.get('retry_after_seconds') if isinstance(payload, dict) else None
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def request_user(request):
+    """Same rule as app.request_user(): the X-User-Id header, else the client address."""
+    return request.headers.get('x-user-id') or (request.client.host if request.client else None)
+
+
+def request_team(request, data):
+    """Same rule as app.request_team(): `team` in the JSON body, else in the query string."""
+    return (data.get('team') if isinstance(data, dict) else None) or request.query_params.get('team')
+
+
+async def run_analysis(transcript, sales_rep_names, merchant_names):
+    """Coroutine version of app.run_analysis()."""
+    with app.timed('prompt_build'):
+        user_prompt = prompt.build_user_prompt(transcript, sales_rep_names, merchant_names)
+
+    backend = app.get_backend()
+    if not backend.is_configured:
+        app.logger.error("Gemini API key not configured.")
+        return {'error': 'AI service not configured. API key is missing.'}, 500
+
+    with app.timed('model_wait'):
+        response = await backend.agenerate(user_prompt)
+    app.record_usage(response)
+    return app.build_payload(response.text, response)
+
+
+async def analyse(fields, reuse_similar=True, mode=modes.DEFAULT, latency_target=None):
+    """Coroutine version of app.analyse(): returns ((payload, status), hit)."""
+    with app.ANALYSES_IN_FLIGHT.track():
+        try:
+            plan = await asyncio.to_thread(app.plan_analysis, fields, reuse_similar, mode, latency_target)
+            answered = app.answered_payload(plan)
+            if answered:
+                return answered
+            with modes.using(plan.mode):
+                if plan.merged:
+                    (payload, status), hit = await asyncio.to_thread(app.analyse_normalised, plan.fields, plan.earlier)
+                else:
+                    (payload, status), hit = await app.results.aget_or_compute(
+                        plan.key,
+                        lambda: run_analysis(*plan.fields),
+                        cacheable=lambda result: result[1] == 200,
+                    )
+        except Exception as e:
+            app.record_error(e)
+            raise
+    return (await asyncio.to_thread(app.finish_analysis, plan, payload, status, hit), status), hit
+
+
+def timed_route(route):
+    """Records a handler's time to response in funnelbot_request_duration_seconds, like the Flask hooks."""
+    def decorate(handler):
+        async def timed_handler(request):
+            start = time.perf_counter()
+            response = await handler(request)
+            app.REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, status=response.status_code)
+            return response
+        return timed_handler
+    return decorate
+
+
+@timed_route('/analyze')
+async def analyze_transcript(request):
+    timings = {}
+    app.phase_timings.set(timings)
+    try:
+        with app.timed('json_parse'):
+            data = await request.json()
+            fields, invalid = app.analysis_fields(data)
+            if not invalid:
+                options, invalid = app.analysis_options(data)
+        if invalid:
+            return json_response(*invalid)
+
+        with admission.calling_as(admission.INTERACTIVE, request_user(request)), history.for_team(request_team(request, data)):
+            (payload, status), hit = await analyse(fields, **options)
+
+        with app.timed('serialise'):
+            response = json_response(payload, status, {'X-Cache': app.cache_status(payload, hit)},
+                                     request.headers.get('accept-encoding'))
+    except Exception as e:
+        response = json_response(*app.error_payload(e))
+    if timings:
+        response.headers['Server-Timing'] = app.server_timing(timings)
+    return response
+
+
+@timed_route('/analyze/stream')
+async def analyze_transcript_stream(request):
+    try:
+        data = await request.json()
+        fields, invalid = app.analysis_fields(data)
+        if not invalid:
+            options, invalid = app.analysis_options(data)
+    except Exception as e:
+        return json_response(*app.error_payload(e))
+    if invalid:
+        return json_response(*invalid)
+
+    plan = await asyncio.to_thread(app.plan_analysis, fields, options['reuse_similar'], options['mode'],
+                                   options['latency_target'], check_cache=True)
+    backend, unavailable = app.stream_backend(plan)
+    if unavailable:
+        return json_response(*unavailable)
+    user = request_user(request)
+    team = request_team(request, data)
+
+    async def events():
+        answered = await asyncio.to_thread(app.answered_events, plan)
+        if answered is None and plan.merged:
+            answered = await asyncio.to_thread(app.merged_events, plan)
+        if answered is not None:
+            for event in answered:
+                yield event
+            return
+        try:
+            parts = []
+            async for text in backend.astream(prompt.build_user_prompt(*plan.fields)):
+                parts.append(text)
+                yield app.sse_event('chunk', {'text': text})
+            yield await asyncio.to_thread(app.streamed_event, plan, ''.join(parts))
+        except Exception as e:
+            yield app.failed_event(e)
+
+    async def generate():
+        with admission.calling_as(admission.INTERACTIVE, user), history.for_team(team), \
+                modes.using(plan.mode), app.ANALYSES_IN_FLIGHT.track():
+            async for event in events():
+                yield event
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Stop nginx-style proxies from buffering the stream
+        'X-Cache': plan.cache_status,
+    })
+
+
+@asynccontextmanager
+async def lifespan(_):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi'))
+    await asyncio.to_thread(app.warm_up)
+    yield
+
+
+application = Starlette(
+    routes=[
+        Route('/analyze', analyze_transcript, methods=['POST']),
+        Route('/analyze/stream', analyze_transcript_stream, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(app.create_app(), workers=ASGI_WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
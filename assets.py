@@ -0,0 +1,371 @@
+"""Static asset pipeline: minified, content-hashed, precompressed files.
+
+Everything under static/ is copied into a build directory under a name that
+carries a hash of its content (css/style.3f9a0c1d2b7e.css), so it can be served
+with `Cache-Control: immutable` and a one-year max-age: a changed file gets a
+new URL, and the browser never has to revalidate the old one. Along the way:
+
+* CSS and JS are minified (comments and indentation removed, newlines kept in
+  JS so automatic semicolon insertion still sees the same program);
+* url(...) references in CSS are rewritten to the hashed names;
+* compressible files get .gz and, when the optional `brotli` package is
+  installed, .br siblings, so nothing is compressed per request.
+
+build() runs when the app starts and skips files whose hashed output already
+exists, so every worker can call it. To build ahead of time instead (e.g. in a
+container image):
+
+    python assets.py build
+
+The Inter web font is self-hosted: `python assets.py build` first writes the
+Latin subset of Inter's variable font (fonts/InterVariable.ttf, or FONT_SOURCE)
+to static/fonts/inter-latin.woff2, which needs fontTools and brotli, and then
+builds it with everything else. The page preloads and declares it; without a
+built subset it falls back to a locally installed Inter and then the system
+font stack, never to a third-party font host.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # gzip-only without it
+    brotli = None
+
+HASH_LENGTH = 12
+IMMUTABLE = 'public, max-age=31536000, immutable'
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml', 'application/x-ndjson')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+# Below this, the headers outweigh the saving
+MIN_COMPRESS_BYTES = 1024
+
+# Characters covered by the font subset: Basic Latin, Latin-1 and general punctuation (•, –, —, “”, …)
+FONT_UNICODES = 'U+0000-00FF,U+0131,U+0152-0153,U+02C6,U+02DA,U+02DC,U+2000-206F,U+2074,U+20AC,U+2122,U+2212'
+FONT_OUTPUT = 'fonts/inter-latin.woff2'
+# Inter's variable TTF (SIL Open Font License) that the subset is built from, relative to this directory
+FONT_SOURCE = os.environ.get('FONT_SOURCE', os.path.join('fonts', 'InterVariable.ttf'))
+
+
+# --- Minifiers -------------------------------------------------------------
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(css):
+    """Strips comments and collapses whitespace; leaves strings, selectors and values intact."""
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', css)
+    out = []
+    for index, part in enumerate(parts):
+        if index % 2:  # a quoted string
+            out.append(part)
+            continue
+        part = re.sub(r'/\*.*?\*/', '', part, flags=re.DOTALL)
+        part = re.sub(r'\s+', ' ', part)
+        # A space before ":" is significant in selectors (`a :hover`), so only trim after it
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        part = re.sub(r':\s+', ':', part)
+        out.append(part)
+    return re.sub(r';}', '}', ''.join(out)).strip()
+
+
+# After these, a "/" starts a regular expression rather than a division
+_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw', 'yield',
+                   'await'}
+
+
+def minify_js(js):
+    """Removes comments, indentation and blank lines from JavaScript.
+
+    A small lexer keeps string, template and regular-expression literals
+    byte-for-byte (including multi-line template literals). Line breaks between
+    statements are kept, so the result parses exactly like the source.
+    """
+    out = []
+    i, n = 0, len(js)
+    template_depth = []  # brace depth at each open `${`, innermost last
+    braces = 0
+    line_start = True
+
+    def last_significant():
+        return ''.join(out[-32:]).rstrip()
+
+    def regex_allowed():
+        previous = last_significant()
+        if not previous:
+            return True
+        if previous[-1] in _REGEX_AFTER:
+            return True
+        word = re.search(r'[A-Za-z_$][\w$]*$', previous)
+        return bool(word) and word.group(0) in _REGEX_KEYWORDS
+
+    def read_template(start):
+        """Reads template text from `start` up to a closing backtick or `${`; returns the end index."""
+        j = start
+        while j < n:
+            if js[j] == '\\':
+                j += 2
+            elif js[j] == '`':
+                return j + 1
+            elif js.startswith('${', j):
+                return j + 2
+            else:
+                j += 1
+        return n
+
+    while i < n:
+        char = js[i]
+        if char == '\n':
+            if not line_start:
+                while out and out[-1] in (' ', '\t'):
+                    out.pop()
+                out.append('\n')
+            line_start = True
+            i += 1
+            continue
+        if char in ' \t\r':
+            if not line_start and out and out[-1] not in (' ', '\n'):
+                out.append(' ')
+            i += 1
+            continue
+
+        if js.startswith('//', i):
+            end = js.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        if js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if '\n' in js[i:end] and not line_start:
+                out.append('\n')
+                line_start = True
+            i = end
+            continue
+        line_start = False
+        if char in '\'"':
+            j = i + 1
+            while j < n and js[j] != char:
+                j += 2 if js[j] == '\\' else 1
+            out.append(js[i:j + 1])
+            i = j + 1
+            continue
+        if char == '`' or (char == '}' and template_depth and template_depth[-1] == braces):
+            if char == '}':
+                template_depth.pop()
+            end = read_template(i + 1)
+            out.append(js[i:end])
+            if js[end - 2:end] == '${':
+                template_depth.append(braces)
+            i = end
+            continue
+        if char == '/' and regex_allowed():
+            j, in_class = i + 1, False
+            while j < n and js[j] != '\n':
+                if js[j] == '\\':
+                    j += 2
+                    continue
+                if js[j] == '[':
+                    in_class = True
+                elif js[j] == ']':
+                    in_class = False
+                elif js[j] == '/' and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and (js[j].isalnum() or js[j] == '_'):  # flags
+                j += 1
+            out.append(js[i:j])
+            i = j
+            continue
+        if char == '{':
+            braces += 1
+        elif char == '}':
+            braces -= 1
+        out.append(char)
+        i += 1
+
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# --- Build -------------------------------------------------------------------
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(path, digest):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _compressed_variants(data):
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def _source_files(source_dir):
+    for directory, _, names in os.walk(source_dir):
+        for name in sorted(names):
+            if name.startswith('.'):
+                continue
+            full = os.path.join(directory, name)
+            yield os.path.relpath(full, source_dir).replace(os.sep, '/'), full
+
+
+def _rewrite_css_urls(css, path, manifest):
+    def replace(match):
+        url = match.group(2)
+        if re.match(r'^(?:[a-z]+:|/|#)', url, re.IGNORECASE):
+            return match.group(0)  # absolute, data: or fragment URLs
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), url.split('?')[0].split('#')[0]))
+        if target not in manifest:
+            return match.group(0)
+        return f"url({posixpath.relpath(manifest[target], posixpath.dirname(path))})"
+    return CSS_URL_RE.sub(replace, css)
+
+
+def build(source_dir, build_dir):
+    """Builds every file under source_dir into build_dir; returns {logical path: hashed path}.
+
+    Stylesheets are built last so their url() references can point at the
+    hashed names of fonts and images.
+    """
+    files = sorted(_source_files(source_dir), key=lambda item: item[0].endswith('.css'))
+    manifest = {}
+    for path, full in files:
+        with open(full, 'rb') as f:
+            data = f.read()
+        ext = posixpath.splitext(path)[1].lower()
+        if ext in MINIFIERS:
+            text = data.decode('utf-8')
+            if ext == '.css':
+                text = _rewrite_css_urls(text, path, manifest)
+            data = MINIFIERS[ext](text).encode('utf-8')
+
+        output = hashed_name(path, content_hash(data))
+        manifest[path] = output
+        target = os.path.join(build_dir, output)
+        if os.path.exists(target):
+            continue
+        if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+            for suffix, compressed in _compressed_variants(data).items():
+                _write_atomic(target + suffix, compressed)
+        _write_atomic(target, data)
+
+    _write_atomic(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+# --- Serving -----------------------------------------------------------------
+
+def accepted_encodings(accept_encoding):
+    """Content codings the client accepts (q > 0), lower-cased."""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = re.search(r'q\s*=\s*([\d.]+)', params)
+        if coding and not (quality and float(quality.group(1)) == 0):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def preferred_encoding(accept_encoding, available=('br', 'gzip')):
+    """The best coding from `available` that the client accepts, or None for identity."""
+    accepted = accepted_encodings(accept_encoding)
+    for coding in available:
+        if coding in accepted or '*' in accepted:
+            return coding
+    return None
+
+
+def response_codings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, coding):
+    """Compresses a dynamic response body; faster settings than the prebuilt assets use."""
+    if coding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+# --- Font subsetting ----------------------------------------------------------
+
+def subset_font(source, static_dir, unicodes=FONT_UNICODES):
+    """Writes a WOFF2 subset of `source` (a TTF/OTF, e.g. Inter's variable font) for the stylesheet."""
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['kern', 'liga', 'calt', 'tnum']
+    options.name_IDs = ['*']
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=subset.parse_unicodes(unicodes))
+    subsetter.subset(font)
+    target = os.path.join(static_dir, FONT_OUTPUT)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    subset.save_font(font, target, options)
+    return target
+
+
+def build_font(source, static_dir):
+    """Writes the font subset unless it is newer than `source`; returns its path, or None without a source."""
+    if not os.path.isfile(source):
+        return None
+    target = os.path.join(static_dir, FONT_OUTPUT)
+    if os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+        return target
+    return subset_font(source, static_dir)
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Build or prepare the static assets.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='Minify, hash and precompress static/ into the build directory')
+    build_parser.add_argument('--output', default=os.environ.get('ASSET_BUILD_DIR', os.path.join(here, 'instance', 'assets')))
+    build_parser.add_argument('--font', default=os.path.join(here, FONT_SOURCE),
+                              help='Source TTF/OTF of the self-hosted font subset')
+    font_parser = commands.add_parser('subset-font', help='Write the Latin WOFF2 subset of a font into static/fonts')
+    font_parser.add_argument('font', help='Source TTF/OTF, e.g. InterVariable.ttf')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if build_font(args.font, os.path.join(here, 'static')) is None:
+            print(f'No font source at {args.font}; the page will use a local Inter or the system fonts',
+                  file=sys.stderr)
+        manifest = build(os.path.join(here, 'static'), args.output)
+        print(f'Built {len(manifest)} asset(s) into {args.output}', file=sys.stderr)
+    else:
+        print(f"Wrote {subset_font(args.font, os.path.join(here, 'static'))}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Bulk transcript analysis.
+
+Input is either a JSONL file with one {"id", "transcript", "sales_rep_names",
+"merchant_names"} object per line, or a zip holding .jsonl members and/or .txt
+transcripts described by a manifest.jsonl ({"file", "sales_rep_names",
+"merchant_names"} per line). Results are written as NDJSON, one line per item
+in completion order.
+
+Usage:
+    python batch.py calls.jsonl --output results.ndjson --parallelism 4
+
+Re-running with the same --output resumes: items already recorded with status
+200 are skipped. Everything else goes through the shared result cache, so
+repeated items are not billed twice.
+"""
+import argparse
+import contextvars
+import io
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def _items_from_jsonl(lines, prefix=''):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield {'id': f'{prefix}line-{number}', 'invalid': 'Line is not valid JSON.'}
+            continue
+        if not isinstance(item, dict):
+            yield {'id': f'{prefix}line-{number}', 'invalid': 'Line is not a JSON object.'}
+            continue
+        item.setdefault('id', f'{prefix}line-{number}')
+        yield item
+
+
+def _manifest_line(line):
+    """Returns (entry, None) for a manifest line, or (None, why it is unusable)."""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None, 'Manifest line is not valid JSON.'
+    if not isinstance(entry, dict):
+        return None, 'Manifest line is not a JSON object.'
+    if not isinstance(entry.get('file'), str):
+        return None, 'Manifest line has no "file".'
+    return entry, None
+
+
+def _items_from_zip(archive):
+    names = archive.namelist()
+    manifest = {}
+    if 'manifest.jsonl' in names:
+        with archive.open('manifest.jsonl') as f:
+            for number, line in enumerate(io.TextIOWrapper(f, encoding='utf-8'), 1):
+                if not line.strip():
+                    continue
+                entry, invalid = _manifest_line(line)
+                if invalid:
+                    # Reported like a bad JSONL line; a file it described runs without its names
+                    yield {'id': f'manifest.jsonl:line-{number}', 'invalid': invalid}
+                else:
+                    manifest[entry['file']] = entry
+
+    for name in names:
+        if name == 'manifest.jsonl' or name.endswith('/'):
+            continue
+        if name.endswith('.jsonl'):
+            with archive.open(name) as f:
+                yield from _items_from_jsonl(io.TextIOWrapper(f, encoding='utf-8'), prefix=f'{name}:')
+        elif name.endswith('.txt'):
+            entry = manifest.get(name, {})
+            with archive.open(name) as f:
+                transcript = f.read().decode('utf-8', errors='replace')
+            yield {
+                'id': entry.get('id', name),
+                'transcript': transcript,
+                'sales_rep_names': entry.get('sales_rep_names'),
+                'merchant_names': entry.get('merchant_names', 'Customer'),
+            }
+
+
+def read_items(stream, filename):
+    """Yields batch items from a binary JSONL or zip stream."""
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(stream) as archive:
+            yield from _items_from_zip(archive)
+    else:
+        yield from _items_from_jsonl(io.TextIOWrapper(stream, encoding='utf-8'))
+
+
+def _analyse_item(analyse, item):
+    fields = (item['transcript'], item['sales_rep_names'], item.get('merchant_names') or 'Customer')
+    try:
+        (payload, status), hit = analyse(fields)
+    except Exception as e:
+        payload, status, hit = {'error': f'An error occurred processing your request: {str(e)}'}, 500, False
+    return dict(payload, id=item['id'], status=status, cached=hit)
+
+
+def run_batch(items, analyse, parallelism=4, skip_ids=()):
+    """Analyses items with at most `parallelism` model calls in flight.
+
+    `analyse(fields)` has the same contract as app.analyse. Yields one result
+    record per item as soon as it finishes.
+    """
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='batch') as pool:
+        pending = set()
+        for item in items:
+            if item['id'] in skip_ids:
+                continue
+            if item.get('invalid'):
+                yield {'id': item['id'], 'status': 400, 'error': item['invalid']}
+                continue
+            if not item.get('transcript'):
+                yield {'id': item['id'], 'status': 400, 'error': 'No transcript provided.'}
+                continue
+            if not item.get('sales_rep_names'):
+                yield {'id': item['id'], 'status': 400, 'error': 'Sales Rep name(s) not provided.'}
+                continue
+
+            pending.add(pool.submit(contextvars.copy_context().run, _analyse_item, analyse, item))
+            # Keep the read-ahead bounded so thousands of transcripts are not held in memory at once
+            if len(pending) >= parallelism * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def completed_ids(path):
+    """Returns the ids already recorded with status 200 in an NDJSON results file."""
+    ids = set()
+    if not os.path.exists(path):
+        return ids
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A crash can leave a truncated last line
+            if record.get('status') == 200:
+                ids.add(record.get('id'))
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse a batch of sales call transcripts.')
+    parser.add_argument('input', help='JSONL file or zip of transcripts')
+    parser.add_argument('--output', '-o', required=True, help='NDJSON results file (appended to, used for resume)')
+    parser.add_argument('--parallelism', '-p', type=int, default=4, help='Concurrent model calls')
+    args = parser.parse_args(argv)
+
+    # Imported here so --help works without the web app's configuration
+    from app import analyse
+
+    skip_ids = completed_ids(args.output)
+    if skip_ids:
+        print(f'Resuming: skipping {len(skip_ids)} completed item(s).', file=sys.stderr)
+
+    counts = {'ok': 0, 'failed': 0}
+    with open(args.input, 'rb') as source, open(args.output, 'a', encoding='utf-8') as out:
+        for record in run_batch(read_items(source, args.input), analyse, args.parallelism, skip_ids):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            counts['ok' if record['status'] == 200 else 'failed'] += 1
+    print(f"Done: {counts['ok']} succeeded, {counts['failed']} failed.", file=sys.stderr)
+    return 0 if counts['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
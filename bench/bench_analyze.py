@@ -0,0 +1,235 @@
+"""Load and latency benchmark for POST /analyze.
+
+Starts the stub model server and the Flask app (as a separate process pointed
+at the stub), then drives /analyze at increasing concurrency. For each level it
+reports throughput, p50/p95/p99 latency, the per-phase times the app returns in
+its Server-Timing header (json_parse, prompt_build, model_wait, serialise) and
+app memory per in-flight request. Every request uses a distinct transcript so
+the result cache never answers, and near-duplicate reuse is turned off: the
+synthetic transcripts differ by a single marker, so it would answer them all.
+
+Usage:
+    python bench/bench_analyze.py --concurrency 1,4,16,64 --latency 2 --output bench_results.json
+
+Compare two runs by diffing their JSON files; the `levels` entries line up by
+concurrency.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_model_server import StubModelServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss_kb(pid):
+    """Resident set size of a process in kB, or None if it can't be read."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        return int(subprocess.check_output(['ps', '-o', 'rss=', '-p', str(pid)]).strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def parse_server_timing(header):
+    timings = {}
+    for part in (header or '').split(','):
+        name, _, rest = part.strip().partition(';dur=')
+        if name and rest:
+            timings[name] = float(rest)
+    return timings
+
+
+def make_transcript(lines):
+    """A synthetic transcript with a unique marker so it never hits the result cache."""
+    turns = [f'Rep: Thanks for your time today, this is call {uuid.uuid4().hex}.']
+    for i in range(lines):
+        if i % 2:
+            turns.append(f'Rep: How does that affect your payments team, point {i}?')
+        else:
+            turns.append(f'Customer: We see checkout drop-off and manual reconciliation work, item {i}.')
+    return '\n'.join(turns)
+
+
+def start_app(port, stub_url, workdir):
+    env = dict(os.environ,
+               PORT=str(port),
+               FLASK_DEBUG='False',
+               LLM_BACKEND='gemini',
+               GEMINI_API_KEY='benchmark',
+               GEMINI_API_ENDPOINT=stub_url,
+               PREFIX_CACHE='local',
+               ADMISSION_RPM='0',  # measure the app, not our own quota throttle
+               ADMISSION_TPM='0',
+               ADMISSION_MAX_CONCURRENT='0',
+               NEAR_DUPLICATE_ENABLED='false',  # measure the model path, not the earlier-result shortcut
+               # Every store lives in the run's temporary directory, never in the repo's instance/
+               RESULT_CACHE_PATH=os.path.join(workdir, 'result_cache.sqlite3'),
+               JOB_STORE_PATH=os.path.join(workdir, 'jobs.sqlite3'),
+               HISTORY_PATH=os.path.join(workdir, 'history.sqlite3'),
+               NEAR_DUPLICATE_PATH=os.path.join(workdir, 'near_duplicates.sqlite3'),
+               FUNNEL_STATE_PATH=os.path.join(workdir, 'funnel_states.sqlite3'))
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'App exited during startup; see {log.name}')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=1).read()
+            return process
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'App did not become ready; see {log.name}')
+
+
+def one_request(url, transcript):
+    body = json.dumps({'transcript': transcript, 'sales_rep_names': 'Rep', 'merchant_names': 'Customer'}).encode()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            response.read()
+            status, timing = response.status, response.headers.get('Server-Timing')
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, timing = e.code, e.headers.get('Server-Timing')
+    return (time.perf_counter() - start) * 1000, status, parse_server_timing(timing)
+
+
+def run_level(url, pid, concurrency, total, transcript_lines):
+    transcripts = [make_transcript(transcript_lines) for _ in range(total)]
+    baseline = rss_kb(pid)
+    peak = [baseline or 0]
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.is_set():
+            peak[0] = max(peak[0], rss_kb(pid) or 0)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda t: one_request(url, t), transcripts))
+    elapsed = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+
+    latencies = [ms for ms, status, _ in outcomes if status == 200]
+    phases = {}
+    for _, status, timings in outcomes:
+        if status == 200:
+            for phase, ms in timings.items():
+                phases.setdefault(phase, []).append(ms)
+
+    level = {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': sum(1 for _, status, _ in outcomes if status != 200),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 3),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2),
+        } if latencies else None,
+        'phases_ms': {
+            phase: {'mean': round(statistics.mean(values), 3), 'p50': round(percentile(values, 50), 3),
+                    'p99': round(percentile(values, 99), 3)}
+            for phase, values in phases.items()
+        },
+        'memory_kb': {
+            'baseline_rss': baseline,
+            'peak_rss': peak[0],
+            'per_in_flight_request': round((peak[0] - baseline) / concurrency, 1) if baseline else None,
+        },
+    }
+    return level
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark POST /analyze against a stub model server.')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests-per-level', type=int, default=0,
+                        help='Requests per level (default: 4 x concurrency, at least 8)')
+    parser.add_argument('--latency', type=float, default=1.0, help='Stub model latency in seconds')
+    parser.add_argument('--response-bytes', type=int, default=8000, help='Stub report size in bytes')
+    parser.add_argument('--transcript-lines', type=int, default=200, help='Lines per synthetic transcript')
+    parser.add_argument('--output', '-o', default='bench_results.json', help='Where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    stub = StubModelServer(args.latency, args.response_bytes).start()
+    workdir = tempfile.mkdtemp(prefix='funnelbot-bench-')
+    port = free_port()
+    app_process = start_app(port, stub.url, workdir)
+    url = f'http://127.0.0.1:{port}/analyze'
+
+    results = {
+        'benchmark': 'analyze',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'config': {'stub_latency_s': args.latency, 'response_bytes': args.response_bytes,
+                   'transcript_lines': args.transcript_lines},
+        'levels': [],
+    }
+    try:
+        one_request(url, make_transcript(args.transcript_lines))  # warm-up
+        for concurrency in levels:
+            total = args.requests_per_level or max(8, concurrency * 4)
+            level = run_level(url, app_process.pid, concurrency, total, args.transcript_lines)
+            results['levels'].append(level)
+            latency = level['latency_ms'] or {}
+            print(f"c={concurrency:<4} rps={level['throughput_rps']:<8} p50={latency.get('p50')}ms "
+                  f"p95={latency.get('p95')}ms p99={latency.get('p99')}ms errors={level['errors']} "
+                  f"mem/req={level['memory_kb']['per_in_flight_request']}kB")
+    finally:
+        app_process.terminate()
+        app_process.wait()
+        stub.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Local stand-in for the Gemini REST API, used by the benchmarks.
+
+Answers generateContent and streamGenerateContent for any model after a fixed
+delay with a report of roughly the requested size. Point the app at it with
+GEMINI_API_ENDPOINT=http://127.0.0.1:<port> and PREFIX_CACHE=local.
+
+Usage:
+    python bench/stub_model_server.py --port 8089 --latency 2.0 --response-bytes 8000
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_backends import sample_report  # noqa: E402
+
+
+def build_report(response_bytes):
+    """Returns the sample report padded or truncated to about response_bytes."""
+    report = sample_report()
+    filler = '\nKeep practising the funnel: Thinking, Explore, then Narrow/Confirm.'
+    while len(report.encode('utf-8')) < response_bytes:
+        report += filler
+    return report.encode('utf-8')[:max(response_bytes, 1)].decode('utf-8', errors='ignore')
+
+
+class StubModelServer:
+    """Threaded HTTP server that imitates the generateContent endpoints."""
+
+    def __init__(self, latency=1.0, response_bytes=8000, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.report = build_report(response_bytes)
+        self.calls = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request_bytes = len(self.rfile.read(length))
+                server.calls += 1
+                time.sleep(server.latency)
+
+                def body(text):
+                    return {
+                        'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP'}],
+                        'usageMetadata': {
+                            'promptTokenCount': request_bytes // 4,
+                            'candidatesTokenCount': len(server.report) // 4,
+                            'totalTokenCount': (request_bytes + len(server.report)) // 4,
+                        },
+                    }
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if ':streamGenerateContent' in self.path:
+                    # The SDK's REST transport expects a streamed JSON array of responses
+                    self.end_headers()
+                    lines = server.report.splitlines(keepends=True)
+                    self.wfile.write(b'[')
+                    for i, line in enumerate(lines):
+                        self.wfile.write((b',' if i else b'') + json.dumps(body(line)).encode('utf-8'))
+                        self.wfile.flush()
+                    self.wfile.write(b']')
+                else:
+                    data = json.dumps(body(server.report)).encode('utf-8')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://{host}:{self._httpd.server_port}'
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a stub Gemini REST server.')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds before each response')
+    parser.add_argument('--response-bytes', type=int, default=8000, help='Approximate report size')
+    args = parser.parse_args(argv)
+
+    stub = StubModelServer(args.latency, args.response_bytes, port=args.port)
+    print(f'Stub model server listening on {stub.url}')
+    try:
+        stub._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Configuration objects for app.create_app().
+
+The class is picked by name with the APP_CONFIG environment variable
+(development, production or testing; production by default) or passed to
+create_app() directly. They hold the settings of the Flask app itself; the
+analysis settings (backend, cache sizes, limits, ...) are read from the
+environment in app.py as before, since they are shared with background threads
+that run outside any app context.
+"""
+import os
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24)
+    DEBUG = False
+    TESTING = False
+    # Minified, content-hashed and precompressed copies of static/, served under /assets
+    ASSETS_ENABLED = os.environ.get('ASSETS_ENABLED', 'true').lower() == 'true'
+    ASSET_BUILD_DIR = os.environ.get('ASSET_BUILD_DIR')  # None: <instance>/assets
+    # Warm up (app.warm_up) inside create_app(); servers that fork after creating the app do it per worker instead
+    WARM_UP_ON_CREATE = True
+
+
+class DevelopmentConfig(Config):
+    DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+
+
+class ProductionConfig(Config):
+    # gunicorn.conf.py and the ASGI lifespan warm each worker up after it starts
+    WARM_UP_ON_CREATE = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    ASSETS_ENABLED = False
+    WARM_UP_ON_CREATE = False
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    """The configuration class called `name`, else the one APP_CONFIG names."""
+    name = name or os.environ.get('APP_CONFIG', 'production')
+    if name not in CONFIGS:
+        raise ValueError(f"Unknown APP_CONFIG '{name}'. Use one of: {', '.join(CONFIGS)}.")
+    return CONFIGS[name]
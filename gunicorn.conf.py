@@ -0,0 +1,32 @@
+"""gunicorn settings for production; run.sh starts `gunicorn -c gunicorn.conf.py`.
+
+The master creates the app once (preload_app) - imports, asset build, stores -
+and forks the workers from it, so that cost is paid once however many workers
+there are. Model clients are not created in the master: the SDK's gRPC channels
+must not be shared across a fork, so each worker warms up (app.warm_up) after
+it starts, before it accepts connections.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Analyses wait on the model for minutes, so each worker serves its requests on threads
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# Also the time a new worker has to finish warming up
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Lets in-flight analyses finish on shutdown (UPSTREAM_DEADLINE_SECONDS is 300 by default)
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 300))
+keepalive = 75
+backlog = 4096
+# Heartbeat files on tmpfs, so a slow disk can't get workers killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def post_worker_init(worker):
+    import app
+    app.warm_up()
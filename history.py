@@ -0,0 +1,329 @@
+"""Persistent history of finished analyses, with per-rep and per-team rollups.
+
+Once a result had been sent to the browser it was gone, so comparing reps
+meant re-running old transcripts through the model. Every successful analysis
+is now written to a SQLite file: rep names, team, timestamp, prompt version,
+final score and band, category scores and the report text (not the
+transcript). Rows are indexed by rep and date, and by team and date; reps and
+teams are matched by name_key, so "Sales", "sales" and "Sales " are one team.
+
+The rep and team rollups are materialised tables updated in the same
+transaction as each insert (count, score sum, best, worst, per-category sums),
+so the leaderboard reads a handful of rows instead of aggregating the whole
+history. An analysis is recorded once per result key: re-submitting the same
+transcript does not count it twice. Nor does analysing a call in two halves:
+the incremental analysis of the whole call supersedes the one of its first
+part, which leaves the history listing and the rollups (see record).
+"""
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+REP = 'rep'
+TEAM = 'team'
+SCOPES = (REP, TEAM)
+
+NO_TEAM = ''
+
+_team = contextvars.ContextVar('history_team', default=NO_TEAM)
+
+
+@contextmanager
+def for_team(team):
+    """Records analyses finished inside the block under this team."""
+    token = _team.set(_display_name(team or ''))
+    try:
+        yield
+    finally:
+        _team.reset(token)
+
+
+def current_team():
+    return _team.get()
+
+
+def _display_name(name):
+    return re.sub(r'\s+', ' ', name).strip()
+
+
+def name_key(name):
+    """Case- and whitespace-insensitive key for a rep or team name."""
+    return _display_name(name).casefold()
+
+
+def split_names(names):
+    """Display names from a comma-separated list, de-duplicated by name_key, in order."""
+    seen = {}
+    for part in (names or '').split(','):
+        name = _display_name(part)
+        if name and name_key(name) not in seen:
+            seen[name_key(name)] = name
+    return list(seen.values())
+
+
+class HistoryStore:
+    """SQLite-backed analysis history with incrementally maintained rollups."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS analyses ('
+                ' id INTEGER PRIMARY KEY, result_key TEXT NOT NULL UNIQUE,'
+                ' created_at REAL NOT NULL, prompt_version TEXT NOT NULL,'
+                ' sales_rep_names TEXT NOT NULL, merchant_names TEXT, team TEXT NOT NULL,'
+                ' final_score REAL, max_score REAL, band TEXT,'
+                ' categories TEXT NOT NULL, analysis_text TEXT NOT NULL, superseded_by INTEGER,'
+                " team_key TEXT NOT NULL DEFAULT '')"
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(analyses)')}
+            # Histories written before analyses could be superseded
+            if 'superseded_by' not in columns:
+                conn.execute('ALTER TABLE analyses ADD COLUMN superseded_by INTEGER')
+            # Histories written before teams were matched by name_key
+            if 'team_key' not in columns:
+                conn.execute("ALTER TABLE analyses ADD COLUMN team_key TEXT NOT NULL DEFAULT ''")
+                rows = conn.execute('SELECT id, team FROM analyses').fetchall()
+                conn.executemany('UPDATE analyses SET team_key = ? WHERE id = ?',
+                                 [(name_key(team), analysis_id) for analysis_id, team in rows])
+            conn.execute('DROP INDEX IF EXISTS analyses_team')
+            conn.execute('CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS analyses_team_key ON analyses (team_key, created_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS analysis_reps ('
+                ' rep_key TEXT NOT NULL, created_at REAL NOT NULL, analysis_id INTEGER NOT NULL,'
+                ' PRIMARY KEY (rep_key, created_at, analysis_id)) WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rollups ('
+                ' scope TEXT NOT NULL, key TEXT NOT NULL, name TEXT NOT NULL, team TEXT NOT NULL,'
+                ' analyses INTEGER NOT NULL, score_sum REAL NOT NULL,'
+                ' best REAL NOT NULL, worst REAL NOT NULL, last_at REAL NOT NULL,'
+                " team_key TEXT NOT NULL DEFAULT '', PRIMARY KEY (scope, key))"
+            )
+            if 'team_key' not in {row[1] for row in conn.execute('PRAGMA table_info(rollups)')}:
+                conn.execute("ALTER TABLE rollups ADD COLUMN team_key TEXT NOT NULL DEFAULT ''")
+                rows = conn.execute('SELECT scope, key, team FROM rollups').fetchall()
+                conn.executemany('UPDATE rollups SET team_key = ? WHERE scope = ? AND key = ?',
+                                 [(name_key(team), scope, key) for scope, key, team in rows])
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS category_rollups ('
+                ' scope TEXT NOT NULL, key TEXT NOT NULL, category TEXT NOT NULL,'
+                ' analyses INTEGER NOT NULL, score_sum REAL NOT NULL, max_sum REAL NOT NULL,'
+                ' PRIMARY KEY (scope, key, category))'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, result_key, prompt_version, sales_rep_names, merchant_names, payload, team=None,
+               supersedes=None):
+        """Stores one successful /analyze payload; returns its id, or None if the key was already recorded.
+
+        `supersedes` is the result key of an analysis this one replaces, such as
+        the first part of a call it continues; that analysis is kept, marked
+        superseded_by this one, and taken out of the history listing and rollups.
+        """
+        report = payload.get('report') or {}
+        categories = [{'name': c['name'], 'score': c['score'], 'max': c['max']} for c in report.get('categories', [])]
+        final_score = report.get('final_score')
+        team = _display_name(current_team() if team is None else team)
+        reps = split_names(sales_rep_names)
+        now = time.time()
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO analyses (result_key, created_at, prompt_version, sales_rep_names,'
+                ' merchant_names, team, team_key, final_score, max_score, band, categories, analysis_text)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (result_key, now, prompt_version, ', '.join(reps), merchant_names, team, name_key(team), final_score,
+                 report.get('max_score'), report.get('band'), json.dumps(categories), payload['analysis_text']),
+            )
+            if cursor.rowcount != 1:
+                return None
+            analysis_id = cursor.lastrowid
+            conn.executemany('INSERT OR IGNORE INTO analysis_reps (rep_key, created_at, analysis_id) VALUES (?, ?, ?)',
+                             [(name_key(rep), now, analysis_id) for rep in reps])
+
+            # Partial reports without a final score are kept in the history but not ranked
+            if final_score is not None:
+                scopes = [(REP, name_key(rep), rep) for rep in reps]
+                if team:
+                    scopes.append((TEAM, name_key(team), team))
+                for scope, key, name in scopes:
+                    self._roll_up(conn, scope, key, name, team, final_score, categories, now)
+            if supersedes is not None:
+                self._supersede(conn, supersedes, analysis_id)
+        return analysis_id
+
+    def _supersede(self, conn, result_key, analysis_id):
+        row = conn.execute('SELECT id, sales_rep_names, team, final_score, categories FROM analyses'
+                           ' WHERE result_key = ? AND superseded_by IS NULL AND id != ?',
+                           (result_key, analysis_id)).fetchone()
+        if row is None:
+            return
+        old_id, sales_rep_names, team, final_score, categories = row
+        conn.execute('UPDATE analyses SET superseded_by = ? WHERE id = ?', (analysis_id, old_id))
+        if final_score is not None:
+            scopes = [(REP, name_key(rep)) for rep in split_names(sales_rep_names)]
+            if team:
+                scopes.append((TEAM, name_key(team)))
+            for scope, key in scopes:
+                self._roll_back(conn, scope, key, final_score, json.loads(categories))
+
+    @staticmethod
+    def _roll_up(conn, scope, key, name, team, score, categories, now):
+        conn.execute(
+            'INSERT INTO rollups (scope, key, name, team, team_key, analyses, score_sum, best, worst, last_at)'
+            ' VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)'
+            ' ON CONFLICT (scope, key) DO UPDATE SET'
+            '  name = excluded.name, team = CASE WHEN excluded.team != \'\' THEN excluded.team ELSE team END,'
+            '  team_key = CASE WHEN excluded.team_key != \'\' THEN excluded.team_key ELSE team_key END,'
+            '  analyses = analyses + 1, score_sum = score_sum + excluded.score_sum,'
+            '  best = max(best, excluded.best), worst = min(worst, excluded.worst),'
+            '  last_at = max(last_at, excluded.last_at)',
+            (scope, key, name, team, name_key(team), score, score, score, now),
+        )
+        conn.executemany(
+            'INSERT INTO category_rollups (scope, key, category, analyses, score_sum, max_sum)'
+            ' VALUES (?, ?, ?, 1, ?, ?)'
+            ' ON CONFLICT (scope, key, category) DO UPDATE SET'
+            '  analyses = analyses + 1, score_sum = score_sum + excluded.score_sum,'
+            '  max_sum = max_sum + excluded.max_sum',
+            [(scope, key, category['name'], category['score'], category['max']) for category in categories],
+        )
+
+    @staticmethod
+    def _roll_back(conn, scope, key, score, categories):
+        """Takes a superseded analysis out of a rollup; best, worst and last_at come from the analyses left."""
+        if scope == REP:
+            source, condition = 'analysis_reps r JOIN analyses a ON a.id = r.analysis_id', 'r.rep_key = ?'
+        else:
+            source, condition = 'analyses a', 'a.team_key = ?'
+        best, worst, last_at = conn.execute(
+            f'SELECT max(a.final_score), min(a.final_score), max(a.created_at) FROM {source}'
+            f' WHERE {condition} AND a.final_score IS NOT NULL AND a.superseded_by IS NULL', (key,),
+        ).fetchone()
+        if best is None:
+            conn.execute('DELETE FROM rollups WHERE scope = ? AND key = ?', (scope, key))
+            conn.execute('DELETE FROM category_rollups WHERE scope = ? AND key = ?', (scope, key))
+            return
+        conn.execute(
+            'UPDATE rollups SET analyses = analyses - 1, score_sum = score_sum - ?, best = ?, worst = ?, last_at = ?'
+            ' WHERE scope = ? AND key = ?',
+            (score, best, worst, last_at, scope, key),
+        )
+        conn.executemany(
+            'UPDATE category_rollups SET analyses = analyses - 1, score_sum = score_sum - ?, max_sum = max_sum - ?'
+            ' WHERE scope = ? AND key = ? AND category = ?',
+            [(category['score'], category['max'], scope, key, category['name']) for category in categories],
+        )
+        conn.execute('DELETE FROM category_rollups WHERE scope = ? AND key = ? AND analyses <= 0', (scope, key))
+
+    @staticmethod
+    def _entry(row, with_text=False):
+        entry = {
+            'id': row[0], 'created_at': row[1], 'prompt_version': row[2], 'sales_rep_names': row[3],
+            'merchant_names': row[4], 'team': row[5] or None, 'final_score': row[6], 'max_score': row[7],
+            'band': row[8], 'categories': json.loads(row[9]), 'superseded_by': row[11],
+        }
+        if with_text:
+            entry['analysis_text'] = row[10]
+        return entry
+
+    _COLUMNS = ('a.id, a.created_at, a.prompt_version, a.sales_rep_names, a.merchant_names, a.team,'
+                ' a.final_score, a.max_score, a.band, a.categories, a.analysis_text, a.superseded_by')
+
+    def get(self, analysis_id):
+        """Returns one analysis with its report text, or None."""
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT {self._COLUMNS} FROM analyses a WHERE a.id = ?', (analysis_id,)).fetchone()
+        return None if row is None else self._entry(row, with_text=True)
+
+    def find(self, result_key):
+        """Returns the analysis recorded under a result key, with its report text, or None."""
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT {self._COLUMNS} FROM analyses a WHERE a.result_key = ?',
+                               (result_key,)).fetchone()
+        return None if row is None else self._entry(row, with_text=True)
+
+    def history(self, rep=None, team=None, since=None, until=None, before=None, limit=50):
+        """Analyses newest first, optionally for one rep and/or team and a created_at range.
+
+        Superseded analyses are left out (see record); get() still returns them.
+        Keyset-paginated: pass the `next` cursor from one page as `before` to get
+        the next. Returns (entries, next_cursor), next_cursor None on the last page.
+        """
+        where, params = ['a.superseded_by IS NULL'], []
+        if rep:
+            source = 'analysis_reps r JOIN analyses a ON a.id = r.analysis_id'
+            order = 'r.created_at DESC, r.analysis_id DESC'
+            created, ident = 'r.created_at', 'r.analysis_id'
+            where.append('r.rep_key = ?')
+            params.append(name_key(rep))
+        else:
+            source = 'analyses a'
+            order = 'a.created_at DESC, a.id DESC'
+            created, ident = 'a.created_at', 'a.id'
+        if team:
+            where.append('a.team_key = ?')
+            params.append(name_key(team))
+        if since is not None:
+            where.append(f'{created} >= ?')
+            params.append(since)
+        if until is not None:
+            where.append(f'{created} < ?')
+            params.append(until)
+        if before is not None:
+            where.append(f'({created}, {ident}) < (?, ?)')
+            params += list(before)
+
+        sql = f"SELECT {self._COLUMNS} FROM {source} WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?"
+        with self._connect() as conn:
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        entries = [self._entry(row) for row in rows[:limit]]
+        next_cursor = (entries[-1]['created_at'], entries[-1]['id']) if len(rows) > limit else None
+        return entries, next_cursor
+
+    def leaderboard(self, scope=REP, team=None, min_analyses=1, offset=0, limit=50):
+        """Reps (or teams) ranked by average final score, with per-category averages.
+
+        Returns (entries, total) where total counts every ranked row, for paging.
+        """
+        where = ['scope = ?', 'analyses >= ?']
+        params = [scope, max(1, min_analyses)]
+        if team:
+            where.append('team_key = ?')
+            params.append(name_key(team))
+        condition = ' AND '.join(where)
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT count(*) FROM rollups WHERE {condition}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT key, name, team, analyses, score_sum, best, worst, last_at FROM rollups WHERE {condition}'
+                ' ORDER BY score_sum / analyses DESC, analyses DESC, key LIMIT ? OFFSET ?',
+                params + [limit, offset],
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            categories = {}
+            if keys:
+                for key, category, count, score_sum, max_sum in conn.execute(
+                        'SELECT key, category, analyses, score_sum, max_sum FROM category_rollups'
+                        f' WHERE scope = ? AND key IN ({",".join("?" * len(keys))}) ORDER BY rowid',
+                        [scope] + keys):
+                    categories.setdefault(key, []).append({
+                        'name': category, 'analyses': count,
+                        'average_score': round(score_sum / count, 2), 'average_max': round(max_sum / count, 2),
+                    })
+
+        entries = [{
+            'rank': offset + index + 1, 'name': name, 'team': team or None, 'analyses': count,
+            'average_score': round(score_sum / count, 2), 'best_score': best, 'worst_score': worst,
+            'last_analysis_at': last_at, 'categories': categories.get(key, []),
+        } for index, (key, name, team, count, score_sum, best, worst, last_at) in enumerate(rows)]
+        return entries, total
@@ -0,0 +1,200 @@
+"""Incremental re-analysis of a transcript that extends an analysed one.
+
+Coaches often paste the first half of a call, read the result, then paste the
+whole call, which used to be analysed again from the start. Every successful
+analysis now leaves its funnel state in a SQLite file: the report itself
+(funnels with their classified rep questions and open/complete status,
+pains, motivations, commitments and category scores), keyed by a digest of
+the transcript's utterances.
+
+find() looks for the longest stored transcript that the new one extends: its
+utterances are a prefix of the new ones, except that its last utterance may
+have been cut short when it was pasted. Lookups hash each prefix of the new
+utterance list once and probe an index, so the cost does not depend on how
+many transcripts are stored.
+
+The model is then sent only the utterances after that prefix, with a compact
+summary of the stored state (state_summary), and the two reports are merged
+(long_transcripts.merge_reports with `continues`). Input and output tokens and
+the model's latency therefore scale with the new material.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import long_transcripts
+import prompt
+import report_parser
+import scoring
+import transcripts
+
+# Extensions of a very short earlier transcript are analysed from scratch
+MIN_PREFIX_UTTERANCES = 4
+# Digests per IN (...) probe, under SQLite's parameter limit
+PROBE_BATCH = 500
+# Quotes are shortened to this many characters in the state summary
+SUMMARY_QUOTE_CHARS = 160
+
+QUESTION_LABELS = ('thinking', 'explore', 'narrow', 'sweeper')
+# Sentinels about the new utterances on their own, which say nothing of the whole transcript
+PARTIAL_SENTINELS = ('NEED_SPEAKER_ROLES', 'UNSUPPORTED_INPUT')
+
+
+def _digests(utterances):
+    """Yields (length, digest of utterances[:length]) for every prefix, shortest first."""
+    hasher = hashlib.sha256()
+    yield 0, hasher.hexdigest()
+    for length, utterance in enumerate(utterances, start=1):
+        hasher.update(f'{utterance.speaker}\x1f{utterance.text}\x1e'.encode('utf-8'))
+        yield length, hasher.hexdigest()
+
+
+def _names_key(sales_rep_names, merchant_names):
+    return json.dumps([transcripts.normalise_names(sales_rep_names), transcripts.normalise_names(merchant_names)])
+
+
+class FunnelStateStore:
+    """SQLite-backed funnel states of analysed transcripts, found by transcript prefix."""
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # head_digest covers every utterance but the last, which may have been cut short
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS funnel_states ('
+                ' result_key TEXT PRIMARY KEY, version TEXT NOT NULL, names_key TEXT NOT NULL,'
+                ' head_digest TEXT NOT NULL, utterances INTEGER NOT NULL,'
+                ' last_speaker TEXT NOT NULL, last_text TEXT NOT NULL,'
+                ' report TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS funnel_states_head'
+                         ' ON funnel_states (head_digest, version, names_key)')
+            conn.execute('CREATE INDEX IF NOT EXISTS funnel_states_created ON funnel_states (created_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, result_key, version, sales_rep_names, merchant_names, utterances, report):
+        """Stores the funnel state (the parsed report) of an analysed transcript, once per result key."""
+        if len(utterances) < MIN_PREFIX_UTTERANCES or not report.get('categories'):
+            return
+        _, head_digest = list(_digests(utterances[:-1]))[-1]
+        last = utterances[-1]
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO funnel_states (result_key, version, names_key, head_digest, utterances,'
+                ' last_speaker, last_text, report, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (result_key, version, _names_key(sales_rep_names, merchant_names), head_digest, len(utterances),
+                 last.speaker, last.text, json.dumps(report), time.time()),
+            )
+            if cursor.rowcount == 1 and self.max_entries:
+                conn.execute('DELETE FROM funnel_states WHERE result_key IN (SELECT result_key FROM funnel_states'
+                             ' ORDER BY created_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def find(self, version, sales_rep_names, merchant_names, utterances):
+        """Returns the state of the longest analysed transcript that `utterances` extend, or None.
+
+        The match is a dict with result_key, report, created_at, utterances (the
+        earlier transcript's length) and resume_at: the index of the first
+        utterance the model has not seen, which is the earlier last utterance
+        itself when it has grown since.
+        """
+        heads = {}
+        # A stored head of `length` utterances, plus its last one, must leave at least one more to analyse
+        for length, digest in _digests(utterances[:-1]):
+            if length >= MIN_PREFIX_UTTERANCES - 1:
+                heads[digest] = length
+        if not heads:
+            return None
+
+        names_key = _names_key(sales_rep_names, merchant_names)
+        digests = list(heads)
+        rows = []
+        with self._connect() as conn:
+            for start in range(0, len(digests), PROBE_BATCH):
+                batch = digests[start:start + PROBE_BATCH]
+                rows += conn.execute(
+                    'SELECT result_key, head_digest, last_speaker, last_text, report, created_at FROM funnel_states'
+                    f" WHERE head_digest IN ({', '.join('?' * len(batch))}) AND version = ? AND names_key = ?",
+                    batch + [version, names_key],
+                ).fetchall()
+
+        best = None
+        for result_key, head_digest, last_speaker, last_text, report, created_at in rows:
+            length = heads[head_digest]
+            current = utterances[length]
+            if current.speaker != last_speaker or not current.text.startswith(last_text):
+                continue
+            resume_at = length + 1 if current.text == last_text else length
+            if resume_at >= len(utterances):
+                continue  # the same transcript, which the result cache answers
+            # The longest earlier transcript, and the latest analysis of it
+            if best is None or (length + 1, created_at) > (best['utterances'], best['created_at']):
+                best = {'result_key': result_key, 'report': report, 'created_at': created_at,
+                        'utterances': length + 1, 'resume_at': resume_at}
+        if best is not None:
+            best['report'] = json.loads(best['report'])
+        return best
+
+
+def _short(text):
+    text = ' '.join(text.split())
+    return text if len(text) <= SUMMARY_QUOTE_CHARS else text[:SUMMARY_QUOTE_CHARS - 1] + '…'
+
+
+def is_open(funnel):
+    """True for a funnel that has not earned its execution points yet, so may still be completed."""
+    return (funnel['execution_points'] or 0) < scoring.POINTS_PER_FUNNEL
+
+
+def state_summary(report):
+    """A compact plain-text summary of a report's funnel state, for the continuation prompt."""
+    lines = ['Category scores so far:']
+    lines += [f"- {category['name']}: {category['score']:g}/{category['max']:g}" for category in report['categories']]
+
+    lines += ['', 'Funnels so far:']
+    for funnel in report['funnels']:
+        questions = [f"{item['label']}: {_short(item['text'])}" for item in funnel['items']
+                     if (item['label'] or '').casefold().startswith(QUESTION_LABELS)]
+        status = 'OPEN - may be continued' if is_open(funnel) else 'complete'
+        lines.append(f"- {funnel['id']} ({status})" + (f": {'; '.join(questions)}" if questions else ''))
+    if not report['funnels']:
+        lines.append('- none')
+
+    for entry in report['aggregate_lists']:
+        if entry['items']:
+            lines += ['', f"{entry['title']}:"]
+            lines += [f"- ({item['funnel'] or 'General'}) {_short(item['text'])}" for item in entry['items']]
+    return '\n'.join(lines)
+
+
+def continue_analysis(earlier, utterances, fields, run_prompt):
+    """Analyses the utterances after an earlier transcript and merges the result into its report.
+
+    `utterances` are those of the whole (normalised) transcript and
+    `run_prompt(user_prompt)` returns (payload, status) like app.run_prompt.
+    Returns the merged (payload, status), or the model's sentinel payload
+    unchanged: a continuation that isn't a report has nothing to merge.
+    """
+    _, sales_rep_names, merchant_names = fields
+    new = utterances[earlier['resume_at']:]
+    report = earlier['report']
+    user_prompt = prompt.build_continuation_prompt(transcripts.compact(new), sales_rep_names, merchant_names,
+                                                   state_summary(report), earlier['resume_at'],
+                                                   len(report['funnels']) + 1)
+    payload, status = run_prompt(user_prompt)
+    if status != 200 or payload.get('is_error'):
+        return payload, status
+    merged = long_transcripts.merge_reports([report, payload['report']], continues=True)
+    return {
+        'analysis_text': report_parser.render_report(merged),
+        'report': merged,
+        'score_issues': [],
+        'incremental': {'analysed_at': earlier['created_at'], 'earlier_utterances': earlier['resume_at'],
+                        'new_utterances': len(new)},
+    }, 200
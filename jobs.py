@@ -0,0 +1,145 @@
+"""Background job queue for analyses that outlive the HTTP request.
+
+Jobs run on a bounded thread pool inside the web process. Their state and
+results are written to a SQLite file, so any worker process can answer a status
+poll and a finished analysis survives the browser disconnecting.
+
+A job dies with its process (a deploy, a recycled worker). Each process
+touches its own queued and running jobs whenever one of them starts or
+finishes, so a job left untouched for longer than `stale_seconds` has lost
+its process: it is marked failed as interrupted on startup, on submit and
+when polled, rather than staying queued forever.
+"""
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+INTERRUPTED_ERROR = 'The analysis was interrupted before it finished. Please submit it again.'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised when a process already holds its maximum number of pending jobs."""
+
+
+class JobQueue:
+    """Runs `run(fields)` for submitted jobs on a fixed number of worker threads.
+
+    `run` must return a (payload, status) pair; jobs whose status is not 200 are
+    recorded as failed with that payload. `stale_seconds` should exceed the
+    longest a job can run.
+    """
+
+    def __init__(self, path, run, max_workers=4, max_queued=200, ttl_seconds=24 * 3600, stale_seconds=3600):
+        self.path = path
+        self.run = run
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._live = set()  # ids of this process's queued and running jobs
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, status TEXT NOT NULL,'
+                ' created_at REAL NOT NULL, updated_at REAL NOT NULL,'
+                ' result TEXT, result_status INTEGER)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)')
+            self._expire(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _expire(self, conn):
+        """Deletes jobs past their TTL and fails the queued or running jobs of processes that have gone."""
+        now = time.time()
+        with self._lock:
+            live = list(self._live)
+        mine = f" AND id NOT IN ({', '.join('?' * len(live))})" if live else ''
+        conn.execute(f'DELETE FROM jobs WHERE updated_at < ?{mine}', [now - self.ttl_seconds] + live)
+        conn.execute(
+            f'UPDATE jobs SET status = ?, updated_at = ?, result = ?, result_status = ?'
+            f' WHERE status IN (?, ?) AND updated_at < ?{mine}',
+            [FAILED, now, json.dumps({'error': INTERRUPTED_ERROR}), 500, QUEUED, RUNNING,
+             now - self.stale_seconds] + live,
+        )
+
+    def _touch(self):
+        """Marks this process's queued and running jobs as still alive."""
+        with self._lock:
+            live = list(self._live)
+        if live:
+            with self._connect() as conn:
+                conn.execute(f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(live))})",
+                             [time.time()] + live)
+
+    def _update(self, job_id, status, result=None, result_status=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ?, result = ?, result_status = ? WHERE id = ?',
+                (status, time.time(), json.dumps(result) if result is not None else None, result_status, job_id),
+            )
+
+    @property
+    def pending(self):
+        """Number of jobs queued or running in this process."""
+        return len(self._live)
+
+    def submit(self, fields, **options):
+        """Enqueues one analysis and returns its job id; `options` are passed on to `run`."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if len(self._live) >= self.max_queued:
+                raise QueueFull()
+            self._live.add(job_id)
+
+        now = time.time()
+        with self._connect() as conn:
+            self._expire(conn)
+            conn.execute('INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                         (job_id, QUEUED, now, now))
+        # Run in a copy of the submitter's context so the job's model calls are attributed to them
+        self._executor.submit(contextvars.copy_context().run, self._execute, job_id, fields, options)
+        return job_id
+
+    def _execute(self, job_id, fields, options):
+        try:
+            self._update(job_id, RUNNING)
+            self._touch()
+            payload, status = self.run(fields, **options)
+            self._update(job_id, DONE if status == 200 else FAILED, payload, status)
+        except Exception as e:
+            self._update(job_id, FAILED, {'error': f'An error occurred processing your request: {str(e)}'}, 500)
+        finally:
+            with self._lock:
+                self._live.discard(job_id)
+            self._touch()
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it is unknown or has expired."""
+        with self._connect() as conn:
+            self._expire(conn)
+            row = conn.execute(
+                'SELECT status, created_at, updated_at, result, result_status FROM jobs WHERE id = ?',
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {'job_id': job_id, 'status': row[0], 'created_at': row[1], 'updated_at': row[2]}
+        if row[3] is not None:
+            job['result'] = json.loads(row[3])
+            job['result_status'] = row[4]
+        return job
@@ -0,0 +1,226 @@
+"""Model backends used to run analyses.
+
+Every backend is built once per (backend, model, generation config) and reused
+for the life of the process; get_backend() hands out the shared instance.
+
+* GeminiBackend - the real model, primed with the rubric via a prefix cache.
+* FakeBackend - deterministic canned reports with configurable latency, for
+  load tests, profiling and local development without spending quota.
+
+Backends expose:
+    generate(user_prompt, timeout=None) -> response with .text, .prompt_feedback, .usage_metadata
+    stream(user_prompt, timeout=None)   -> iterator of text chunks
+    agenerate / astream                 -> coroutine / async iterator versions, for the ASGI app
+    warm_up()             -> creates the model client ahead of the first call
+    is_configured         -> False when the backend cannot make calls
+
+The Gemini SDK is imported on first use (see gemini_sdk), not with this module.
+"""
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import prompt
+
+_sdk = None
+_sdk_options = None
+_sdk_lock = threading.Lock()
+
+
+def configure_gemini(api_key, api_endpoint=None):
+    """Sets the options the SDK is configured with when gemini_sdk() first imports it.
+
+    `api_endpoint` points the SDK at another REST endpoint, e.g. the benchmark stub server.
+    """
+    global _sdk_options
+    if api_endpoint:
+        _sdk_options = {'api_key': api_key, 'transport': 'rest', 'client_options': {'api_endpoint': api_endpoint}}
+    else:
+        _sdk_options = {'api_key': api_key}
+
+
+def gemini_sdk():
+    """Returns google.generativeai, importing and configuring it on the first call.
+
+    The import takes about a second and starts gRPC, whose channels don't survive
+    a fork, so it is left to the worker processes (see app.warm_up) and never
+    happens at all with the fake backend.
+    """
+    global _sdk
+    if _sdk is None:
+        with _sdk_lock:
+            if _sdk is None:
+                import google.generativeai as genai
+                if _sdk_options:
+                    genai.configure(**_sdk_options)
+                _sdk = genai
+    return _sdk
+
+
+class GeminiBackend:
+    """Calls Gemini through one long-lived GenerativeModel per prefix-cache entry."""
+
+    name = 'gemini'
+
+    def __init__(self, model_name, generation_config, api_key=None, prefix=None, native_async=True):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.api_key = api_key
+        self.prefix = prefix
+        # The SDK's async client needs the gRPC transport; over REST the async methods run in a thread
+        self.native_async = native_async
+
+    @property
+    def is_configured(self):
+        return bool(self.api_key)
+
+    def _model(self):
+        # The prefix cache memoises models, so this is a dict lookup after the first call
+        return self.prefix.model_for(self.model_name, self.generation_config)
+
+    def warm_up(self):
+        if self.is_configured:
+            self._model()
+
+    @staticmethod
+    def _request_options(timeout):
+        # Retries are handled by upstream.ResilientBackend, so turn off the client library's own
+        return {'timeout': timeout, 'retry': None} if timeout else None
+
+    def generate(self, user_prompt, timeout=None):
+        return self._model().generate_content(user_prompt, request_options=self._request_options(timeout))
+
+    def stream(self, user_prompt, timeout=None):
+        for chunk in self._model().generate_content(user_prompt, stream=True,
+                                                    request_options=self._request_options(timeout)):
+            # Safety or finish-only chunks carry no parts, and .text raises on those
+            text = ''.join(getattr(part, 'text', '') for part in chunk.parts)
+            if text:
+                yield text
+
+    async def agenerate(self, user_prompt, timeout=None):
+        if not self.native_async:
+            return await asyncio.to_thread(self.generate, user_prompt, timeout)
+        return await self._model().generate_content_async(user_prompt, request_options=self._request_options(timeout))
+
+    async def astream(self, user_prompt, timeout=None):
+        if not self.native_async:
+            async for text in _iterate_in_thread(self.stream(user_prompt, timeout)):
+                yield text
+            return
+        response = await self._model().generate_content_async(user_prompt, stream=True,
+                                                               request_options=self._request_options(timeout))
+        async for chunk in response:
+            text = ''.join(getattr(part, 'text', '') for part in chunk.parts)
+            if text:
+                yield text
+
+
+async def _iterate_in_thread(iterator):
+    """Drives a blocking iterator from a worker thread, one item at a time."""
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def sample_report():
+    """Returns the sample report from the rubric's output template."""
+    start = prompt.RUBRIC.index('Final Score:')
+    return prompt.RUBRIC[start:prompt.RUBRIC.index('```', start)].strip()
+
+
+class FakeBackend:
+    """Returns canned reports after a fixed delay; the same prompt always gets the same report.
+
+    Reports are read from `reports_dir` (*.txt) when given, otherwise the sample
+    report from the rubric's output template is used.
+    """
+
+    name = 'fake'
+    is_configured = True
+
+    def __init__(self, model_name, generation_config, latency=0.0, reports_dir=None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.latency = latency
+        self.reports = []
+        if reports_dir:
+            for path in sorted(glob.glob(os.path.join(reports_dir, '*.txt'))):
+                with open(path, encoding='utf-8') as f:
+                    self.reports.append(f.read().strip())
+        if not self.reports:
+            self.reports.append(sample_report())
+
+    def warm_up(self):
+        pass  # the reports are read in __init__
+
+    def _report_for(self, user_prompt):
+        digest = hashlib.sha256(user_prompt.encode('utf-8')).digest()
+        return self.reports[int.from_bytes(digest[:4], 'big') % len(self.reports)]
+
+    def generate(self, user_prompt, timeout=None):
+        text = self._report_for(user_prompt)
+        if timeout is not None and self.latency > timeout:
+            time.sleep(max(0, timeout))
+            raise TimeoutError(f'Fake model call timed out after {timeout:.1f}s')
+        time.sleep(self.latency)
+        return self._response(user_prompt, text)
+
+    def _response(self, user_prompt, text):
+        return SimpleNamespace(
+            text=text,
+            prompt_feedback=None,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=(len(prompt.RUBRIC) + len(user_prompt)) // 4,
+                candidates_token_count=len(text) // 4,
+            ),
+        )
+
+    def stream(self, user_prompt, timeout=None):
+        lines = self._report_for(user_prompt).splitlines(keepends=True)
+        for line in lines:
+            time.sleep(self.latency / len(lines))
+            yield line
+
+    async def agenerate(self, user_prompt, timeout=None):
+        text = self._report_for(user_prompt)
+        if timeout is not None and self.latency > timeout:
+            await asyncio.sleep(max(0, timeout))
+            raise TimeoutError(f'Fake model call timed out after {timeout:.1f}s')
+        await asyncio.sleep(self.latency)
+        return self._response(user_prompt, text)
+
+    async def astream(self, user_prompt, timeout=None):
+        lines = self._report_for(user_prompt).splitlines(keepends=True)
+        for line in lines:
+            await asyncio.sleep(self.latency / len(lines))
+            yield line
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name, model_name, generation_config, **options):
+    """Returns the shared backend instance for this backend name, model and config."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'. Use one of: {', '.join(BACKENDS)}.")
+    key = (name, model_name, json.dumps(generation_config, sort_keys=True))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = BACKENDS[name](model_name, generation_config, **options)
+    return backend
@@ -0,0 +1,185 @@
+"""Map-reduce analysis for transcripts too long to score well in one call.
+
+The utterance stream is split into overlapping windows, cutting where possible
+just before a rep's Thinking-style question (the usual start of a new funnel).
+Windows are analysed concurrently and the per-window reports are merged:
+funnels are renumbered in call order, a funnel seen in two windows is merged
+into one, repeated quotes from the overlaps are dropped and the 100-point
+total is recomputed. incremental.py merges a report of the rest of a call
+into the report of its start the same way.
+
+Category merge rules: every rubric criterion except funnel execution is met if
+it is met "anywhere in the call", so each of those categories takes the best
+window score (a lower bound on what a single full-call pass would award).
+Funnel execution is recomputed as +10 per complete merged funnel, max 20.
+"""
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import report_parser
+import scoring
+import transcripts
+
+# Open, reflective openers the rubric treats as Thinking questions
+THINKING_OPENER_RE = re.compile(
+    r"^(how|why|what (would|does|do|is|are) .*(mean|impact|affect|goal|priorit|important|achiev))\b",
+    re.IGNORECASE)
+
+FUNNEL_TAG_RE = re.compile(r'\bF(\d+)\b')
+
+
+def is_funnel_boundary(utterance, sales_rep_names):
+    text = utterance.text.strip()
+    return transcripts.is_rep(utterance.speaker, sales_rep_names) and text.endswith('?') and bool(THINKING_OPENER_RE.match(text))
+
+
+def split_windows(utterances, sales_rep_names, max_chars=20000, overlap=6):
+    """Splits utterances into windows of about max_chars, overlapping by `overlap` utterances.
+
+    Each cut is moved back to the latest funnel boundary in the second half of
+    the window when there is one, so funnels are rarely split across windows.
+    """
+    windows = []
+    start = 0
+    while start < len(utterances):
+        size, end = 0, start
+        while end < len(utterances) and (size < max_chars or end == start):
+            size += len(utterances[end].speaker) + len(utterances[end].text) + 3
+            end += 1
+        if end < len(utterances):
+            midpoint = start + (end - start) // 2
+            for candidate in range(end - 1, midpoint, -1):
+                if is_funnel_boundary(utterances[candidate], sales_rep_names):
+                    end = candidate
+                    break
+        windows.append(utterances[start:end])
+        if end >= len(utterances):
+            break
+        start = max(end - overlap, start + 1)
+    return windows
+
+
+def _quote_key(text):
+    return re.sub(r'\W+', ' ', text).strip().casefold()
+
+
+def _retag(text, mapping):
+    return FUNNEL_TAG_RE.sub(lambda m: mapping.get(f'F{m.group(1)}', m.group(0)), text)
+
+
+def _extend_funnel(funnel, later):
+    """Adds the new items of a later sighting of the same funnel; the higher execution points stand."""
+    seen = {_quote_key(item['text']) for item in funnel['items']}
+    funnel['items'] += [item for item in later['items'] if _quote_key(item['text']) not in seen]
+    if (later['execution_points'] or 0) > (funnel['execution_points'] or 0):
+        funnel['execution_points'], funnel['header_note'] = later['execution_points'], later['header_note']
+
+
+def merge_reports(reports, continues=False):
+    """Merges parsed reports of parts of one call (in call order) into one full-call report.
+
+    A funnel is recognised again by its Thinking question. With `continues`,
+    each report was written knowing the funnels before it (see incremental.py),
+    so one that reuses the id of an earlier funnel still open continues it.
+    """
+    merged = report_parser.empty_report()
+    seen_thinking = {}
+    earlier_ids = {}
+    categories = {}
+    lists = {}
+    seen_items = set()
+    seen_tips = set()
+
+    for report in reports:
+        mapping = {}
+        for funnel in report['funnels']:
+            thinking = next((item['text'] for item in funnel['items']
+                             if (item['label'] or '').lower().startswith('thinking')), None)
+            key = _quote_key(thinking) if thinking else None
+            same = seen_thinking.get(key) if key else None
+            if same is None and continues and funnel['id'] in earlier_ids:
+                candidate = merged['funnels'][int(earlier_ids[funnel['id']][1:]) - 1]
+                if (candidate['execution_points'] or 0) < scoring.POINTS_PER_FUNNEL:
+                    same = candidate['id']
+            if same is not None:
+                # Seen again through a window overlap, or continued in a later part
+                mapping[funnel['id']] = same
+                _extend_funnel(merged['funnels'][int(same[1:]) - 1], funnel)
+                continue
+            new_id = f"F{len(merged['funnels']) + 1}"
+            mapping[funnel['id']] = new_id
+            if key:
+                seen_thinking[key] = new_id
+            merged['funnels'].append(dict(funnel, id=new_id, items=list(funnel['items'])))
+        earlier_ids.update(mapping)
+
+        for category in report['categories']:
+            name = category['name'].casefold()
+            if name not in categories or category['score'] > categories[name]['score']:
+                categories[name] = dict(category)
+
+        for entry in report['aggregate_lists']:
+            target = lists.setdefault(entry['title'].casefold(), {'title': entry['title'], 'items': []})
+            for item in entry['items']:
+                key = (entry['title'].casefold(), _quote_key(item['text']))
+                if key not in seen_items:
+                    seen_items.add(key)
+                    target['items'].append(dict(item, funnel=mapping.get(item['funnel'], item['funnel'])))
+
+        for item in report['missed_opportunities']:
+            key = ('missed', _quote_key(item['text']))
+            if key not in seen_items:
+                seen_items.add(key)
+                merged['missed_opportunities'].append(dict(item, funnel=mapping.get(item['funnel'], item['funnel'])))
+
+        for tip in report['coaching_tips']:
+            tip = _retag(tip, mapping)
+            if _quote_key(tip) not in seen_tips:
+                seen_tips.add(_quote_key(tip))
+                merged['coaching_tips'].append(tip)
+
+    if scoring.FUNNEL_EXECUTION in categories:
+        # Recomputed from the merged funnels by scoring.rescore()
+        categories[scoring.FUNNEL_EXECUTION]['note'] = None
+
+    merged['categories'] = list(categories.values())
+    merged['aggregate_lists'] = list(lists.values())
+    merged, _ = scoring.rescore(merged)
+    return merged
+
+
+def analyse_windows(windows, fields, analyse_window, parallelism=4):
+    """Runs analyse_window(fields) for every window concurrently.
+
+    `analyse_window` returns a (payload, status) pair like app.run_analysis.
+    Returns the combined (payload, status).
+    """
+    _, sales_rep_names, merchant_names = fields
+    window_fields = [(transcripts.compact(window), sales_rep_names, merchant_names) for window in windows]
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(windows))), thread_name_prefix='window') as pool:
+        contexts = [contextvars.copy_context() for _ in window_fields]
+        outcomes = list(pool.map(lambda context, fields: context.run(analyse_window, fields), contexts, window_fields))
+
+    failed = [(payload, status) for payload, status in outcomes if status != 200]
+    if failed:
+        return failed[0]
+    reports, sentinels = [], []
+    for payload, _ in outcomes:
+        if payload.get('is_error'):
+            sentinels.append(payload['analysis_text'])
+        else:
+            reports.append(payload['report'])
+
+    # Redaction problems anywhere invalidate the whole call; other sentinels only matter if no window scored
+    if 'DATA_NOT_REDACTED' in sentinels or not reports:
+        return {'analysis_text': 'DATA_NOT_REDACTED' if 'DATA_NOT_REDACTED' in sentinels else sentinels[0],
+                'is_error': True}, 200
+
+    merged = merge_reports(reports)
+    return {
+        'analysis_text': report_parser.render_report(merged),
+        'report': merged,
+        'score_issues': [],
+        'windows': len(windows),
+    }, 200
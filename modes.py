@@ -0,0 +1,133 @@
+"""Analysis modes and the router that picks one per transcript.
+
+Every call used to go to the same model with the same settings, so a
+five-minute check-in waited as long as a ninety-minute discovery call. A Mode
+names a model, a thinking budget and an output-token cap; route() picks one
+from the size of the (normalised) transcript and, optionally, the latency the
+caller can accept:
+
+* quick    - a light model without thinking: a score in well under a minute;
+* standard - the default model and settings;
+* thorough - the strongest model with a large thinking budget, for long calls.
+
+Requests run in standard - the model the app has always used, so scores in
+the history and leaderboard stay comparable - unless they ask for a mode
+(MODE_DEFAULT changes this per deployment). Asking for auto, or giving a
+latency target, routes by size instead: short calls to quick and long ones to
+thorough, and with a latency target the deepest mode whose estimated latency
+fits it (quick when none does). The estimates are deliberately simple - a fixed cost
+plus a per-token rate - and can be tuned per deployment with environment
+variables.
+
+The chosen mode travels in a context variable (see `using`), like the
+admission lane, so the backend and the cache key pick it up without it being
+passed through every function on the way.
+"""
+import contextvars
+import logging
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+AUTO = 'auto'
+
+Mode = namedtuple('Mode', 'name model thinking_budget max_output_tokens base_seconds seconds_per_1k_tokens')
+Mode.__doc__ = """An analysis mode; thinking_budget None leaves the model's own default."""
+
+
+def _mode(name, model, thinking_budget, max_output_tokens, base_seconds, seconds_per_1k_tokens):
+    prefix = f'MODE_{name.upper()}_'
+    budget = os.environ.get(prefix + 'THINKING_BUDGET')
+    return Mode(
+        name=name,
+        model=os.environ.get(prefix + 'MODEL', model),
+        thinking_budget=(int(budget) if budget else thinking_budget),
+        max_output_tokens=int(os.environ.get(prefix + 'MAX_OUTPUT_TOKENS', max_output_tokens)),
+        base_seconds=float(os.environ.get(prefix + 'BASE_SECONDS', base_seconds)),
+        seconds_per_1k_tokens=float(os.environ.get(prefix + 'SECONDS_PER_1K_TOKENS', seconds_per_1k_tokens)),
+    )
+
+
+# Every mode's output cap fits the rubric's full report and scoring tables
+QUICK = _mode('quick', 'gemini-2.5-flash-lite', 0, 32768, 8, 1.5)
+STANDARD = _mode('standard', 'gemini-2.5-flash-preview-05-20', None, 32768, 40, 6)
+THOROUGH = _mode('thorough', 'gemini-2.5-pro', 16384, 65536, 90, 12)
+
+# Fastest first
+MODES = {mode.name: mode for mode in (QUICK, STANDARD, THOROUGH)}
+ORDER = [QUICK, STANDARD, THOROUGH]
+
+
+
+def _default_mode(value):
+    """The MODE_DEFAULT setting as a mode name; an unknown name falls back to standard."""
+    name = (value or STANDARD.name).strip().lower()
+    if name in MODES or name == AUTO:
+        return name
+    logger.error(f"Unknown MODE_DEFAULT '{value}' (use auto or one of: {', '.join(MODES)}); using {STANDARD.name}")
+    return STANDARD.name
+
+
+# The mode of requests that neither ask for one nor give a latency target
+DEFAULT = _default_mode(os.environ.get('MODE_DEFAULT'))
+
+# Below both of these a call is a short check-in; above either it is a long call
+QUICK_MAX_UTTERANCES = int(os.environ.get('MODE_QUICK_MAX_UTTERANCES', 40))
+QUICK_MAX_TOKENS = int(os.environ.get('MODE_QUICK_MAX_TOKENS', 2500))
+THOROUGH_MIN_UTTERANCES = int(os.environ.get('MODE_THOROUGH_MIN_UTTERANCES', 200))
+THOROUGH_MIN_TOKENS = int(os.environ.get('MODE_THOROUGH_MIN_TOKENS', 12000))
+
+_current = contextvars.ContextVar('analysis_mode', default=STANDARD)
+
+
+@contextmanager
+def using(mode):
+    """Runs model calls (and cache lookups) inside the block in this mode."""
+    token = _current.set(mode)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def generation_config(mode, base_config):
+    """The generation config for a mode: the shared settings plus its output cap and thinking budget."""
+    config = dict(base_config, max_output_tokens=mode.max_output_tokens)
+    if mode.thinking_budget is not None:
+        config['thinking_budget'] = mode.thinking_budget
+    return config
+
+
+def estimated_seconds(mode, tokens):
+    return mode.base_seconds + mode.seconds_per_1k_tokens * tokens / 1000
+
+
+def route(tokens, utterances, latency_target=None, requested=None):
+    """Picks the mode for a transcript of `tokens` (estimated) and `utterances`.
+
+    Returns (mode, reason). An explicit `requested` mode wins; otherwise the
+    size of the call sets the preferred depth and the latency target, if any,
+    caps it.
+    """
+    if requested and requested != AUTO:
+        return MODES[requested], 'requested'
+
+    if utterances < QUICK_MAX_UTTERANCES and tokens < QUICK_MAX_TOKENS:
+        preferred, reason = QUICK, 'short call'
+    elif utterances >= THOROUGH_MIN_UTTERANCES or tokens >= THOROUGH_MIN_TOKENS:
+        preferred, reason = THOROUGH, 'long call'
+    else:
+        preferred, reason = STANDARD, 'typical call'
+    if latency_target is None:
+        return preferred, reason
+
+    for mode in reversed(ORDER[:ORDER.index(preferred) + 1]):
+        if estimated_seconds(mode, tokens) <= latency_target:
+            return mode, reason if mode is preferred else f'latency target {latency_target:g}s'
+    return QUICK, f'latency target {latency_target:g}s'
@@ -0,0 +1,169 @@
+"""Near-duplicate detection for transcripts that have already been analysed.
+
+Reps often resubmit a call after a small edit: a corrected speaker label, a
+trimmed intro, timestamps from a different export. The result cache keys on
+the exact normalised text, so each of those would cost a fresh multi-minute
+analysis. This index finds them instead.
+
+A transcript is reduced to the set of word 5-grams ("shingles") of its
+normalised utterance text; speaker labels and timestamps are left out, so
+relabelling or re-exporting a call doesn't change it. The set is summarised
+by a 128-value MinHash signature (one-permutation hashing with rotation
+densification: one hash per shingle instead of 128), whose fraction of equal
+values estimates the Jaccard similarity of two transcripts.
+
+Lookups use locality-sensitive hashing: the signature is cut into 32 bands of
+4 values, each band is a bucket key in SQLite, and only transcripts sharing at
+least one bucket are compared. A lookup is therefore a few dozen index probes
+however many transcripts are stored; with 4-value bands a pair at 0.8
+similarity shares a bucket with probability > 0.9999.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import time
+
+SHINGLE_WORDS = 5
+NUM_HASHES = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_HASHES // BANDS
+# Candidates verified per lookup, most shared buckets first
+MAX_CANDIDATES = 50
+
+_EMPTY = 0xFFFFFFFF
+_SIGNATURE = struct.Struct(f'<{NUM_HASHES}I')
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def words(transcript):
+    """Lower-cased words of a `Speaker: text` transcript, speaker labels left out."""
+    result = []
+    for line in transcript.split('\n'):
+        _, separator, text = line.partition(': ')
+        result += _WORD_RE.findall((text if separator else line).casefold())
+    return result
+
+
+def shingles(transcript, size=SHINGLE_WORDS):
+    tokens = words(transcript)
+    if len(tokens) <= size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def signature(transcript):
+    """MinHash signature of a transcript's shingles, or None when it has no words."""
+    bins = [_EMPTY] * NUM_HASHES
+    for shingle in shingles(transcript):
+        value = _hash64(shingle.encode('utf-8'))
+        index = value % NUM_HASHES
+        value = (value >> 7) & 0xFFFFFFFE  # even, so it never equals _EMPTY
+        if value < bins[index]:
+            bins[index] = value
+    if all(value == _EMPTY for value in bins):
+        return None
+    # Empty bins borrow the next filled bin to their right, offset by the distance travelled
+    filled = list(bins)
+    for index in range(NUM_HASHES):
+        if bins[index] != _EMPTY:
+            continue
+        distance = 1
+        while bins[(index + distance) % NUM_HASHES] == _EMPTY:
+            distance += 1
+        filled[index] = (bins[(index + distance) % NUM_HASHES] + distance * 0x9E3779B1) & 0xFFFFFFFE
+    return filled
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_HASHES
+
+
+def buckets(sig):
+    """LSH bucket of each band: a hash of the band number and its values, signed 64-bit for SQLite."""
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f'<H{ROWS_PER_BAND}I', band, *sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        keys.append(_hash64(chunk) - (1 << 63))
+    return keys
+
+
+class NearDuplicateIndex:
+    """SQLite-backed MinHash LSH index from transcripts to the result keys of their analyses."""
+
+    def __init__(self, path, threshold=0.85):
+        self.path = path
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS transcripts ('
+                ' id INTEGER PRIMARY KEY, result_key TEXT NOT NULL UNIQUE,'
+                ' prompt_version TEXT NOT NULL, created_at REAL NOT NULL, signature BLOB NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                ' bucket INTEGER NOT NULL, transcript_id INTEGER NOT NULL,'
+                ' PRIMARY KEY (bucket, transcript_id)) WITHOUT ROWID'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, result_key, prompt_version, transcript):
+        """Indexes an analysed transcript under its result key (once per key)."""
+        sig = signature(transcript)
+        if sig is None:
+            return
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO transcripts (result_key, prompt_version, created_at, signature)'
+                ' VALUES (?, ?, ?, ?)',
+                (result_key, prompt_version, time.time(), _SIGNATURE.pack(*sig)),
+            )
+            if cursor.rowcount == 1:
+                conn.executemany('INSERT OR IGNORE INTO buckets (bucket, transcript_id) VALUES (?, ?)',
+                                 [(bucket, cursor.lastrowid) for bucket in buckets(sig)])
+
+    def find(self, transcript, prompt_version, threshold=None):
+        """Returns the most similar indexed transcript at or above the threshold, or None.
+
+        The match is a dict with result_key, similarity and created_at.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        sig = signature(transcript)
+        if sig is None:
+            return None
+        keys = buckets(sig)
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT t.id, t.result_key, t.created_at, t.signature, count(*) AS shared'
+                ' FROM buckets b JOIN transcripts t ON t.id = b.transcript_id'
+                f" WHERE b.bucket IN ({', '.join('?' * len(keys))}) AND t.prompt_version = ?"
+                ' GROUP BY t.id ORDER BY shared DESC, t.created_at DESC LIMIT ?',
+                keys + [prompt_version, MAX_CANDIDATES],
+            ).fetchall()
+
+        best = None
+        for _, result_key, created_at, packed, _ in rows:
+            score = similarity(sig, _SIGNATURE.unpack(packed))
+            if score >= threshold and (best is None or score > best['similarity']):
+                best = {'result_key': result_key, 'similarity': round(score, 3), 'created_at': created_at}
+        return best
+
+    def remove(self, result_key):
+        """Drops a transcript whose analysis can no longer be served."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT id, signature FROM transcripts WHERE result_key = ?', (result_key,)).fetchone()
+            if row is not None:
+                transcript_id, packed = row
+                conn.executemany('DELETE FROM buckets WHERE bucket = ? AND transcript_id = ?',
+                                 [(bucket, transcript_id) for bucket in buckets(_SIGNATURE.unpack(packed))])
+                conn.execute('DELETE FROM transcripts WHERE id = ?', (transcript_id,))
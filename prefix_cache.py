@@ -0,0 +1,131 @@
+"""Reuse of the static rubric prefix across model calls.
+
+Two implementations share the same `model_for(model_name, generation_config)`
+interface and return a ready-to-call GenerativeModel whose system instruction
+is the rubric. Models are memoised, so repeated calls reuse the same client:
+
+* LocalPrefixCache - no provider-side caching; the rubric is attached as the
+  system instruction of every call. Used in tests and when caching is off.
+* GeminiContextCache - uploads the rubric once as Gemini cached content and
+  builds models from it, so the rubric's input tokens are not reprocessed (or
+  billed at the full rate) on every request.
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+
+import prompt
+from llm_backends import gemini_sdk
+
+logger = logging.getLogger(__name__)
+
+
+def _config_key(model_name, generation_config):
+    return model_name, json.dumps(generation_config, sort_keys=True)
+
+
+def _sdk_generation_config(generation_config):
+    """Builds the SDK config; a `thinking_budget` entry becomes the request's thinking config.
+
+    Client libraries whose protos predate thinking budgets can't send one, so
+    there the model's default thinking applies.
+    """
+    genai = gemini_sdk()
+    config = dict(generation_config)
+    thinking_budget = config.pop('thinking_budget', None)
+    if thinking_budget is None:
+        return genai.GenerationConfig(**config)
+    if 'thinking_config' in genai.protos.GenerationConfig.meta.fields:
+        return genai.protos.GenerationConfig(**config, thinking_config={'thinking_budget': thinking_budget})
+    logger.warning(f"This google-generativeai version can't set a thinking budget; ignoring {thinking_budget}")
+    return genai.GenerationConfig(**config)
+
+
+class LocalPrefixCache:
+    """Sends the rubric as a plain system instruction on every call."""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model_for(self, model_name, generation_config):
+        key = _config_key(model_name, generation_config)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = gemini_sdk().GenerativeModel(
+                    model_name,
+                    generation_config=_sdk_generation_config(generation_config),
+                    system_instruction=prompt.RUBRIC)
+        return model
+
+
+class GeminiContextCache:
+    """Keeps one Gemini cached-content entry per model for the current rubric.
+
+    Entries are named after the rubric fingerprint, so worker processes find and
+    share an existing entry instead of each uploading their own. If the provider
+    rejects caching (e.g. an unsupported model), calls fall back to LocalPrefixCache.
+    """
+
+    def __init__(self, ttl_seconds=3600, refresh_margin_seconds=300, retry_after_seconds=600):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._entries = {}
+        self._models = {}
+        self._disabled_until = {}
+        self._lock = threading.Lock()
+        self._fallback = LocalPrefixCache()
+
+    def _display_name(self, model_name):
+        return f'funnelbot-{prompt.RUBRIC_FINGERPRINT}-{model_name}'[:128]
+
+    def _usable(self, cached_content):
+        expires = cached_content.expire_time.timestamp()
+        return expires - time.time() > self.refresh_margin_seconds
+
+    def _find_or_create(self, model_name):
+        genai = gemini_sdk()
+        display_name = self._display_name(model_name)
+        for existing in genai.caching.CachedContent.list():
+            if existing.display_name == display_name and self._usable(existing):
+                return existing
+        return genai.caching.CachedContent.create(
+            model=f'models/{model_name}',
+            display_name=display_name,
+            system_instruction=prompt.RUBRIC,
+            ttl=datetime.timedelta(seconds=self.ttl_seconds),
+        )
+
+    def model_for(self, model_name, generation_config):
+        # Don't pay for a failing cache lookup on every request after the provider refused one
+        if self._disabled_until.get(model_name, 0) > time.time():
+            return self._fallback.model_for(model_name, generation_config)
+        try:
+            key = _config_key(model_name, generation_config)
+            with self._lock:
+                cached_content = self._entries.get(model_name)
+                if cached_content is None or not self._usable(cached_content):
+                    cached_content = self._entries[model_name] = self._find_or_create(model_name)
+                # Rebuild the model only when the cached content it points at has rotated
+                memo = self._models.get(key)
+                if memo is None or memo[0] != cached_content.name:
+                    memo = self._models[key] = (cached_content.name, gemini_sdk().GenerativeModel.from_cached_content(
+                        cached_content, generation_config=_sdk_generation_config(generation_config)))
+            return memo[1]
+        except Exception as e:
+            logger.warning(f"Context caching unavailable for {model_name}, sending the rubric uncached: {e}")
+            self._disabled_until[model_name] = time.time() + self.retry_after_seconds
+            return self._fallback.model_for(model_name, generation_config)
+
+
+def get_prefix_cache(name):
+    """Returns the prefix cache implementation configured by name ('gemini' or 'local')."""
+    if name == 'gemini':
+        return GeminiContextCache()
+    if name == 'local':
+        return LocalPrefixCache()
+    raise ValueError(f"Unknown prefix cache '{name}'. Use 'gemini' or 'local'.")
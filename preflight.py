@@ -0,0 +1,109 @@
+"""Local checks that answer the rubric's sentinel cases without a model call.
+
+The rubric tells the model to reply DATA_NOT_REDACTED, NEED_SPEAKER_ROLES or
+UNSUPPORTED_INPUT for card data, unclear speakers or non-transcripts. Each of
+those can be spotted here in milliseconds, so the request never queues for (or
+pays for) a multi-minute upstream call. The checks are deliberately
+conservative: anything they don't flag still goes to the model, which applies
+the full rubric rules. Only text too short to be any conversation is answered
+UNSUPPORTED_INPUT here, and speaker roles are only judged when the transcript
+parsed into labelled speakers.
+
+Speaker roles are judged from speakers.infer_roles() when it has run: roles
+it could not settle are put to the user (with its proposed mapping) rather
+than to the model.
+"""
+import re
+
+import transcripts
+
+DATA_NOT_REDACTED = 'DATA_NOT_REDACTED'
+NEED_SPEAKER_ROLES = 'NEED_SPEAKER_ROLES'
+UNSUPPORTED_INPUT = 'UNSUPPORTED_INPUT'
+
+# 13-19 digits, optionally grouped with spaces or dashes (e.g. "4111 1111 1111 1111")
+CARD_CANDIDATE_RE = re.compile(r'(?<![\d-])(?:\d[ -]?){12,18}\d(?![\d-])')
+# Card network prefixes: Visa, Mastercard, Amex, Diners, Discover, JCB, UnionPay, Maestro
+CARD_PREFIX_RE = re.compile(r'^(?:4|5[1-5]|2[2-7]|3[47]|3[0689]|6)')
+
+IBAN_RE = re.compile(r'\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b')
+
+PII_PATTERNS = {
+    'us_ssn': re.compile(r'\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b'),
+    'uk_nino': re.compile(r'\b(?![DFIQUV])[A-CEGHJ-PR-TW-Z](?![DFIQUVO])[A-CEGHJ-NPR-TW-Z] ?\d{2} ?\d{2} ?\d{2} ?[A-D]\b'),
+    'email': re.compile(r'\b[\w.+-]+@[\w-]+\.[\w.-]+\b'),
+}
+
+# Business email addresses come up constantly on sales calls, so email is opt-in
+DEFAULT_PII_CHECKS = ('card_number', 'iban', 'us_ssn', 'uk_nino')
+
+MIN_WORDS = 10
+
+
+def luhn_valid(digits):
+    total = 0
+    for index, char in enumerate(reversed(digits)):
+        digit = int(char)
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def iban_valid(candidate):
+    iban = candidate.replace(' ', '')
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int(''.join(str(int(char, 36)) for char in rearranged)) % 97 == 1
+
+
+def find_unredacted_data(text, checks=DEFAULT_PII_CHECKS):
+    """Returns the name of the first kind of unredacted data found, or None."""
+    if 'card_number' in checks:
+        for match in CARD_CANDIDATE_RE.finditer(text):
+            digits = re.sub(r'\D', '', match.group(0))
+            if CARD_PREFIX_RE.match(digits) and luhn_valid(digits):
+                return 'card_number'
+    if 'iban' in checks:
+        for match in IBAN_RE.finditer(text):
+            if iban_valid(match.group(0)):
+                return 'iban'
+    for name, pattern in PII_PATTERNS.items():
+        if name in checks and pattern.search(text):
+            return name
+    return None
+
+
+def check(raw_transcript, utterances, sales_rep_names, pii_checks=DEFAULT_PII_CHECKS, roles=None):
+    """Returns (code, reason) when the request can be answered locally, else None.
+
+    `code` is one of DATA_NOT_REDACTED, NEED_SPEAKER_ROLES or UNSUPPORTED_INPUT.
+    `utterances` is the parsed, normalised transcript (see transcripts.normalise)
+    and `roles` its inferred speaker roles, if any (see speakers.infer_roles).
+    """
+    found = find_unredacted_data(raw_transcript, pii_checks)
+    if found:
+        return DATA_NOT_REDACTED, f'Possible unredacted {found.replace("_", " ")} found in the transcript.'
+
+    if len(raw_transcript.split()) < MIN_WORDS:
+        return UNSUPPORTED_INPUT, 'The text is too short to be a conversation.'
+
+    speakers = {utterance.speaker for utterance in utterances}
+    if len(speakers) < 2:
+        # Unlabelled, or labelled in a layout transcripts.py doesn't parse: the model judges those
+        return None
+
+    if roles is not None:
+        return None if roles['resolved'] else (NEED_SPEAKER_ROLES, roles['reason'])
+
+    if not any(transcripts.is_rep(speaker, sales_rep_names) for speaker in speakers):
+        return (NEED_SPEAKER_ROLES,
+                f"None of the speaker labels ({', '.join(sorted(speakers))}) match the sales rep name(s) given.")
+
+    if all(transcripts.is_rep(speaker, sales_rep_names) for speaker in speakers):
+        return NEED_SPEAKER_ROLES, 'Every speaker matches a sales rep name, so no merchant can be identified.'
+
+    return None
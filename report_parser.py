@@ -0,0 +1,193 @@
+"""Parses the model's plain-text report into a structured dict.
+
+The report follows the output template in prompt.RUBRIC (section 5). Parsing is
+tolerant of the usual model drift: markdown bold/heading markers, different
+bullet characters and wrapped lines. Anything unrecognised is skipped rather
+than raising, so a partially malformed report still yields what can be read.
+
+Shape of the result:
+    {
+      'final_score': 88, 'max_score': 100, 'band': 'Strong',
+      'categories': [{'name', 'score', 'max', 'note'}],
+      'funnels': [{'id': 'F1', 'execution_points': 10, 'header_note', 'items': [{'label', 'text'}]}],
+      'aggregate_lists': [{'title', 'items': [{'funnel', 'text'}]}],
+      'missed_opportunities': [{'funnel', 'text'}],
+      'coaching_tips': ['...'],
+    }
+"""
+import re
+
+SECTION_TITLES = {
+    'category breakdown': 'breakdown',
+    'funnel summaries': 'summaries',
+    'aggregate lists': 'lists',
+    'coaching tips': 'tips',
+}
+
+SCORE_RE = re.compile(r'Final Score:\s*(\d+(?:\.\d+)?)\s*/\s*(\d+)\s*(?:\(([^)]+)\))?', re.IGNORECASE)
+CATEGORY_RE = re.compile(r'^[•\-*]\s*(.+?)\s+[–—-]+\s+(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*(.*)$')
+FUNNEL_HEADER_RE = re.compile(r'^#*\s*(F\d+)\b\s*(.*)$')
+EXECUTION_POINTS_RE = re.compile(r'execution:\s*([+-]?\d+(?:\.\d+)?)', re.IGNORECASE)
+DETAIL_RE = re.compile(r'^-\s*([^:]+):\s*(.*)$')
+TAG_RE = re.compile(r'^\((F\d+|General)\)\s*(.*)$', re.IGNORECASE)
+BULLET_RE = re.compile(r'^[•\-*]\s*')
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _clean(line):
+    """Strips markdown emphasis/heading markers that don't change meaning."""
+    return line.strip().replace('**', '').strip()
+
+
+def _section_for(line):
+    lowered = line.lstrip('#').strip().lower()
+    for title, section in SECTION_TITLES.items():
+        if lowered.startswith(title) and lowered.endswith(':'):
+            return section
+    return None
+
+
+def empty_report():
+    return {
+        'final_score': None,
+        'max_score': None,
+        'band': None,
+        'categories': [],
+        'funnels': [],
+        'aggregate_lists': [],
+        'missed_opportunities': [],
+        'coaching_tips': [],
+    }
+
+
+def parse_report(text):
+    """Parses a report into the structure described in the module docstring."""
+    report = empty_report()
+    section = None
+    current_list = None
+
+    for raw_line in (text or '').splitlines():
+        line = _clean(raw_line)
+        if not line or line.startswith('```'):
+            continue
+
+        score_match = SCORE_RE.search(line)
+        if score_match and line.lower().lstrip('#').strip().startswith('final score'):
+            report['final_score'] = _number(score_match.group(1))
+            report['max_score'] = _number(score_match.group(2))
+            report['band'] = score_match.group(3).strip() if score_match.group(3) else None
+            section = None
+            continue
+
+        new_section = _section_for(line)
+        if new_section:
+            section = new_section
+            current_list = None
+            continue
+
+        if section == 'breakdown':
+            match = CATEGORY_RE.match(line)
+            if match:
+                note = match.group(4).strip() or None
+                report['categories'].append({
+                    'name': match.group(1).strip(),
+                    'score': _number(match.group(2)),
+                    'max': _number(match.group(3)),
+                    'note': note,
+                })
+
+        elif section == 'summaries':
+            header = FUNNEL_HEADER_RE.match(line)
+            if header:
+                note = header.group(2).strip() or None
+                points = EXECUTION_POINTS_RE.search(note or '')
+                report['funnels'].append({
+                    'id': header.group(1),
+                    'execution_points': _number(points.group(1)) if points else None,
+                    'header_note': note,
+                    'items': [],
+                })
+            elif report['funnels']:
+                items = report['funnels'][-1]['items']
+                detail = DETAIL_RE.match(line)
+                if detail:
+                    items.append({'label': detail.group(1).strip(), 'text': detail.group(2).strip()})
+                elif line.startswith('-'):
+                    items.append({'label': None, 'text': line[1:].strip()})
+                elif items:
+                    items[-1]['text'] += ' ' + line
+
+        elif section == 'lists':
+            if line.endswith(':') and not BULLET_RE.match(line):
+                title = line[:-1].strip()
+                if 'missed' in title.lower():
+                    current_list = report['missed_opportunities']
+                else:
+                    report['aggregate_lists'].append({'title': title, 'items': []})
+                    current_list = report['aggregate_lists'][-1]['items']
+            elif current_list is not None:
+                if BULLET_RE.match(line):
+                    item_text = BULLET_RE.sub('', line, count=1)
+                    tag = TAG_RE.match(item_text)
+                    current_list.append({
+                        'funnel': tag.group(1) if tag else None,
+                        'text': tag.group(2).strip() if tag else item_text,
+                    })
+                elif current_list:
+                    # Wrapped continuation of the previous bullet
+                    current_list[-1]['text'] += ' ' + line
+
+        elif section == 'tips':
+            report['coaching_tips'].append(line)
+
+    return report
+
+
+def _format_number(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def render_report(report):
+    """Renders a parsed (or merged) report back into the plain-text template format."""
+    lines = []
+    if report['final_score'] is not None:
+        band = f"  ({report['band']})" if report['band'] else ''
+        lines += [f"Final Score: {_format_number(report['final_score'])}/{_format_number(report['max_score'])}{band}", '']
+
+    if report['categories']:
+        lines.append('Category breakdown:')
+        for category in report['categories']:
+            note = f"  {category['note']}" if category['note'] else ''
+            lines.append(f"• {category['name']}  –  {_format_number(category['score'])}/{_format_number(category['max'])}{note}")
+        lines.append('')
+
+    if report['funnels']:
+        lines.append('Funnel summaries:')
+        for funnel in report['funnels']:
+            note = f" {funnel['header_note']}" if funnel['header_note'] else ''
+            lines.append(f"### {funnel['id']}{note}")
+            for item in funnel['items']:
+                lines.append(f"- {item['label']}: {item['text']}" if item['label'] else f"- {item['text']}")
+            lines.append('')
+
+    if report['aggregate_lists'] or report['missed_opportunities']:
+        lines += ['Aggregate lists (tagged):', '']
+        lists = [(entry['title'], entry['items']) for entry in report['aggregate_lists']]
+        if report['missed_opportunities']:
+            lists.append(('Missed Opportunities (for feedback only)', report['missed_opportunities']))
+        for title, items in lists:
+            lines.append(f'{title}:')
+            for item in items:
+                tag = f"({item['funnel']}) " if item['funnel'] else ''
+                lines.append(f"• {tag}{item['text']}")
+            lines.append('')
+
+    if report['coaching_tips']:
+        lines.append('Coaching tips:')
+        lines.extend(report['coaching_tips'])
+
+    return '\n'.join(lines).strip()
@@ -0,0 +1,240 @@
+"""Content-addressed cache for transcript analyses.
+
+Entries are stored in a SQLite file so every worker process on the host shares
+them. Identical requests that arrive while the same analysis is already running
+wait for that call instead of starting their own (single-flight), both inside a
+process and across processes via a short-lived lease row. A waiter reports a
+cache hit only when the result it shared is one the cache keeps.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalise_transcript(text):
+    """Returns the transcript with cosmetic whitespace differences removed."""
+    text = unicodedata.normalize('NFC', text).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def normalise_names(names):
+    """Returns a canonical, order-independent form of a comma-separated name list."""
+    parts = {re.sub(r'\s+', ' ', part).strip().casefold() for part in (names or '').split(',')}
+    return ', '.join(sorted(part for part in parts if part))
+
+
+def make_key(prompt_version, model_name, generation_config, transcript, sales_rep_names, merchant_names):
+    """Builds the cache key for one analysis request."""
+    material = json.dumps({
+        'prompt_version': prompt_version,
+        'model': model_name,
+        'generation_config': generation_config,
+        'transcript': normalise_transcript(transcript),
+        'sales_rep_names': normalise_names(sales_rep_names),
+        'merchant_names': normalise_names(merchant_names),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """An in-progress computation that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache:
+    """SQLite-backed cache with size and TTL eviction and single-flight fills."""
+
+    def __init__(self, path, max_entries=1000, ttl_seconds=7 * 24 * 3600,
+                 lease_seconds=900, poll_interval=0.5):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights = {}  # key -> asyncio.Future, for aget_or_compute on the event loop
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL,'
+                ' created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                ' key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @property
+    def _owner(self):
+        # Read at lease time: workers forked from a preloaded app share this object, not their pid
+        return f'{os.getpid()}-{id(self)}'
+
+    def get(self, key):
+        """Returns the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, created_at FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Stores a JSON-serialisable value and evicts expired and least recently used entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now),
+            )
+            conn.execute('DELETE FROM entries WHERE created_at < ?', (now - self.ttl_seconds,))
+            conn.execute(
+                'DELETE FROM entries WHERE key IN ('
+                ' SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def _acquire_lease(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM leases WHERE key = ? AND expires_at < ?', (key, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, self._owner, now + self.lease_seconds),
+            )
+            return cursor.rowcount == 1
+
+    def _release_lease(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, self._owner))
+
+    def _lease_held(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT expires_at FROM leases WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def _fill(self, key, compute, cacheable):
+        # Another process may already be computing this key; wait for its result
+        # rather than paying for a second upstream call.
+        while not self._acquire_lease(key):
+            time.sleep(self.poll_interval)
+            value = self.get(key)
+            if value is not None:
+                return value, True
+            if not self._lease_held(key):
+                continue
+        try:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+            value = compute()
+            if cacheable(value):
+                self.set(key, value)
+            return value, False
+        finally:
+            self._release_lease(key)
+
+    @staticmethod
+    def _shared(result, cacheable):
+        """A waiter's (value, hit) for the leader's result: a hit if it came from the cache or will be cached."""
+        value, hit = result
+        return value, hit or cacheable(value)
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """Returns (value, hit), running compute() at most once per key across waiters."""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self._shared(flight.result, cacheable)
+
+        try:
+            flight.result = self._fill(key, compute, cacheable)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def _afill(self, key, compute, cacheable):
+        # Same as _fill(), with the SQLite calls moved off the event loop
+        while not await asyncio.to_thread(self._acquire_lease, key):
+            await asyncio.sleep(self.poll_interval)
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                return value, True
+        try:
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                return value, True
+            value = await compute()
+            if cacheable(value):
+                await asyncio.to_thread(self.set, key, value)
+            return value, False
+        finally:
+            await asyncio.to_thread(self._release_lease, key)
+
+    async def aget_or_compute(self, key, compute, cacheable=lambda value: True):
+        """get_or_compute() for coroutines: `compute` is an async callable and waiting doesn't block a thread."""
+        value = await asyncio.to_thread(self.get, key)
+        if value is not None:
+            return value, True
+
+        while key in self._async_flights:
+            flight = self._async_flights[key]
+            try:
+                return self._shared(await asyncio.shield(flight), cacheable)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise  # we were cancelled ourselves
+                # The leader's request went away; take over the computation
+
+        flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._afill(key, compute, cacheable)
+            flight.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # retrieved here so an unawaited flight doesn't log a warning
+            raise
+        finally:
+            del self._async_flights[key]
@@ -9,12 +9,33 @@ fi
 export FLASK_DEBUG=${FLASK_DEBUG:-False}
 export PORT=${PORT:-5000}
 
-# Check if GEMINI_API_KEY is set
-if [ -z "$GEMINI_API_KEY" ]; then
+export LLM_BACKEND=${LLM_BACKEND:-gemini}
+
+# Check if GEMINI_API_KEY is set (not needed for the offline 'fake' backend)
+if [ "$LLM_BACKEND" = "gemini" ] && [ -z "$GEMINI_API_KEY" ]; then
     echo "Error: GEMINI_API_KEY environment variable is not set."
     echo "Please create a .env file based on .env.example and set your API key."
     exit 1
 fi
 
-# Run the Flask application
+# 'production' serves through gunicorn with prefork workers (see gunicorn.conf.py), 'asgi' serves the
+# analysis routes as coroutines under uvicorn, 'dev' runs the Flask development server
+export SERVER_MODE=${SERVER_MODE:-production}
+
+if [ "$SERVER_MODE" = "production" ]; then
+    exec gunicorn -c gunicorn.conf.py
+fi
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec uvicorn asgi:application \
+        --host 0.0.0.0 --port "$PORT" \
+        --workers "${WEB_CONCURRENCY:-1}" \
+        --loop uvloop --http httptools \
+        --timeout-keep-alive 75 \
+        --limit-concurrency "${ASGI_LIMIT_CONCURRENCY:-4000}" \
+        --backlog 4096 \
+        --proxy-headers --no-access-log
+fi
+
+# Run the Flask development server
 python3 app.py 
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""Deterministic score arithmetic for parsed reports.
+
+Steps 7-10 of the rubric ask the model to add up the category points, cap the
+total at 100, round half-up and map it to a band. It sometimes gets that wrong,
+and re-running the whole analysis to fix a sum costs minutes. rescore() redoes
+the arithmetic from the parsed report instead: category scores are clamped to
+their rubric maximum, funnel execution is recomputed from the per-funnel
+points, and the header (score and band) is corrected. Anything that doesn't add
+up is returned as a list of issues alongside the corrected report.
+"""
+import re
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import combinations
+
+MAX_SCORE = 100
+
+BANDS = [(95, 'Exceptional'), (80, 'Strong'), (65, 'Solid'), (50, 'Needs Improvement'), (0, 'Major Coaching Required')]
+
+FUNNEL_EXECUTION = 'funnel execution'
+POINTS_PER_FUNNEL = 10
+
+# Category maximum and the points each criterion can award (section 4 of the rubric)
+CATEGORIES = {
+    'question type & flow': (30, (5, 5, 5, 5, 10)),
+    FUNNEL_EXECUTION: (20, (10, 10)),
+    'pain discovery': (15, (10, 2.5, 2.5)),
+    'motivation probing': (10, (4, 3, 3)),
+    'commitment': (15, (7, 8)),
+    'call wrap-up': (10, (3, 3, 4)),
+}
+
+SCORE_LINE_RE = re.compile(r'^(?P<prefix>[#*\s]*Final Score:\s*)\d+(?:\.\d+)?\s*/\s*\d+(?:\s*\([^)]*\))?(?P<suffix>.*)$',
+                           re.IGNORECASE | re.MULTILINE)
+CATEGORY_LINE_RE = re.compile(
+    r'^(?P<head>[*\s]*[•\-*]\s*(?P<name>.+?)\s+[–—-]+\s+)\d+(?:\.\d+)?\s*/\s*\d+(?:\.\d+)?', re.MULTILINE)
+
+
+def round_half_up(value):
+    return int(Decimal(str(value)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def band_for(score):
+    for floor, band in BANDS:
+        if score >= floor:
+            return band
+    return BANDS[-1][1]
+
+
+def _category_key(name):
+    # The rubric writes "wrap‑up" with a non-breaking hyphen; models use either
+    return re.sub(r'[‐-―]', '-', name).strip().casefold()
+
+
+def _achievable(points):
+    """Every subtotal reachable by awarding some subset of the criteria."""
+    return {sum(subset) for size in range(len(points) + 1) for subset in combinations(points, size)}
+
+
+ACHIEVABLE = {key: _achievable(points) for key, (_, points) in CATEGORIES.items()}
+
+
+def _issue(field, reported, computed, message):
+    return {'field': field, 'reported': reported, 'computed': computed, 'message': message}
+
+
+def rescore(report):
+    """Recomputes subtotals, final score and band for a parsed report.
+
+    Returns (report, issues): a corrected copy of the report and a list of
+    {'field', 'reported', 'computed', 'message'} dicts, empty when the model's
+    arithmetic was already right. Reports without a category breakdown (e.g.
+    partial output) are returned unchanged.
+    """
+    if not report['categories']:
+        return report, []
+
+    issues = []
+    categories = []
+    for category in report['categories']:
+        category = dict(category)
+        key = _category_key(category['name'])
+        rubric_max, _ = CATEGORIES.get(key, (category['max'], ()))
+        field = f"categories.{category['name']}"
+
+        if key == FUNNEL_EXECUTION and report['funnels']:
+            complete = sum(1 for funnel in report['funnels'] if (funnel['execution_points'] or 0) >= POINTS_PER_FUNNEL)
+            computed = min(rubric_max, POINTS_PER_FUNNEL * complete)
+            if category['score'] != computed:
+                issues.append(_issue(field, category['score'], computed,
+                                     f'{complete} complete funnel(s) earn {computed} points.'))
+                category['score'] = computed
+
+        if category['max'] != rubric_max:
+            issues.append(_issue(f'{field}.max', category['max'], rubric_max, f'The rubric maximum is {rubric_max}.'))
+            category['max'] = rubric_max
+        if category['score'] > rubric_max or category['score'] < 0:
+            clamped = min(max(category['score'], 0), rubric_max)
+            issues.append(_issue(field, category['score'], clamped, f'Score is outside 0-{rubric_max}.'))
+            category['score'] = clamped
+        elif key in ACHIEVABLE and category['score'] not in ACHIEVABLE[key]:
+            # Can't tell which criterion is wrong, so flag it without changing the score
+            issues.append(_issue(field, category['score'], None,
+                                 'No combination of the rubric criteria adds up to this score.'))
+        categories.append(category)
+
+    total = min(MAX_SCORE, sum(category['score'] for category in categories))
+    final_score = round_half_up(total)
+    band = band_for(final_score)
+    if report['final_score'] != final_score:
+        issues.append(_issue('final_score', report['final_score'], final_score,
+                             'Final score does not match the sum of the category scores.'))
+    if report['max_score'] != MAX_SCORE:
+        issues.append(_issue('max_score', report['max_score'], MAX_SCORE, f'The rubric maximum is {MAX_SCORE}.'))
+    if (report['band'] or '').casefold() != band.casefold():
+        issues.append(_issue('band', report['band'], band, f'A score of {final_score} is in the {band} band.'))
+
+    return dict(report, categories=categories, final_score=final_score, max_score=MAX_SCORE, band=band), issues
+
+
+def correct_text(text, report):
+    """Rewrites the Final Score line and category scores in a report's text to match a rescored report.
+
+    The rest of the model's text is left exactly as written.
+    """
+    scores = {_category_key(category['name']): category for category in report['categories']}
+
+    def fix_category(match):
+        category = scores.get(_category_key(match.group('name')))
+        if category is None:
+            return match.group(0)
+        return f"{match.group('head')}{_format(category['score'])}/{_format(category['max'])}"
+
+    text = CATEGORY_LINE_RE.sub(fix_category, text)
+    score = f"{report['final_score']}/{report['max_score']}  ({report['band']})"
+    corrected, count = SCORE_LINE_RE.subn(lambda m: f"{m.group('prefix')}{score}{m.group('suffix')}", text, count=1)
+    return corrected if count else f'Final Score: {score}\n\n{text}'
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
@@ -0,0 +1,174 @@
+"""Speaker-role inference: which transcript labels are sales reps and which are merchants.
+
+The page only asks for the rep names and used to send "Customer" as the
+merchant, so a call whose customer is labelled by name ("Maria: ...") could
+take a full model call to come back as NEED_SPEAKER_ROLES. infer_roles()
+settles the roles locally first:
+
+* each distinct speaker label is fuzzy-matched against the rep names - case,
+  accents and punctuation are ignored, a first or last name alone or an
+  initial ("J. Smith") matches, and so does a small typo - and generic role
+  labels such as "Agent" or "Customer" are recognised;
+* merchant names, when given, claim the labels they match;
+* every other speaker is taken for a merchant, checked against turn and
+  question-ratio features: reps ask the questions, merchants mostly answer.
+
+When the roles are clear, rep labels are rewritten to the rep names given (see
+relabel) and the merchant labels become the merchant names, so the prompt
+names the transcript's speakers exactly. When they are not - no label is a
+rep, every label is, or an unmatched speaker questions the merchant like a rep
+would - the request is answered with NEED_SPEAKER_ROLES and the proposed
+mapping for the user to confirm (see preflight.py), before any model call.
+"""
+import difflib
+import re
+import unicodedata
+
+import transcripts
+
+SALES_REP = 'sales_rep'
+MERCHANT = 'merchant'
+
+REP_ROLE_LABELS = {'rep', 'sales rep', 'sales', 'salesperson', 'seller', 'agent', 'ae', 'account executive',
+                   'account manager'}
+MERCHANT_ROLE_LABELS = {'customer', 'merchant', 'client', 'prospect', 'buyer', 'caller'}
+HONORIFICS = {'mr', 'mrs', 'ms', 'miss', 'dr'}
+
+# Label-to-name similarity (0-1) from which a label counts as that person
+NAME_MATCH_THRESHOLD = 0.8
+# An unmatched speaker with this many turns, asking questions in this share of them (and at least as
+# often as the matched reps), might be an unlisted rep, so its role isn't guessed
+REP_LIKE_MIN_TURNS = 3
+REP_LIKE_QUESTION_RATIO = 0.4
+
+
+def _name_words(name):
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    words = re.findall(r'\w+', ''.join(char for char in decomposed if not unicodedata.combining(char)))
+    return [word for word in words if word not in HONORIFICS] or words
+
+
+def split_names(names):
+    return [name.strip() for name in (names or '').split(',') if name.strip()]
+
+
+def name_similarity(label, name):
+    """How closely a speaker label matches a person's name, from 0 to 1.
+
+    A label whose words all appear in the name, in full or as initials, is a
+    near-certain match ("Jane", "Smith" and "J. Smith" for "Jane Smith"), as is
+    a label containing the whole name; a slightly misspelt word ("Jon S.")
+    lowers that a little. Otherwise the spelling similarity of the two decides.
+    """
+    label_words, name_words = _name_words(label), _name_words(name)
+    if not label_words or not name_words:
+        return 0.0
+    if label_words == name_words:
+        return 1.0
+    if set(name_words) <= set(label_words):
+        return 0.9
+    scores = [max(_word_similarity(word, other) for other in name_words) for word in label_words]
+    if min(scores) >= NAME_MATCH_THRESHOLD and any(len(word) > 1 for word in label_words):
+        return 0.9 if min(scores) == 1.0 else NAME_MATCH_THRESHOLD
+    return round(difflib.SequenceMatcher(None, ' '.join(label_words), ' '.join(name_words)).ratio(), 2)
+
+
+def _word_similarity(word, other):
+    if word == other or (len(word) == 1 and other.startswith(word)):
+        return 1.0
+    return difflib.SequenceMatcher(None, word, other).ratio() if min(len(word), len(other)) > 2 else 0.0
+
+
+def _best_match(label, names):
+    scored = [(name_similarity(label, name), name) for name in names]
+    return max(scored, default=(0.0, None), key=lambda pair: pair[0])
+
+
+def speaker_features(utterances):
+    """Turns, words and questions per speaker label, in order of first appearance."""
+    features = {}
+    for utterance in utterances:
+        entry = features.setdefault(utterance.speaker, {'turns': 0, 'words': 0, 'questions': 0})
+        entry['turns'] += 1
+        entry['words'] += len(utterance.text.split())
+        entry['questions'] += '?' in utterance.text
+    return features
+
+
+def _question_ratio(entries):
+    turns = sum(entry['turns'] for entry in entries)
+    return sum(entry['questions'] for entry in entries) / turns if turns else 0.0
+
+
+def infer_roles(utterances, sales_rep_names, merchant_names=None):
+    """Works out the role of every speaker label in a transcript.
+
+    Returns {'sales_reps', 'merchants', 'speakers', 'resolved', 'reason'}:
+    the rep and merchant labels, one {'label', 'role', 'name', 'basis',
+    'turns', 'question_ratio'} entry per speaker ('name' is the rep name a rep
+    label matched), whether the roles are clear enough to send to the model,
+    and if not, why. Unresolved roles are still a complete proposal.
+    """
+    rep_names, merchant_hints = split_names(sales_rep_names), split_names(merchant_names)
+    features = speaker_features(utterances)
+    speakers = []
+    for label, counts in features.items():
+        rep_score, rep_name = _best_match(label, rep_names)
+        merchant_score, _ = _best_match(label, merchant_hints)
+        role_label = ' '.join(_name_words(label))
+        entry = {'label': label, 'role': None, 'name': None, 'basis': None, 'turns': counts['turns'],
+                 'questions': counts['questions'], 'question_ratio': round(_question_ratio([counts]), 2)}
+        if rep_score >= NAME_MATCH_THRESHOLD and rep_score >= merchant_score:
+            entry.update(role=SALES_REP, name=rep_name, basis='rep name')
+        elif merchant_score >= NAME_MATCH_THRESHOLD:
+            entry.update(role=MERCHANT, basis='merchant name')
+        elif role_label in REP_ROLE_LABELS:
+            entry.update(role=SALES_REP, name=rep_names[0] if len(rep_names) == 1 else None, basis='role label')
+        elif role_label in MERCHANT_ROLE_LABELS:
+            entry.update(role=MERCHANT, basis='role label')
+        speakers.append(entry)
+
+    reps = [entry for entry in speakers if entry['role'] == SALES_REP]
+    unmatched = [entry for entry in speakers if entry['role'] is None]
+    for entry in unmatched:
+        entry.update(role=MERCHANT, basis='question ratio')
+    rep_ratio = _question_ratio(reps)
+    rep_like = [entry for entry in unmatched
+                if entry['turns'] >= REP_LIKE_MIN_TURNS and entry['question_ratio'] >= REP_LIKE_QUESTION_RATIO
+                and entry['question_ratio'] >= rep_ratio]
+
+    reason = None
+    if not reps:
+        reason = (f"None of the speaker labels ({', '.join(sorted(features))}) match the sales rep name(s) given.")
+        if unmatched:
+            # Propose whoever asks the most questions as the rep
+            likely = max(unmatched, key=lambda entry: (entry['question_ratio'], entry['turns']))
+            likely.update(role=SALES_REP, basis='question ratio')
+    elif len(reps) == len(speakers):
+        reason = 'Every speaker matches a sales rep name, so no merchant can be identified.'
+    elif any(entry['name'] is None for entry in reps):
+        reason = (f"{', '.join(entry['label'] for entry in reps if entry['name'] is None)} is a sales rep,"
+                  ' but not one of the rep names given.')
+    elif rep_like and len(unmatched) > 1:
+        reason = (f"{', '.join(entry['label'] for entry in rep_like)} asks questions like a sales rep"
+                  ' but does not match the rep name(s) given.')
+
+    for entry in speakers:
+        del entry['questions']
+    return {
+        'sales_reps': [entry['label'] for entry in speakers if entry['role'] == SALES_REP],
+        'merchants': [entry['label'] for entry in speakers if entry['role'] == MERCHANT],
+        'speakers': speakers,
+        'resolved': reason is None,
+        'reason': reason,
+    }
+
+
+def relabel(utterances, roles, sales_rep_names):
+    """Renames rep labels that only loosely match a rep name to that name; returns the same list when none do."""
+    renames = {entry['label']: entry['name'] for entry in roles['speakers']
+               if entry['role'] == SALES_REP and entry['name']
+               and not transcripts.is_rep(entry['label'], sales_rep_names)}
+    if not renames:
+        return utterances
+    return [utterance._replace(speaker=renames.get(utterance.speaker, utterance.speaker)) for utterance in utterances]
@@ -0,0 +1,174 @@
+// Turns the plain-text analysis into render operations for script.js, a line at a time.
+//
+// The text can be pushed in chunks as it streams in: only complete lines are parsed, and the
+// unfinished tail waits for the next chunk, so each character is looked at once. Operations:
+//   {op: 'score', score, band}          {op: 'text', text}
+//   {op: 'section', section, title}     section is breakdown, summaries, lists or tips
+//   {op: 'category', name, score}       {op: 'funnel', id, note}
+//   {op: 'detail', label, text}         {op: 'note', text}
+//   {op: 'listTitle', title, missed}    {op: 'item', text, tag}
+//   {op: 'continue', text}              {op: 'tip', text}
+//
+// reportOps() produces the same operations from the report the server parsed (report_parser.py).
+//
+// Loaded as a Web Worker this file parses off the main thread: post {chunk} messages and
+// receive {ops} for each one.
+(function (scope) {
+    'use strict';
+
+    const SECTION_TITLES = [
+        ['Category breakdown:', 'breakdown'],
+        ['Funnel summaries:', 'summaries'],
+        ['Aggregate lists (tagged):', 'lists'],
+        ['Coaching tips:', 'tips'],
+    ];
+    const SCORE_RE = /Final Score:\s*(\d+\/\d+)\s*\(([^)]+)\)/;
+    const CATEGORY_RE = /•\s*([^–]+)\s*–\s*(.*)/;
+    const FUNNEL_RE = /(###\s*F\d+)(\s*\(.*\))?/;
+    const DETAIL_RE = /-\s*([^:]+):\s*(.*)/;
+    const BULLETS = ['•', '-', '*'];
+
+    class ReportLineParser {
+        constructor() {
+            this.pending = '';
+            this.section = null;
+            this.inFunnel = false;
+            this.inList = false;
+        }
+
+        // Parses the complete lines in pending + chunk; returns their operations
+        push(chunk) {
+            const lines = (this.pending + chunk).split('\n');
+            this.pending = lines.pop();
+            const ops = [];
+            for (const line of lines) this.parseLine(line.trim(), ops);
+            return ops;
+        }
+
+        // Parses the last, unterminated line
+        end() {
+            const ops = [];
+            this.parseLine(this.pending.trim(), ops);
+            this.pending = '';
+            return ops;
+        }
+
+        parseLine(line, ops) {
+            if (!line) return;
+
+            for (const [title, section] of SECTION_TITLES) {
+                if (line.startsWith(title)) {
+                    this.enter(section);
+                    ops.push({ op: 'section', section, title });
+                    return;
+                }
+            }
+            if (line.startsWith('Final Score:')) {
+                this.enter(null);
+                const match = line.match(SCORE_RE);
+                ops.push(match ? { op: 'score', score: match[1], band: match[2] } : { op: 'text', text: line });
+                return;
+            }
+
+            switch (this.section) {
+                case 'breakdown': {
+                    const match = line.match(CATEGORY_RE);
+                    if (match) ops.push({ op: 'category', name: match[1].trim(), score: match[2].trim() });
+                    break;
+                }
+                case 'summaries': {
+                    const funnel = line.match(FUNNEL_RE);
+                    if (funnel) {
+                        this.inFunnel = true;
+                        ops.push({ op: 'funnel', id: funnel[1], note: funnel[2] || '' });
+                    } else if (line.startsWith('-')) {
+                        this.inFunnel = true;
+                        const detail = line.match(DETAIL_RE);
+                        ops.push(detail
+                            ? { op: 'detail', label: detail[1].trim(), text: detail[2] }
+                            : { op: 'detail', label: '', text: line.substring(1).trim() });
+                    } else if (this.inFunnel) {
+                        ops.push({ op: 'note', text: line });
+                    }
+                    break;
+                }
+                case 'lists': {
+                    const bulleted = BULLETS.some(bullet => line.startsWith(bullet));
+                    if (line.endsWith(':') && !bulleted) {
+                        this.inList = true;
+                        const title = line.substring(0, line.lastIndexOf(':')).trim();
+                        ops.push({ op: 'listTitle', title, missed: title.toLowerCase().includes('missed') });
+                    } else if (bulleted && this.inList) {
+                        const text = line.substring(1).trim();
+                        if (text) ops.push({ op: 'item', text, tag: '' });
+                    } else if (this.inList) {
+                        // Wrapped text continues the previous item
+                        ops.push({ op: 'continue', text: line });
+                    }
+                    break;
+                }
+                case 'tips':
+                    ops.push({ op: 'tip', text: line });
+                    break;
+                default:
+                    // Lines before the score header and the first section aren't shown
+                    break;
+            }
+        }
+
+        enter(section) {
+            this.section = section;
+            this.inFunnel = false;
+            this.inList = false;
+        }
+    }
+
+    // The operations for a structured report from the server
+    function reportOps(report) {
+        const ops = [];
+        if (report.final_score !== null) {
+            ops.push({ op: 'score', score: `${report.final_score}/${report.max_score}`, band: report.band || '' });
+        }
+        if (report.categories.length) {
+            ops.push({ op: 'section', section: 'breakdown', title: 'Category breakdown:' });
+            report.categories.forEach(category => {
+                const note = category.note ? ` ${category.note}` : '';
+                ops.push({ op: 'category', name: category.name, score: `${category.score}/${category.max}${note}` });
+            });
+        }
+        if (report.funnels.length) {
+            ops.push({ op: 'section', section: 'summaries', title: 'Funnel summaries:' });
+            report.funnels.forEach(funnel => {
+                ops.push({ op: 'funnel', id: funnel.id, note: funnel.header_note ? ` ${funnel.header_note}` : '' });
+                funnel.items.forEach(item => ops.push({ op: 'detail', label: item.label || '', text: item.text }));
+            });
+        }
+        if (report.aggregate_lists.length || report.missed_opportunities.length) {
+            ops.push({ op: 'section', section: 'lists', title: 'Aggregate lists (tagged):' });
+            const addList = (title, items, missed) => {
+                ops.push({ op: 'listTitle', title, missed });
+                items.forEach(item => ops.push({ op: 'item', text: item.text, tag: item.funnel ? `(${item.funnel}) ` : '' }));
+            };
+            report.aggregate_lists.forEach(list => addList(list.title, list.items, false));
+            if (report.missed_opportunities.length) {
+                addList('Missed Opportunities (for feedback only)', report.missed_opportunities, true);
+            }
+        }
+        if (report.coaching_tips.length) {
+            ops.push({ op: 'section', section: 'tips', title: 'Coaching tips:' });
+            report.coaching_tips.forEach(tip => ops.push({ op: 'tip', text: tip }));
+        }
+        return ops;
+    }
+
+    scope.ReportLineParser = ReportLineParser;
+    scope.reportOps = reportOps;
+
+    if (typeof WorkerGlobalScope !== 'undefined' && scope instanceof WorkerGlobalScope) {
+        const parser = new ReportLineParser();
+        scope.onmessage = event => {
+            const ops = event.data.end ? parser.end() : parser.push(event.data.chunk);
+            scope.postMessage({ ops });
+        };
+    }
+})(self);
@@ -1,10 +1,16 @@
 document.addEventListener('DOMContentLoaded', () => {
     const transcriptInput = document.getElementById('transcriptInput');
+    const transcriptFileInput = document.getElementById('transcriptFile');
     const salesRepNamesInput = document.getElementById('salesRepNames');
+    const merchantNamesInput = document.getElementById('merchantNames');
+    const analysisModeSelect = document.getElementById('analysisMode');
     const analyzeButton = document.getElementById('analyzeButton');
     
     const resultsArea = document.getElementById('resultsArea');
     const analysisOutputPre = document.getElementById('analysisOutput');
+    // report-parser.js doubles as the worker script that parses streamed reports off the main thread
+    const reportParserScript = document.getElementById('reportParserScript');
+    const reportParserUrl = reportParserScript ? reportParserScript.src : null;
     
     const loadingIndicator = document.getElementById('loadingIndicator');
     const errorOutputDiv = document.getElementById('errorOutput');
@@ -50,18 +56,29 @@ document.addEventListener('DOMContentLoaded', () => {
         clearInterval(carouselInterval);
     }
 
-    analyzeButton.addEventListener('click', async () => {
-        const transcript = transcriptInput.value.trim();
+    function stopLoading() {
+        stopCarousel();
+        loadingIndicator.style.display = 'none';
+    }
+
+    analyzeButton.addEventListener('click', () => analyzeTranscript(false));
+
+    // forceReanalysis skips the earlier result of a near-duplicate transcript and asks for a fresh analysis
+    async function analyzeTranscript(forceReanalysis) {
+        // A chosen file is uploaded as-is and parsed on the server, so the textarea is only read without one
+        const transcriptFile = transcriptFileInput.files[0];
+        const transcript = transcriptFile ? '' : transcriptInput.value.trim();
         const salesRepNames = salesRepNamesInput.value.trim();
-        const merchantNames = "Customer";
+        // Left empty, the server works out which speakers are merchants from the transcript
+        const merchantNames = merchantNamesInput.value.trim();
         
         if (!salesRepNames) {
             showError('Please enter the Sales Rep(s) name(s).');
             salesRepNamesInput.focus();
             return;
         }
-        if (!transcript) {
-            showError('Please paste a transcript before analyzing.');
+        if (!transcriptFile && !transcript) {
+            showError('Please paste a transcript or choose a transcript file before analyzing.');
             transcriptInput.focus();
             return;
         }
@@ -76,352 +93,464 @@ document.addEventListener('DOMContentLoaded', () => {
         loadingIndicator.scrollIntoView({ behavior: 'smooth' });
 
         try {
-            const response = await fetch('/analyze', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    transcript: transcript,
-                    sales_rep_names: salesRepNames,
-                    merchant_names: merchantNames
-                }),
-            });
-
-            // Stop loading indicators regardless of response status
-            stopCarousel();
-            loadingIndicator.style.display = 'none';
-            // analyzeButton.disabled = false; // Re-enable button (moved to finally block)
-
-            const data = await response.json();
+            const response = transcriptFile
+                ? await fetch('/analyze/upload', {
+                    method: 'POST',
+                    headers: { 'Accept': 'text/event-stream' },
+                    body: uploadForm(transcriptFile, salesRepNames, merchantNames, forceReanalysis),
+                })
+                : await fetch('/analyze/stream', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        transcript: transcript,
+                        sales_rep_names: salesRepNames,
+                        merchant_names: merchantNames || undefined,
+                        mode: analysisModeSelect.value,
+                        force_reanalysis: forceReanalysis
+                    }),
+                });
 
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
+                // Validation and configuration errors come back as a plain JSON body
+                stopLoading();
+                const data = await response.json();
                 const errorMessage = data && data.error ? data.error : `Server error: ${response.status}`;
                 showError(errorMessage);
-                // Button re-enabled in finally block
                 return;
             }
 
-            if (data.error) {
-                showError(data.error);
-            } else if (data.is_error) {
-                // Specific backend errors like NEED_SPEAKER_ROLES
-                showError(data.analysis_text); 
-            } else if (data.analysis_text) {
-                // Log the raw text before attempting to format it
-                console.log('Raw analysis text:\n', data.analysis_text);
-                
-                // Store raw text in a global variable or similar scope if needed elsewhere
-                window.rawAnalysisText = data.analysis_text; // Keep for potential debug button
-                
-                let formattedHtml = '';
-                try {
-                    // Attempt to create formatted HTML
-                    formattedHtml = enhanceTextFormatting(data.analysis_text);
-                } catch (formatError) {
-                    console.error("Error during text formatting:", formatError);
-                    // Optionally show a specific formatting error message, or just fall back to raw text
-                }
-
-                // Use formatted HTML if successful, otherwise show raw text as fallback
-                if (formattedHtml && formattedHtml.trim() !== '') {
-                    analysisOutputPre.innerHTML = formattedHtml;
-                } else {
-                    // Fallback: Show raw text if formatting failed or returned empty
-                    console.warn("Formatting failed or returned empty. Displaying raw text.");
-                    analysisOutputPre.innerHTML = `<p style="color: orange; font-style: italic;">Could not format analysis. Displaying raw text:</p><pre style="white-space: pre-wrap; font-family: monospace; padding: 15px; background: #f8f9fa; border: 1px solid #e9ecef; border-radius: 4px; overflow-x: auto;">${data.analysis_text.replace(/</g, '&lt;').replace(/>/g, '&gt;')}</pre>`;
-                }
-
-                // Add a debug button that might be useful for troubleshooting
-                const debugButton = document.createElement('button');
-                debugButton.textContent = 'Toggle Raw/Formatted View';
-                debugButton.style.marginTop = '20px';
-                debugButton.style.padding = '8px 12px';
-                debugButton.style.fontSize = '0.8em';
-                debugButton.style.backgroundColor = '#f0f0f0';
-                debugButton.style.border = '1px solid #ccc';
-                debugButton.style.borderRadius = '4px';
-                debugButton.style.cursor = 'pointer';
-                
-                debugButton.addEventListener('click', function() {
-                    if (this.dataset.showingRaw === 'true') {
-                        analysisOutputPre.innerHTML = formattedHtml;
-                        this.textContent = 'Show Raw Text';
-                        this.dataset.showingRaw = 'false';
-                    } else {
-                        // Show the raw text with line breaks preserved
-                        analysisOutputPre.innerHTML = `<pre style="white-space: pre-wrap; font-family: monospace; padding: 15px; background: #f8f9fa; border: 1px solid #e9ecef; border-radius: 4px; overflow-x: auto;">${window.rawAnalysisText.replace(/</g, '&lt;').replace(/>/g, '&gt;')}</pre>`;
-                        this.textContent = 'Show Formatted View';
-                        this.dataset.showingRaw = 'true';
+            // Render the report as it is generated; the final 'done' event carries the full payload
+            const reportStream = createReportStream(analysisOutputPre, showResults);
+            let finished = false;
+            try {
+                await readEventStream(response, (event, data) => {
+                    if (event === 'chunk') {
+                        reportStream.push(data.text);
+                    } else if (event === 'done') {
+                        finished = true;
+                        reportStream.close();
+                        stopLoading();
+                        handleAnalysisData(data);
+                    } else if (event === 'error') {
+                        finished = true;
+                        reportStream.close();
+                        stopLoading();
+                        showError(data && data.error ? data.error : 'The analysis failed. Please try again.');
                     }
                 });
-                
-                // Add the debug button to the bottom of the results
-                analysisOutputPre.appendChild(debugButton);
-
-                // ALWAYS show the results area if we got analysis_text
-                resultsArea.style.display = 'block'; 
-                resultsArea.scrollIntoView({ behavior: 'smooth' });
+            } finally {
+                reportStream.close();
+            }
 
-            } else {
-                // This case means response was OK, but no error and no analysis_text
-                showError('Received an empty analysis from the server.');
+            if (!finished) {
+                stopLoading();
+                showError('The connection closed before the analysis finished. Please try again.');
             }
 
         } catch (error) {
             // Error handling remains the same
-            stopCarousel();
-            loadingIndicator.style.display = 'none';
+            stopLoading();
             console.error('Error during analysis:', error);
             showError('An unexpected client-side error occurred. Please check the console or try again.');
         } finally {
             // Ensure the button is always re-enabled after fetch completes or fails
             analyzeButton.disabled = false; 
         }
-    });
+    }
 
-    // Enhanced function to format the plain text output into structured HTML
-    function enhanceTextFormatting(text) {
-        let html = '';
+    // The /analyze/upload body: the other fields first, so the server has them before the file arrives
+    function uploadForm(file, salesRepNames, merchantNames, forceReanalysis) {
+        const form = new FormData();
+        form.append('sales_rep_names', salesRepNames);
+        if (merchantNames) form.append('merchant_names', merchantNames);
+        form.append('mode', analysisModeSelect.value);
+        form.append('force_reanalysis', forceReanalysis ? 'true' : 'false');
+        form.append('file', file);
+        return form;
+    }
 
-        // Split text into lines for easier processing
-        const lines = text.trim().split('\n');
-        let currentSection = null; // To track which section we are in (breakdown, summaries, lists, tips)
-        let currentListType = null; // To track if we are inside a specific list (e.g., Thinking questions)
+    // Reads a text/event-stream response body and calls onEvent(eventName, parsedData) per event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
 
-        // Add debugging
-        console.log("Starting text formatting. Lines to process:", lines.length);
-        
-        lines.forEach(line => {
-            line = line.trim();
-            if (!line) return; // Skip empty lines
-
-            // --- Check for Section Titles FIRST ---
-            // This ensures we close the previous section *before* processing the new title line.
-            if (line.startsWith('Category breakdown:')) {
-                if (currentListType === 'funnel-details' && currentSection === 'summaries') html += `</ul></div>`; // Close last funnel
-                else if (currentListType && currentSection === 'lists') html += `</ul>`; // Close last aggregate list
-                if (currentSection === 'lists') html += `</div>`; // Close lists section
-                if (currentSection === 'summaries') html += `</div>`; // Close summaries section
-                if (currentSection === 'tips') html += `</div>`; // Close tips section
-                // Now start the new section
-                html += `<div class="category-breakdown"><h3 class="section-title">Category breakdown:</h3><ul>`;
-                currentSection = 'breakdown';
-                currentListType = null;
-            }
-            else if (line.startsWith('Funnel summaries:')) {
-                if (currentSection === 'breakdown') html += `</ul></div>`; // Close breakdown list
-                else if (currentListType && currentSection === 'lists') html += `</ul>`; // Close last aggregate list
-                if (currentSection === 'lists') html += `</div>`; // Close lists section
-                if (currentSection === 'tips') html += `</div>`; // Close tips section
-                // Now start the new section
-                html += `<div class="funnel-summaries"><h3 class="section-title">Funnel summaries:</h3>`;
-                currentSection = 'summaries';
-                currentListType = null; // Reset list type for the new section
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) onEvent(eventName, JSON.parse(dataLines.join('\n')));
             }
-            else if (line.startsWith('Aggregate lists (tagged):')) {
-                if (currentListType === 'funnel-details' && currentSection === 'summaries') html += `</ul></div>`; // Close last funnel
-                if (currentSection === 'summaries') html += `</div>`; // Close summaries section
-                else if (currentSection === 'breakdown') html += `</ul></div>`; // Close breakdown list
-                else if (currentSection === 'tips') html += `</div>`; // Close tips section
-                // Now start the new section
-                html += `<div class="aggregate-lists"><h3 class="section-title">Aggregate lists (tagged):</h3>`;
-                currentSection = 'lists';
-                currentListType = null; // Reset list type for the new section
+        }
+    }
+
+    // Shows the results area once the first part of the report has been rendered
+    function showResults() {
+        if (resultsArea.style.display !== 'block') {
+            stopLoading();
+            resultsArea.style.display = 'block';
+            resultsArea.scrollIntoView({ behavior: 'smooth' });
+        }
+    }
+
+    // Renders streamed report text into container as it arrives.
+    // Lines are parsed in a Web Worker when the browser allows it (in this thread otherwise), and the
+    // resulting nodes are appended at most once per animation frame. onOutput runs before the first render.
+    function createReportStream(container, onOutput) {
+        const view = createReportView(container);
+        const chunks = [];
+        let queued = [];
+        let frame = null;
+        let closed = false;
+        let parser = null;
+        let worker = null;
+
+        function render() {
+            frame = null;
+            if (closed || !queued.length) return;
+            if (!view.hasOutput()) onOutput();
+            view.apply(queued);
+            queued = [];
+        }
+
+        function enqueue(ops) {
+            if (closed || !ops.length) return;
+            for (const op of ops) queued.push(op);
+            if (frame === null) frame = requestAnimationFrame(render);
+        }
+
+        function parseInThisThread() {
+            parser = new ReportLineParser();
+            if (worker) {
+                worker.terminate();
+                worker = null;
+                // Re-parse what the worker was given; its output is discarded
+                queued = [];
+                view.clear();
+                enqueue(parser.push(chunks.join('')));
             }
-             else if (line.startsWith('Coaching tips:')) {
-                if (currentListType === 'funnel-details' && currentSection === 'summaries') html += `</ul></div>`; // Close last funnel
-                else if (currentListType && currentSection === 'lists') html += `</ul>`; // Close last aggregate list
-                if (currentSection === 'lists') html += `</div>`; // Close lists section
-                if (currentSection === 'summaries') html += `</div>`; // Close summaries section
-                else if (currentSection === 'breakdown') html += `</ul></div>`; // Close breakdown list
-                 // Now start the new section
-                html += `<div class="coaching-tips-section"><h3 class="section-title">Coaching tips:</h3>`;
-                currentSection = 'tips';
-                currentListType = null;
+        }
+
+        if (window.Worker && reportParserUrl) {
+            try {
+                worker = new Worker(reportParserUrl);
+                worker.onmessage = event => enqueue(event.data.ops);
+                worker.onerror = parseInThisThread;
+            } catch (workerError) {
+                worker = null;
             }
-            // --- Score Header (processed after potential section closing) ---
-            else if (line.startsWith('Final Score:')) {
-                // Close any potentially open section before the score header
-                if (currentListType === 'funnel-details' && currentSection === 'summaries') html += `</ul></div>`;
-                else if (currentListType && currentSection === 'lists') html += `</ul>`;
-                if (currentSection === 'breakdown') html += `</ul></div>`;
-                if (currentSection === 'summaries') html += `</div>`;
-                if (currentSection === 'lists') html += `</div>`;
-                if (currentSection === 'tips') html += `</div>`;
-
-                const match = line.match(/Final Score:\s*(\d+\/\d+)\s*\(([^)]+)\)/);
-                if (match) {
-                    html += `<div class="score-header">Final Score: <span class="score-value">${match[1]}</span> (<span class="interpretation">${match[2]}</span>)</div>`;
-                    currentSection = null; // Reset section after score
-                    currentListType = null;
+        }
+        if (!worker) parseInThisThread();
+
+        return {
+            push(chunk) {
+                if (closed) return;
+                if (worker) {
+                    chunks.push(chunk);
+                    worker.postMessage({ chunk });
                 } else {
-                    html += `<p>${line}</p>`; // Fallback
+                    enqueue(parser.push(chunk));
                 }
-            } 
-            // --- Content within Sections (if not a title or score header) ---
-            else {
-                // If no section has been identified yet (e.g., lines before 'Final Score'), skip.
-                if (!currentSection) return;
-
-                switch (currentSection) {
-                    case 'breakdown':
-                        const breakdownMatch = line.match(/•\s*([^–]+)\s*–\s*(.*)/);
-                        if (breakdownMatch) {
-                            html += `<li>${breakdownMatch[1].trim()}: <span class="category-score">${breakdownMatch[2].trim()}</span></li>`;
-                        }
-                        break;
-
-                    case 'summaries':
-                        console.log("Processing line in 'summaries' section:", line);
-                        const funnelHeaderMatch = line.match(/(###\s*F\d+)(\s*\(.*\))?/);
-                        if (funnelHeaderMatch) {
-                            console.log("Found funnel header:", line);
-                            // Close PREVIOUS funnel's list/div if open
-                            if (currentListType === 'funnel-details') {
-                                html += `</ul></div>`;
-                            }
-                            // Start the new funnel div and list
-                            html += `<div class="funnel-summary"><div class="funnel-title">${funnelHeaderMatch[1]}${funnelHeaderMatch[2] ? `<span>${funnelHeaderMatch[2]}</span>` : ''}</div><ul class="detail-list">`;
-                            currentListType = 'funnel-details';
-                        } 
-                        // Handle lines that start with '-' which are the funnel details
-                        else if (line.startsWith('-')) {
-                            console.log("Found detail line:", line);
-                            // Always ensure we're in a detail list when we see a '-' line in summaries section
-                            if (currentListType !== 'funnel-details') {
-                                console.warn("Found a detail line but not in funnel-details context. Creating list anyway.");
-                                html += `<ul class="detail-list">`;
-                                currentListType = 'funnel-details';
-                            }
-                            
-                            // Try to match the common pattern like "- Type: Content"
-                            const detailMatch = line.match(/-\s*([^:]+):\s*(.*)/);
-                            if (detailMatch) {
-                                html += `<li><strong>${detailMatch[1].trim()}:</strong> ${formatQuote(detailMatch[2])}</li>`;
-                            } else {
-                                // Handle other formats of detail lines
-                                html += `<li>${formatQuote(line.substring(1).trim())}</li>`;
-                            }
-                        }
-                        // Handle other content in the summaries section that's not a header or detail
-                        else if (currentListType === 'funnel-details' && !line.startsWith('Aggregate lists')) {
-                            // If we're in a funnel and the line doesn't start a new section, treat it as part of the current funnel
-                            console.log("Processing other line in funnel:", line);
-                            if (line.trim().length > 0) {
-                                html += `<li class="misc-item">${line}</li>`;
-                            }
-                        }
-                        // Don't close the funnel detail list until we hit a new section explicitly
-                        break;
-
-                    case 'lists':
-                        // Handle list titles and items in the Aggregate Lists section
-                        const trimmedLine = line.trim(); // Trim the line once
-
-                        // Check if this line looks like a list title (ends with colon)
-                        if (trimmedLine.endsWith(':') && 
-                            !trimmedLine.startsWith('•') && 
-                            !trimmedLine.startsWith('-') && 
-                            !trimmedLine.startsWith('*')) {
-                            
-                            // If we're currently in a list, close it
-                            if (currentListType) {
-                                html += `</ul>`;
-                            }
-                            
-                            // Get the title text (without the colon)
-                            const titleText = trimmedLine.substring(0, trimmedLine.lastIndexOf(':')).trim();
-                            
-                            // Check if this is the Missed Opportunities section
-                            const isMissedOpps = titleText.toLowerCase().includes('missed');
-                            const listClass = isMissedOpps ? 'missed-opportunities' : '';
-                            
-                            // Add the title and start a new list
-                            html += `<p class="list-title-paragraph" style="margin-top: 15px;"><strong>${titleText}:</strong></p>`;
-                            html += `<ul class="detail-list ${listClass}">`;
-                            
-                            // Remember what list we're in
-                            currentListType = titleText.toLowerCase();
-                        }
-                        // Check if this line is a list item (starts with bullet: •, -, or *) and currentListType is set
-                        else if ((trimmedLine.startsWith('•') || 
-                                 trimmedLine.startsWith('-') || 
-                                 trimmedLine.startsWith('*')) && currentListType) {
-                            
-                            // Get the text after the bullet
-                            let itemText = trimmedLine;
-                            if (itemText.startsWith('•')) itemText = itemText.substring(1).trim();
-                            else if (itemText.startsWith('-')) itemText = itemText.substring(1).trim();
-                            else if (itemText.startsWith('*')) itemText = itemText.substring(1).trim();
-                            
-                            // Add the list item if it's not empty
-                            if (itemText) {
-                                html += `<li>${formatQuote(itemText)}</li>`;
-                            }
-                        }
-                        // Handle cases where a line might belong to a list but doesn't start with a bullet (e.g., wrapped text)
-                        // This is a basic heuristic and might need refinement based on actual output variations.
-                        else if (currentListType && trimmedLine.length > 0 && !trimmedLine.endsWith(':')) {
-                            // Append to the last list item if it exists and seems like a continuation
-                            if (html.endsWith('</li>')) {
-                                // Remove closing tag, append text, add tag back
-                                html = html.slice(0, -5) + ` ${formatQuote(trimmedLine)}</li>`;
-                            } else {
-                                // Otherwise, treat as a new (potentially malformed) list item
-                                html += `<li>${formatQuote(trimmedLine)}</li>`;
-                            }
-                        }
-                        break;
-
-                    case 'tips':
-                        // Treat each paragraph as a tip
-                        html += `<p>${formatTipParagraph(line)}</p>`;
-                        break;
-
-                    default:
-                        // Avoid adding potentially stray lines if section is unknown
-                        break;
-                }
-            }
-        });
+            },
+            close() {
+                closed = true;
+                if (worker) worker.terminate();
+                if (frame !== null) cancelAnimationFrame(frame);
+                worker = null;
+                frame = null;
+            },
+        };
+    }
+
+    // Builds the report as DOM nodes from render operations (see report-parser.js), appending as it goes
+    function createReportView(container) {
+        let section = null; // the current section's element
+        let list = null;    // the <ul> new items go into
+        let lastItem = null;
 
-        // Close any open sections/lists at the very end
-        if (currentListType === 'funnel-details' && currentSection === 'summaries') {
-             html += `</ul></div>`; // Close last funnel
-        } else if (currentListType && currentSection === 'lists') {
-            html += `</ul>`; // Close last list in aggregates
+        function element(tag, className, text) {
+            const node = document.createElement(tag);
+            if (className) node.className = className;
+            if (text) node.textContent = text;
+            return node;
         }
-        // Close the overall section div if needed
-        if (currentSection === 'breakdown') html += `</ul></div>`; // Needs closing ul and div
-        if (currentSection === 'summaries') html += `</div>`; // Div only, ul closed above or not needed
-        if (currentSection === 'lists') html += `</div>`; // Div only, ul closed above
-        if (currentSection === 'tips') html += `</div>`;
 
-        return html;
+        function openSection(className, title) {
+            section = element('div', className);
+            section.append(element('h3', 'section-title', title));
+            container.append(section);
+            list = lastItem = null;
+        }
+
+        function openList(className) {
+            list = element('ul', className);
+            (section || container).append(list);
+            lastItem = null;
+            return list;
+        }
+
+        function addItem(className) {
+            lastItem = element('li', className);
+            (list || openList('detail-list')).append(lastItem);
+            return lastItem;
+        }
+
+        const handlers = {
+            score(op) {
+                section = list = lastItem = null;
+                const header = element('div', 'score-header', 'Final Score: ');
+                header.append(element('span', 'score-value', op.score));
+                if (op.band) header.append(' (', element('span', 'interpretation', op.band), ')');
+                container.append(header);
+            },
+            text(op) {
+                section = list = lastItem = null;
+                container.append(element('p', '', op.text));
+            },
+            section(op) {
+                const classNames = {
+                    breakdown: 'category-breakdown', summaries: 'funnel-summaries',
+                    lists: 'aggregate-lists', tips: 'coaching-tips-section',
+                };
+                openSection(classNames[op.section], op.title);
+                if (op.section === 'breakdown') openList('');
+            },
+            category(op) {
+                addItem('').append(`${op.name}: `, element('span', 'category-score', op.score));
+            },
+            funnel(op) {
+                const funnel = element('div', 'funnel-summary');
+                const title = element('div', 'funnel-title', op.id);
+                if (op.note) title.append(element('span', '', op.note));
+                funnel.append(title);
+                (section || container).append(funnel);
+                list = element('ul', 'detail-list');
+                funnel.append(list);
+                lastItem = null;
+            },
+            detail(op) {
+                const item = addItem('');
+                if (op.label) item.append(element('strong', '', `${op.label}:`), ' ');
+                item.append(quoted(op.text));
+            },
+            note(op) {
+                addItem('misc-item').textContent = op.text;
+            },
+            listTitle(op) {
+                const title = element('p', 'list-title-paragraph');
+                title.style.marginTop = '15px';
+                title.append(element('strong', '', `${op.title}:`));
+                (section || container).append(title);
+                openList(op.missed ? 'detail-list missed-opportunities' : 'detail-list');
+            },
+            item(op) {
+                addItem('').append(op.tag + quoted(op.text));
+            },
+            continue(op) {
+                if (lastItem) lastItem.append(` ${quoted(op.text)}`);
+                else addItem('').append(quoted(op.text));
+            },
+            tip(op) {
+                const tip = element('p');
+                appendTipText(tip, op.text);
+                (section || container).append(tip);
+            },
+        };
+
+        return {
+            apply(ops) {
+                for (const op of ops) handlers[op.op](op);
+            },
+            hasOutput() {
+                return container.hasChildNodes();
+            },
+            clear() {
+                container.replaceChildren();
+                section = list = lastItem = null;
+            },
+        };
     }
-    
-    // Helper to format quotes within list items or funnel details
-    function formatQuote(text) {
-        // Simple approach: escape HTML and wrap in quotes if not already quoted
-        text = text.replace(/</g, "&lt;").replace(/>/g, "&gt;");
-        if (text.startsWith('"') && text.endsWith('"')) {
-            return text;
+
+    // Renders a whole report: the server's parsed report when it has one, else the raw text
+    function renderAnalysis(container, data) {
+        const view = createReportView(container);
+        if (hasParsedReport(data.report)) {
+            view.apply(reportOps(data.report));
         } else {
-            return `"${text}"`;
+            const parser = new ReportLineParser();
+            view.apply(parser.push(data.analysis_text));
+            view.apply(parser.end());
         }
     }
-    
-    // Helper to format coaching tip paragraphs, adding <code> tags for quotes
-    function formatTipParagraph(text) {
-        // Find potential quotes (simple heuristic: text within double quotes)
-        // Escape HTML first to avoid breaking tags
-        text = text.replace(/</g, "&lt;").replace(/>/g, "&gt;");
-        // Replace quoted text with <code> tags
-        text = text.replace(/"([^"]+)"/g, (match, p1) => `<code>${p1}</code>`);
-        // Replace markdown-style bold (**text**) with <strong> tags
-        text = text.replace(/\*\*([^\*\*]+)\*\*/g, (match, p1) => `<strong>${p1}</strong>`);
-        return text;
+
+    function rawAnalysisView(text) {
+        const pre = document.createElement('pre');
+        pre.className = 'raw-analysis';
+        pre.textContent = text;
+        return pre;
+    }
+
+    function handleAnalysisData(data) {
+        if (data.error) {
+            showError(data.error);
+        } else if (data.is_error) {
+            // Specific backend errors like NEED_SPEAKER_ROLES
+            showError(data.analysis_text); 
+            if (data.speaker_roles) showSpeakerRolesProposal(data.speaker_roles);
+        } else if (data.analysis_text) {
+            // Log the raw text before attempting to format it
+            console.log('Raw analysis text:\n', data.analysis_text);
+            
+            // Store raw text in a global variable or similar scope if needed elsewhere
+            window.rawAnalysisText = data.analysis_text; // Keep for potential debug button
+            
+            // Prefer the report the server already parsed; fall back to formatting the raw text
+            const formatted = document.createElement('div');
+            try {
+                renderAnalysis(formatted, data);
+            } catch (formatError) {
+                console.error("Error during text formatting:", formatError);
+                formatted.replaceChildren();
+            }
+            const raw = rawAnalysisView(data.analysis_text);
+            analysisOutputPre.replaceChildren();
+
+            // Use the formatted report if there is one, otherwise show the raw text as a fallback
+            if (formatted.hasChildNodes()) {
+                raw.style.display = 'none';
+                analysisOutputPre.append(formatted, raw);
+            } else {
+                console.warn("Formatting failed or returned empty. Displaying raw text.");
+                const notice = document.createElement('p');
+                notice.className = 'raw-analysis-notice';
+                notice.textContent = 'Could not format analysis. Displaying raw text:';
+                analysisOutputPre.append(notice, raw);
+            }
+
+            // Add a debug button that might be useful for troubleshooting
+            const debugButton = document.createElement('button');
+            debugButton.textContent = 'Toggle Raw/Formatted View';
+            debugButton.style.marginTop = '20px';
+            debugButton.style.padding = '8px 12px';
+            debugButton.style.fontSize = '0.8em';
+            debugButton.style.backgroundColor = '#f0f0f0';
+            debugButton.style.border = '1px solid #ccc';
+            debugButton.style.borderRadius = '4px';
+            debugButton.style.cursor = 'pointer';
+            
+            debugButton.addEventListener('click', function() {
+                if (!formatted.hasChildNodes()) return;
+                const showRaw = this.dataset.showingRaw !== 'true';
+                // Show the raw text with line breaks preserved, or the formatted report again
+                formatted.style.display = showRaw ? 'none' : '';
+                raw.style.display = showRaw ? '' : 'none';
+                this.textContent = showRaw ? 'Show Formatted View' : 'Show Raw Text';
+                this.dataset.showingRaw = showRaw ? 'true' : 'false';
+            });
+            
+            // Add the debug button to the bottom of the results
+            analysisOutputPre.appendChild(debugButton);
+
+            if (data.near_duplicate) {
+                analysisOutputPre.prepend(nearDuplicateNotice(data.near_duplicate));
+            } else if (data.incremental) {
+                analysisOutputPre.prepend(incrementalNotice(data.incremental));
+            }
+
+            // ALWAYS show the results area if we got analysis_text
+            if (resultsArea.style.display !== 'block') {
+                resultsArea.style.display = 'block'; 
+                resultsArea.scrollIntoView({ behavior: 'smooth' });
+            }
+
+        } else {
+            // This case means response was OK, but no error and no analysis_text
+            showError('Received an empty analysis from the server.');
+        }
+    }
+
+    function hasParsedReport(report) {
+        return Boolean(report) && (report.final_score !== null || report.categories.length > 0);
+    }
+
+    // Explains that an earlier analysis of a near-identical transcript is shown, with a button to re-run it
+    function nearDuplicateNotice(match) {
+        const analysedAt = new Date(match.analysed_at * 1000).toLocaleString();
+        return reanalysisNotice(`This transcript is ${Math.round(match.similarity * 100)}% similar to one analysed on ${analysedAt}, so that analysis is shown.`,
+            'Analyze again');
+    }
+
+    // Explains that only the end of the transcript was analysed, continuing an earlier analysis of its start
+    function incrementalNotice(info) {
+        const analysedAt = new Date(info.analysed_at * 1000).toLocaleString();
+        return reanalysisNotice(`The first ${info.earlier_utterances} utterances were analysed on ${analysedAt}; only the ${info.new_utterances} after them were analysed now and the results merged.`,
+            'Analyze in full');
+    }
+
+    function reanalysisNotice(message, buttonLabel) {
+        const notice = document.createElement('div');
+        notice.className = 'near-duplicate-notice';
+        const text = document.createElement('p');
+        text.textContent = message;
+        const rerun = document.createElement('button');
+        rerun.type = 'button';
+        rerun.textContent = buttonLabel;
+        rerun.addEventListener('click', () => analyzeTranscript(true));
+        notice.append(text, rerun);
+        return notice;
+    }
+
+    // Shows the speaker roles the server proposed for NEED_SPEAKER_ROLES, with a button to confirm them and re-run
+    function showSpeakerRolesProposal(roles) {
+        const proposal = document.createElement('span');
+        proposal.className = 'speaker-roles-proposal';
+        proposal.textContent = `${roles.reason} Proposed roles: sales rep(s) ${roles.sales_reps.join(', ') || 'none'}; merchant(s) ${roles.merchants.join(', ') || 'none'}.`;
+        errorOutputP.append(proposal);
+        if (!roles.sales_reps.length || !roles.merchants.length) return;
+        const confirm = document.createElement('button');
+        confirm.type = 'button';
+        confirm.textContent = 'Use these roles';
+        confirm.addEventListener('click', () => {
+            salesRepNamesInput.value = roles.sales_reps.join(', ');
+            merchantNamesInput.value = roles.merchants.join(', ');
+            analyzeTranscript(false);
+        });
+        errorOutputP.append(confirm);
+    }
+
+    // Wraps list and funnel text in quotes unless it is already quoted
+    function quoted(text) {
+        return text.startsWith('"') && text.endsWith('"') ? text : `"${text}"`;
+    }
+
+    // Appends a coaching tip with its quotes as <code> and **bold** text as <strong>
+    function appendTipText(parent, text) {
+        const pattern = /"([^"]+)"|\*\*([^*]+)\*\*/g;
+        let last = 0;
+        let match;
+        while ((match = pattern.exec(text)) !== null) {
+            if (match.index > last) parent.append(text.slice(last, match.index));
+            const node = document.createElement(match[1] !== undefined ? 'code' : 'strong');
+            node.textContent = match[1] !== undefined ? match[1] : match[2];
+            parent.append(node);
+            last = pattern.lastIndex;
+        }
+        if (last < text.length) parent.append(text.slice(last));
     }
 
     function showError(message) {
@@ -0,0 +1,43 @@
+"""Shared test setup: the app runs against the fake model and keeps every store in a temporary directory."""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Set before app.py is imported, which reads its settings and opens its stores at import time
+_workdir = tempfile.mkdtemp(prefix='funnelbot-tests-')
+for _name, _file in [('RESULT_CACHE_PATH', 'result_cache.sqlite3'), ('JOB_STORE_PATH', 'jobs.sqlite3'),
+                     ('HISTORY_PATH', 'history.sqlite3'), ('NEAR_DUPLICATE_PATH', 'near_duplicates.sqlite3'),
+                     ('FUNNEL_STATE_PATH', 'funnel_states.sqlite3'), ('ASSET_BUILD_DIR', 'assets')]:
+    os.environ[_name] = os.path.join(_workdir, _file)
+os.environ['LLM_BACKEND'] = 'fake'
+os.environ['APP_CONFIG'] = 'testing'
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.create_app('testing').test_client()
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    return str(tmp_path)
+
+
+def sales_call(rep='Alice', merchant='Maria', topic=None):
+    """A short, well-formed sales call; `topic` makes its text unique, so no earlier analysis answers it."""
+    topic = topic or uuid.uuid4().hex
+    return '\n'.join([
+        f'{rep}: Thanks for joining today. What prompted you to look at your {topic} setup now?',
+        f'{merchant}: Our {topic} conversion dropped last quarter and we think card declines are the reason.',
+        f'{rep}: What do you think is driving those declines on the {topic} side?',
+        f'{merchant}: Mostly cross-border cards in Europe, and our {topic} acquirer does not retry them.',
+        f'{rep}: How much revenue would you estimate that {topic} is costing you every month?',
+        f'{merchant}: Roughly two percent of our {topic} volume, which the finance team keeps asking about.',
+    ])
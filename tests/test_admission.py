@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import admission
+
+
+def test_bucket_waits_for_the_tokens_it_lacks():
+    bucket = admission.TokenBucket(60)  # one unit a second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(2, now) == pytest.approx(2)
+    # A call bigger than the bucket waits for a full bucket rather than forever
+    assert bucket.wait_time(600, now) == pytest.approx(60)
+
+
+def test_bucket_adjusts_to_actual_usage_up_to_capacity():
+    bucket = admission.TokenBucket(100)
+    bucket.take(50)
+    bucket.adjust(-80)  # the call used 80 fewer tokens than estimated
+    assert bucket.level == 100
+    bucket.adjust(30)
+    assert bucket.level == 70
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = admission.TokenBucket(0)
+    bucket.take(10 ** 9)
+    assert bucket.wait_time(10 ** 9, time.monotonic()) == 0
+
+
+def queue_behind(scheduler, callers):
+    """Queues one call per (lane, user) in order behind a held slot; returns the order they are admitted in."""
+    held = scheduler.acquire(1)
+    admitted, threads = [], []
+
+    def call(lane, user):
+        with admission.calling_as(lane, user), scheduler.slot(1):
+            admitted.append((lane, user))
+
+    for lane, user in callers:
+        queued = scheduler.queued
+        threads.append(threading.Thread(target=call, args=(lane, user)))
+        threads[-1].start()
+        while scheduler.queued == queued:
+            time.sleep(0.001)
+    scheduler.release(held)
+    for thread in threads:
+        thread.join(5)
+    return admitted
+
+
+def test_interactive_calls_go_first_and_users_take_turns():
+    scheduler = admission.Scheduler(max_concurrent=1)
+    bulk, interactive = admission.BULK, admission.INTERACTIVE
+    order = queue_behind(scheduler, [(bulk, 'batch'), (bulk, 'batch'), (bulk, 'batch'), (bulk, 'other'),
+                                     (interactive, 'coach')])
+    assert order == [(interactive, 'coach'), (bulk, 'batch'), (bulk, 'other'), (bulk, 'batch'), (bulk, 'batch')]
+    assert (scheduler.queued, scheduler.in_flight) == (0, 0)
+
+
+def retry_after(scheduler):
+    with pytest.raises(admission.QueueFull) as raised:
+        scheduler.acquire(1)
+    assert scheduler.queued == 0
+    return raised.value.position, raised.value.retry_after
+
+
+def test_full_queue_raises_with_a_retry_estimate():
+    # The call ahead takes 20s on one of two slots; the request rate alone would allow it in 1s
+    scheduler = admission.Scheduler(requests_per_minute=60, max_concurrent=2, max_queued=0, call_seconds=20)
+    assert retry_after(scheduler) == (1, 10)
+    # Without a concurrency cap the request rate decides
+    assert retry_after(admission.Scheduler(requests_per_minute=30, max_queued=0, call_seconds=20)) == (1, 2)
+    assert retry_after(admission.Scheduler(max_queued=0)) == (1, admission.DEFAULT_RETRY_AFTER_SECONDS)
+
+
+def test_retry_estimate_follows_observed_call_time():
+    scheduler = admission.Scheduler(max_concurrent=1, call_seconds=100)
+    for _ in range(20):
+        with scheduler.slot(1):
+            pass
+    scheduler.max_queued = 0
+    assert retry_after(scheduler) == (1, 2)
+
+
+def test_timed_out_calls_leave_the_queue():
+    scheduler = admission.Scheduler(max_concurrent=1)
+    held = scheduler.acquire(1)
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(1, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        asyncio.run(scheduler.acquire_async(1, timeout=0.05))
+    assert (scheduler.queued, scheduler.in_flight) == (0, 1)
+    scheduler.release(held)
+
+
+def test_admitted_backend_charges_actual_usage():
+    class Backend:
+        name, is_configured = 'stub', True
+
+        def generate(self, user_prompt, timeout=None):
+            return type('Response', (), {'usage_metadata': type('Usage', (), {'total_token_count': 40})()})()
+
+    scheduler = admission.Scheduler(tokens_per_minute=1000)
+    admission.AdmittedBackend(Backend(), scheduler, lambda user_prompt: 100).generate('prompt')
+    assert scheduler.tokens.level == pytest.approx(960, abs=1)
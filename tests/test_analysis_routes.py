@@ -0,0 +1,121 @@
+"""The Flask routes and their coroutine versions in asgi.py answer alike."""
+import json
+import uuid
+
+import pytest
+from starlette.testclient import TestClient
+
+from conftest import sales_call
+
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def server(request, client):
+    if request.param == 'wsgi':
+        yield client
+        return
+    import asgi
+    with TestClient(asgi.application) as asgi_client:
+        yield asgi_client
+
+
+def body(response):
+    return response.get_json() if hasattr(response, 'get_json') else response.json()
+
+
+def done_event(response):
+    text = response.get_data(as_text=True) if hasattr(response, 'get_data') else response.text
+    return json.loads(text.split('event: done\ndata: ')[1].split('\n')[0])
+
+
+def test_analysis_is_cached(server):
+    request = {'transcript': sales_call(), 'sales_rep_names': 'Alice'}
+    first = server.post('/analyze', json=request)
+    assert first.headers['X-Cache'] == 'MISS'
+    payload = body(first)
+    assert payload['report']['categories']
+    assert payload['speaker_roles']['merchants'] == ['Maria']
+    assert {'transcript_stats', 'analysis_mode'} <= set(payload)
+    assert server.post('/analyze', json=request).headers['X-Cache'] == 'HIT'
+
+
+def test_stream_answers_like_analyze(server):
+    request = {'transcript': sales_call(), 'sales_rep_names': 'Alice'}
+    streamed = server.post('/analyze/stream', json=request)
+    assert streamed.headers['X-Cache'] == 'MISS'
+    done = done_event(streamed)
+    again = server.post('/analyze', json=request)
+    assert again.headers['X-Cache'] == 'HIT'
+    assert body(again)['analysis_text'] == done['analysis_text']
+    assert server.post('/analyze/stream', json=request).headers['X-Cache'] == 'HIT'
+
+
+def test_preflight_answers_without_model_call(server):
+    request = {'transcript': sales_call() + '\nMaria: My card is 4111 1111 1111 1111.', 'sales_rep_names': 'Alice'}
+    payload = body(server.post('/analyze', json=request))
+    assert payload['preflight']['code'] == 'DATA_NOT_REDACTED'
+    assert done_event(server.post('/analyze/stream', json=request))['preflight']['code'] == 'DATA_NOT_REDACTED'
+
+
+def events(response):
+    text = response.get_data(as_text=True) if hasattr(response, 'get_data') else response.text
+    parsed = []
+    for block in text.split('\n\n'):
+        if block:
+            event, data = block.split('\n')
+            parsed.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return parsed
+
+
+def test_stream_sends_chunks_then_done(server):
+    response = server.post('/analyze/stream', json={'transcript': sales_call(), 'sales_rep_names': 'Alice'})
+
+    assert response.headers['Content-Type'].startswith('text/event-stream')
+    assert response.headers['Cache-Control'] == 'no-cache'
+    streamed = events(response)
+    assert [event for event, _ in streamed] == ['chunk'] * (len(streamed) - 1) + ['done']
+    assert len(streamed) > 2
+    done = streamed[-1][1]
+    assert done['report']['categories']
+    # The chunks are the model's text as generated; done carries the corrected report text
+    assert ''.join(data['text'] for _, data in streamed[:-1]).startswith('Final Score:')
+
+
+def test_stream_rejects_invalid_input_before_streaming(server):
+    response = server.post('/analyze/stream', json={'transcript': '', 'sales_rep_names': 'Alice'})
+
+    assert response.status_code == 400
+    assert 'error' in body(response)
+
+
+def test_stream_ends_with_an_error_event_when_the_model_fails(server, monkeypatch):
+    import llm_backends
+
+    def stream(self, user_prompt, timeout=None):
+        yield 'Final Score: '
+        raise RuntimeError('connection reset')
+
+    async def astream(self, user_prompt, timeout=None):
+        yield 'Final Score: '
+        raise RuntimeError('connection reset')
+
+    monkeypatch.setattr(llm_backends.FakeBackend, 'stream', stream)
+    monkeypatch.setattr(llm_backends.FakeBackend, 'astream', astream)
+    streamed = events(server.post('/analyze/stream', json={'transcript': sales_call(), 'sales_rep_names': 'Alice'}))
+
+    assert streamed[0] == ('chunk', {'text': 'Final Score: '})
+    assert streamed[-1][0] == 'error'
+    assert 'connection reset' in streamed[-1][1]['error']
+
+
+@pytest.mark.parametrize('route', ['/analyze', '/analyze/stream'])
+def test_team_can_be_given_in_the_query_string(server, route):
+    import app
+
+    rep = f'Rep {uuid.uuid4().hex[:8]}'
+    response = server.post(f'{route}?team=Growth', json={'transcript': sales_call(rep=rep), 'sales_rep_names': rep})
+    assert response.status_code == 200
+    if route == '/analyze/stream':
+        done_event(response)
+
+    entries, _ = app.analysis_history.history(rep=rep)
+    assert [entry['team'] for entry in entries] == ['Growth']
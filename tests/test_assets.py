@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import assets
+
+
+def test_build_hashes_and_compresses(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'img').mkdir()
+    (static / 'img' / 'logo.svg').write_text('<svg/>')
+    (static / 'css' / 'style.css').write_text('body {\n    background: url("../img/logo.svg");\n}\n' * 50)
+    manifest = assets.build(str(static), str(tmp_path / 'build'))
+    built_css = manifest['css/style.css']
+    assert built_css != 'css/style.css'
+    css = (tmp_path / 'build' / built_css).read_text()
+    assert manifest['img/logo.svg'].split('/')[-1] in css
+    assert os.path.exists(tmp_path / 'build' / (built_css + '.gz'))
+
+
+def test_page_self_hosts_the_font(client):
+    import app
+    page = client.get('/').get_data(as_text=True)
+    has_font = os.path.isfile(os.path.join(app.bp.root_path, 'static', 'fonts', 'inter-latin.woff2'))
+    assert 'src: local("Inter")' in page
+    assert ('inter-latin' in page) is has_font
+    assert 'fonts.googleapis.com' not in page
+
+
+def make_font(path):
+    """A TrueType font with one glyph shared by 'A' and 'α'."""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((500, 700))
+    pen.lineTo((1000, 0))
+    pen.closePath()
+    names = ['.notdef', 'A', 'alpha']
+    font = FontBuilder(1000, isTTF=True)
+    font.setupGlyphOrder(names)
+    font.setupCharacterMap({ord('A'): 'A', ord('α'): 'alpha'})
+    font.setupGlyf({name: pen.glyph() for name in names})
+    font.setupHorizontalMetrics({name: (1000, 0) for name in names})
+    font.setupHorizontalHeader(ascent=800, descent=-200)
+    font.setupNameTable({'familyName': 'Test', 'styleName': 'Regular'})
+    font.setupOS2()
+    font.setupPost()
+    font.save(path)
+    return path
+
+
+def test_build_font_subsets_the_source_once(tmp_path):
+    pytest.importorskip('brotli')
+    pytest.importorskip('fontTools')
+    source = make_font(str(tmp_path / 'Test.ttf'))
+
+    static = tmp_path / 'static'
+    target = assets.build_font(source, str(static))
+    assert target == str(static / assets.FONT_OUTPUT)
+    with open(target, 'rb') as f:
+        assert f.read(4) == b'wOF2'
+    from fontTools.ttLib import TTFont
+    assert set(TTFont(target).getBestCmap()) == {ord('A')}  # alpha is outside the Latin subset
+
+    modified = os.path.getmtime(target)
+    assert assets.build_font(source, str(static)) == target
+    assert os.path.getmtime(target) == modified
+    assert assets.build_font(str(tmp_path / 'missing.ttf'), str(static)) is None
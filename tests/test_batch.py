@@ -0,0 +1,66 @@
+import io
+import json
+import zipfile
+
+import batch
+from conftest import sales_call
+
+
+def jsonl(*items):
+    return '\n'.join(item if isinstance(item, str) else json.dumps(item) for item in items).encode('utf-8')
+
+
+def test_lines_that_are_not_objects_become_per_line_errors():
+    source = jsonl({'id': 'call', 'transcript': 'Alice: hi', 'sales_rep_names': 'Alice'}, '[]', '"x"', '{oops')
+    items = list(batch.read_items(io.BytesIO(source), 'calls.jsonl'))
+
+    assert items[0]['id'] == 'call'
+    assert [(item['id'], item['invalid']) for item in items[1:]] == [
+        ('line-2', 'Line is not a JSON object.'),
+        ('line-3', 'Line is not a JSON object.'),
+        ('line-4', 'Line is not valid JSON.'),
+    ]
+
+
+def test_zip_members_use_the_manifest():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('manifest.jsonl', json.dumps({'file': 'a.txt', 'id': 'a', 'sales_rep_names': 'Alice'}))
+        archive.writestr('a.txt', 'Alice: hi')
+        archive.writestr('more.jsonl', jsonl({'transcript': 'Bob: hi', 'sales_rep_names': 'Bob'}))
+    buffer.seek(0)
+
+    items = {item['id']: item for item in batch.read_items(buffer, 'calls.zip')}
+    assert items['a']['sales_rep_names'] == 'Alice'
+    assert items['a']['merchant_names'] == 'Customer'
+    assert items['more.jsonl:line-1']['transcript'] == 'Bob: hi'
+
+
+def test_batch_endpoint_streams_a_record_per_line(client):
+    source = jsonl({'id': 'call', 'transcript': sales_call(), 'sales_rep_names': 'Alice', 'merchant_names': 'Maria'},
+                   '[]', {'id': 'no-rep', 'transcript': sales_call()})
+    response = client.post('/batch', data={'file': (io.BytesIO(source), 'calls.jsonl')})
+
+    records = {record['id']: record for record in map(json.loads, response.get_data(as_text=True).splitlines())}
+    assert records['call']['status'] == 200 and records['call']['report']
+    assert records['line-2'] == {'id': 'line-2', 'status': 400, 'error': 'Line is not a JSON object.'}
+    assert records['no-rep']['status'] == 400
+
+
+def test_bad_manifest_lines_become_per_line_errors():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('manifest.jsonl', '\n'.join([
+            json.dumps({'file': 'a.txt', 'sales_rep_names': 'Alice'}), '{oops', '[]', json.dumps({'id': 'b'})]))
+        archive.writestr('a.txt', 'Alice: hi')
+        archive.writestr('b.txt', 'Bob: hi')
+    buffer.seek(0)
+
+    items = {item['id']: item for item in batch.read_items(buffer, 'calls.zip')}
+    assert {key: item['invalid'] for key, item in items.items() if 'invalid' in item} == {
+        'manifest.jsonl:line-2': 'Manifest line is not valid JSON.',
+        'manifest.jsonl:line-3': 'Manifest line is not a JSON object.',
+        'manifest.jsonl:line-4': 'Manifest line has no "file".',
+    }
+    assert items['a.txt']['sales_rep_names'] == 'Alice'
+    assert items['b.txt']['sales_rep_names'] is None
@@ -0,0 +1,106 @@
+import sqlite3
+import uuid
+
+import history
+from conftest import sales_call
+
+
+def payload(score, discovery):
+    return {'analysis_text': f'Final score {score}', 'report': {
+        'final_score': score, 'max_score': 100, 'band': 'Good',
+        'categories': [{'name': 'Discovery', 'score': discovery, 'max': 20}],
+    }}
+
+
+def leaderboard(store, scope=history.REP):
+    entries, _ = store.leaderboard(scope)
+    return {entry['name']: entry for entry in entries}
+
+
+def test_a_continuation_replaces_the_first_part_in_the_rollups(workdir):
+    store = history.HistoryStore(f'{workdir}/history.sqlite3')
+    store.record('other', 'v1', 'Alice', 'Maria', payload(80, 16), team='Sales')
+    first = store.record('first-half', 'v1', 'Alice', 'Maria', payload(40, 6), team='Sales')
+    whole = store.record('whole', 'v1', 'Alice', 'Maria', payload(70, 12), team='Sales', supersedes='first-half')
+
+    for scope in history.SCOPES:
+        entry = next(iter(leaderboard(store, scope).values()))
+        assert (entry['analyses'], entry['average_score'], entry['best_score'], entry['worst_score']) == (2, 75, 80, 70)
+        assert entry['categories'] == [{'name': 'Discovery', 'analyses': 2, 'average_score': 14, 'average_max': 20}]
+    entries, _ = store.history(rep='alice')
+    assert [entry['final_score'] for entry in entries] == [70, 80]
+    assert store.get(first)['superseded_by'] == whole
+
+
+def test_superseding_the_only_analysis_leaves_the_newer_one(workdir):
+    store = history.HistoryStore(f'{workdir}/history.sqlite3')
+    store.record('first-half', 'v1', 'Alice', 'Maria', payload(40, 6))
+    store.record('whole', 'v1', 'Bob', 'Maria', payload(70, 12), supersedes='first-half')
+
+    assert list(leaderboard(store)) == ['Bob']
+    # Superseding twice, or an unknown key, changes nothing
+    store.record('again', 'v1', 'Bob', 'Maria', payload(60, 10), supersedes='first-half')
+    store.record('other', 'v1', 'Bob', 'Maria', payload(50, 10), supersedes='unknown')
+    assert leaderboard(store)['Bob']['analyses'] == 3
+
+
+def test_histories_without_the_superseded_column_are_upgraded(workdir):
+    path = f'{workdir}/history.sqlite3'
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE analyses (id INTEGER PRIMARY KEY, result_key TEXT NOT NULL UNIQUE,'
+                     ' created_at REAL NOT NULL, prompt_version TEXT NOT NULL, sales_rep_names TEXT NOT NULL,'
+                     ' merchant_names TEXT, team TEXT NOT NULL, final_score REAL, max_score REAL, band TEXT,'
+                     ' categories TEXT NOT NULL, analysis_text TEXT NOT NULL)')
+    store = history.HistoryStore(path)
+
+    assert store.get(store.record('key', 'v1', 'Alice', 'Maria', payload(70, 12)))['superseded_by'] is None
+
+
+def test_a_call_analysed_in_two_parts_counts_once(client):
+    rep = f'Rep {uuid.uuid4().hex[:8]}'
+    first = sales_call(rep=rep)
+    body = {'transcript': first, 'sales_rep_names': rep, 'merchant_names': 'Maria'}
+    assert client.post('/analyze', json=body).status_code == 200
+    extended = first + f'\n{rep}: Would a retry on declined cards help?\nMaria: Yes, that sounds useful.'
+    assert 'incremental' in client.post('/analyze', json=dict(body, transcript=extended)).json
+
+    response = client.get('/history', query_string={'rep': rep})
+    assert len(response.json['analyses']) == 1
+    board = {entry['name']: entry for entry in client.get('/leaderboard').json['entries']}
+    assert board[rep]['analyses'] == 1
+
+
+def test_teams_match_by_name_key(workdir):
+    store = history.HistoryStore(f'{workdir}/history.sqlite3')
+    store.record('first', 'v1', 'Alice', 'Maria', payload(80, 16), team='Équipe Nord')
+    store.record('second', 'v1', 'Bob', 'Maria', payload(40, 6), team='ÉQUIPE  nord ')
+    store.record('whole', 'v1', 'Bob', 'Maria', payload(60, 10), team='équipe nord', supersedes='second')
+    store.record('other', 'v1', 'Carol', 'Maria', payload(90, 18), team='Équipe Sud')
+
+    entries, _ = store.history(team='équipe NORD')
+    assert [entry['final_score'] for entry in entries] == [60, 80]
+    reps, _ = store.leaderboard(history.REP, team='ÉQUIPE NORD')
+    assert [entry['name'] for entry in reps] == ['Alice', 'Bob']
+    teams = leaderboard(store, history.TEAM)
+    assert (teams['équipe nord']['analyses'], teams['équipe nord']['worst_score']) == (2, 60)
+
+
+def test_histories_without_team_keys_are_upgraded(workdir):
+    path = f'{workdir}/history.sqlite3'
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE analyses (id INTEGER PRIMARY KEY, result_key TEXT NOT NULL UNIQUE,'
+                     ' created_at REAL NOT NULL, prompt_version TEXT NOT NULL, sales_rep_names TEXT NOT NULL,'
+                     ' merchant_names TEXT, team TEXT NOT NULL, final_score REAL, max_score REAL, band TEXT,'
+                     ' categories TEXT NOT NULL, analysis_text TEXT NOT NULL, superseded_by INTEGER)')
+        conn.execute("INSERT INTO analyses (result_key, created_at, prompt_version, sales_rep_names, team,"
+                     " final_score, categories, analysis_text) VALUES ('old', 1, 'v1', 'Alice', 'Sales', 70, '[]', '')")
+        conn.execute('CREATE TABLE rollups (scope TEXT NOT NULL, key TEXT NOT NULL, name TEXT NOT NULL,'
+                     ' team TEXT NOT NULL, analyses INTEGER NOT NULL, score_sum REAL NOT NULL, best REAL NOT NULL,'
+                     ' worst REAL NOT NULL, last_at REAL NOT NULL, PRIMARY KEY (scope, key))')
+        conn.execute("INSERT INTO rollups VALUES ('rep', 'alice', 'Alice', 'Sales', 1, 70, 70, 70, 1)")
+    store = history.HistoryStore(path)
+
+    entries, _ = store.history(team='SALES')
+    assert [entry['team'] for entry in entries] == ['Sales']
+    reps, _ = store.leaderboard(history.REP, team='sales')
+    assert [entry['name'] for entry in reps] == ['Alice']
@@ -0,0 +1,73 @@
+import incremental
+import llm_backends
+import transcripts
+from conftest import sales_call
+
+REPORT = {'categories': [{'name': 'Discovery', 'score': 4, 'max': 10}], 'funnels': [], 'aggregate_lists': []}
+
+
+def utterances(text):
+    return transcripts.parse_utterances(text)
+
+
+def test_find_returns_the_longest_stored_prefix(workdir):
+    store = incremental.FunnelStateStore(f'{workdir}/states.sqlite3')
+    call = utterances(sales_call())
+    store.add('four', 'v1', 'Alice', 'Maria', call[:4], REPORT)
+    store.add('five', 'v1', 'Alice', 'Maria', call[:5], REPORT)
+
+    match = store.find('v1', 'Alice', 'Maria', call)
+    assert match['result_key'] == 'five'
+    assert match['resume_at'] == 5
+    assert match['report'] == REPORT
+
+
+def test_find_resumes_at_a_last_utterance_that_was_cut_short(workdir):
+    store = incremental.FunnelStateStore(f'{workdir}/states.sqlite3')
+    call = utterances(sales_call())
+    cut = call[:3] + [call[3]._replace(text=call[3].text[:20])]
+    store.add('cut', 'v1', 'Alice', 'Maria', cut, REPORT)
+
+    assert store.find('v1', 'Alice', 'Maria', call)['resume_at'] == 3
+
+
+def test_find_needs_the_same_version_and_names(workdir):
+    store = incremental.FunnelStateStore(f'{workdir}/states.sqlite3')
+    call = utterances(sales_call())
+    store.add('four', 'v1', 'Alice', 'Maria', call[:4], REPORT)
+
+    assert store.find('v1', ' alice ', 'MARIA', call) is not None
+    assert store.find('v2', 'Alice', 'Maria', call) is None
+    assert store.find('v1', 'Bob', 'Maria', call) is None
+    # The same transcript is the result cache's to answer
+    assert store.find('v1', 'Alice', 'Maria', call[:4]) is None
+
+
+def test_continuation_sentinel_falls_back_to_a_full_analysis(client, monkeypatch):
+    import app
+
+    first = sales_call()
+    extended = first + '\nAlice: Would a retry on declined cards help?\nMaria: Yes, that sounds useful.'
+    body = {'transcript': first, 'sales_rep_names': 'Alice', 'merchant_names': 'Maria'}
+    assert client.post('/analyze', json=body).status_code == 200
+
+    prompts = []
+    generate = llm_backends.FakeBackend.generate
+
+    def answer(self, user_prompt, timeout=None):
+        prompts.append(user_prompt)
+        if '(CONTINUATION)' in user_prompt:
+            return self._response(user_prompt, 'UNSUPPORTED_INPUT')
+        return generate(self, user_prompt, timeout)
+
+    monkeypatch.setattr(llm_backends.FakeBackend, 'generate', answer)
+    response = client.post('/analyze', json=dict(body, transcript=extended))
+
+    assert response.status_code == 200
+    assert not response.json.get('is_error')
+    assert 'incremental' not in response.json
+    assert ['(CONTINUATION)' in user_prompt for user_prompt in prompts] == [True, False]
+    # Recorded as a full analysis of the extended transcript, not as a continuation of the first
+    fields, _, _ = app.normalise_fields((extended, 'Alice', 'Maria'))
+    with app.modes.using(app.modes.STANDARD):
+        assert app.analysis_history.find(app.result_key(fields)) is not None
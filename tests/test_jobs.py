@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import time
+
+import jobs
+
+
+def make_queue(workdir, run, **kwargs):
+    return jobs.JobQueue(f'{workdir}/jobs.sqlite3', run, max_workers=1, **kwargs)
+
+
+def wait_for(queue, job_id, status):
+    for _ in range(200):
+        job = queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job is still {job["status"]}')
+
+
+def age(workdir, job_id, seconds):
+    with sqlite3.connect(f'{workdir}/jobs.sqlite3') as conn:
+        conn.execute('UPDATE jobs SET updated_at = updated_at - ? WHERE id = ?', (seconds, job_id))
+
+
+def test_jobs_run_and_record_their_result(workdir):
+    queue = make_queue(workdir, lambda fields: ({'analysis_text': fields[0]}, 200))
+    job = wait_for(queue, queue.submit(('call', 'Alice', 'Maria')), jobs.DONE)
+    assert (job['result'], job['result_status']) == ({'analysis_text': 'call'}, 200)
+    assert queue.pending == 0
+
+
+def test_jobs_of_a_process_that_went_away_fail_as_interrupted(workdir):
+    release = threading.Event()
+    dead = make_queue(workdir, lambda fields: release.wait(5) and ({}, 200), stale_seconds=60)
+    running, queued = dead.submit(('a', 'Alice', 'Maria')), dead.submit(('b', 'Alice', 'Maria'))
+    wait_for(dead, running, jobs.RUNNING)
+    age(workdir, running, 120)
+    age(workdir, queued, 120)
+    # This process still runs them, so its own polls leave them alone
+    assert dead.get(running)['status'] == jobs.RUNNING
+
+    # A restarted worker's queue finds them stale on startup
+    restarted = make_queue(workdir, lambda fields: ({}, 200), stale_seconds=60)
+    for job_id in (running, queued):
+        job = restarted.get(job_id)
+        assert (job['status'], job['result_status']) == (jobs.FAILED, 500)
+        assert job['result'] == {'error': jobs.INTERRUPTED_ERROR}
+    release.set()
+
+
+def test_stale_and_expired_jobs_are_cleaned_up_on_poll(workdir):
+    release = threading.Event()
+    dead = make_queue(workdir, lambda fields: release.wait(5) and ({}, 200))
+    stuck = dead.submit(('a', 'Alice', 'Maria'))
+    wait_for(dead, stuck, jobs.RUNNING)
+    poller = make_queue(workdir, lambda fields: ({}, 200), stale_seconds=60, ttl_seconds=3600)
+
+    age(workdir, stuck, 120)
+    assert poller.get(stuck)['status'] == jobs.FAILED
+    # The TTL applies to jobs that never finished too
+    age(workdir, stuck, 7200)
+    assert poller.get(stuck) is None
+    release.set()
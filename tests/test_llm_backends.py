@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_backends
+
+
+def test_fake_backend_answers_the_same_prompt_the_same_way(tmp_path):
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f'{name}.txt').write_text(f'Final Score: {name}\n', encoding='utf-8')
+    backend = llm_backends.FakeBackend('model', {}, reports_dir=str(tmp_path))
+
+    answers = {backend.generate(f'prompt {n}').text for n in range(20)}
+    assert answers == {'Final Score: a', 'Final Score: b', 'Final Score: c'}
+    assert backend.generate('prompt 1').text == backend.generate('prompt 1').text
+
+
+def test_fake_backend_defaults_to_the_sample_report():
+    response = llm_backends.FakeBackend('model', {}).generate('prompt')
+
+    assert response.text == llm_backends.sample_report()
+    assert response.text.startswith('Final Score:')
+    assert response.usage_metadata.candidates_token_count == len(response.text) // 4
+
+
+def test_fake_backend_streams_the_report():
+    backend = llm_backends.FakeBackend('model', {})
+    assert ''.join(backend.stream('prompt')) == backend.generate('prompt').text
+
+    async def collect():
+        return ''.join([chunk async for chunk in backend.astream('prompt')]), (await backend.agenerate('prompt')).text
+
+    streamed, generated = asyncio.run(collect())
+    assert streamed == generated == backend.generate('prompt').text
+
+
+def test_fake_backend_times_out():
+    backend = llm_backends.FakeBackend('model', {}, latency=5)
+    with pytest.raises(TimeoutError):
+        backend.generate('prompt', timeout=0.01)
+    with pytest.raises(TimeoutError):
+        asyncio.run(backend.agenerate('prompt', timeout=0.01))
+
+
+def test_backends_are_shared_per_model_and_config():
+    backend = llm_backends.get_backend('fake', 'shared-model', {'temperature': 0, 'top_p': 1})
+
+    assert llm_backends.get_backend('fake', 'shared-model', {'top_p': 1, 'temperature': 0}) is backend
+    assert llm_backends.get_backend('fake', 'shared-model', {'temperature': 1}) is not backend
+    with pytest.raises(ValueError, match='Unknown LLM backend'):
+        llm_backends.get_backend('other', 'shared-model', {})
+
+
+def test_gemini_stream_skips_chunks_without_text():
+    chunks = [SimpleNamespace(parts=[SimpleNamespace(text='Final ')]), SimpleNamespace(parts=[]),
+              SimpleNamespace(parts=[SimpleNamespace(text='Score')])]
+    calls = []
+
+    class Model:
+        def generate_content(self, user_prompt, stream=False, request_options=None):
+            calls.append(request_options)
+            return iter(chunks)
+
+    prefix = SimpleNamespace(model_for=lambda model_name, generation_config: Model())
+    backend = llm_backends.GeminiBackend('model', {}, api_key='key', prefix=prefix)
+
+    assert list(backend.stream('prompt', timeout=30)) == ['Final ', 'Score']
+    assert calls == [{'timeout': 30, 'retry': None}]
+    assert not llm_backends.GeminiBackend('model', {}).is_configured
@@ -0,0 +1,118 @@
+import long_transcripts
+import report_parser
+import transcripts
+
+MAXIMA = {'Question type & flow': 30, 'Funnel execution': 20, 'Pain discovery': 15}
+
+
+def utterances(lines):
+    return transcripts.parse_utterances('\n'.join(lines))
+
+
+def funnel(id, thinking, points=10, *others):
+    items = [{'label': 'Thinking', 'text': thinking}] + [{'label': 'Explore', 'text': text} for text in others]
+    return {'id': id, 'execution_points': points, 'header_note': f'(Points earned for execution: +{points})',
+            'items': items}
+
+
+def report(funnels, scores=None, pains=(), tips=()):
+    scores = dict({'Question type & flow': 20, 'Funnel execution': 0, 'Pain discovery': 10}, **(scores or {}))
+    return dict(report_parser.empty_report(),
+                categories=[{'name': name, 'score': score, 'max': MAXIMA[name], 'note': None}
+                            for name, score in scores.items()],
+                funnels=funnels,
+                aggregate_lists=[{'title': 'Pain points identified',
+                                  'items': [{'funnel': tag, 'text': text} for tag, text in pains]}],
+                coaching_tips=list(tips))
+
+
+def test_short_call_is_one_window():
+    call = utterances(['Alice: Hi Maria.', 'Maria: Hello.'])
+    assert long_transcripts.split_windows(call, 'Alice') == [call]
+
+
+def test_windows_overlap_and_cover_the_call():
+    call = utterances([f'{"Alice" if n % 2 else "Maria"}: Line number {n} of the call.' for n in range(40)])
+    windows = long_transcripts.split_windows(call, 'Alice', max_chars=300, overlap=2)
+
+    assert len(windows) > 2
+    assert windows[0][0] == call[0] and windows[-1][-1] == call[-1]
+    for previous, window in zip(windows, windows[1:]):
+        assert previous[-2:] == window[:2]
+
+
+def test_cut_moves_back_to_a_thinking_question():
+    lines = [f'Maria: Just some background number {n}.' for n in range(10)]
+    lines[7] = 'Alice: How is that affecting your team?'
+    call = utterances(lines)
+
+    first = long_transcripts.split_windows(call, 'Alice', max_chars=300, overlap=0)[0]
+    assert first == call[:7]
+
+
+def test_merge_renumbers_funnels_and_merges_overlaps():
+    first = report([funnel('F1', '"Why now?"', 10), funnel('F2', '"How do declines affect you?"', 0, '"Which cards?"')],
+                   pains=[('F2', 'Declines on cross-border cards')], tips=['Go deeper in F2.'])
+    second = report([funnel('F1', '"How do declines affect you?"', 10, '"Which cards?"', '"Since when?"'),
+                     funnel('F2', '"What would fixing it mean?"', 10)],
+                    scores={'Pain discovery': 12.5},
+                    pains=[('F1', 'Declines on cross-border cards'), ('F2', 'Manual refunds')],
+                    tips=['Go deeper in F1.'])
+
+    merged = long_transcripts.merge_reports([first, second])
+
+    assert [f['id'] for f in merged['funnels']] == ['F1', 'F2', 'F3']
+    assert merged['funnels'][1]['execution_points'] == 10
+    assert [item['text'] for item in merged['funnels'][1]['items']] == [
+        '"How do declines affect you?"', '"Which cards?"', '"Since when?"']
+    assert merged['aggregate_lists'][0]['items'] == [{'funnel': 'F2', 'text': 'Declines on cross-border cards'},
+                                                     {'funnel': 'F3', 'text': 'Manual refunds'}]
+    assert merged['coaching_tips'] == ['Go deeper in F2.']
+    scores = {c['name']: c['score'] for c in merged['categories']}
+    # Best window score per category; funnel execution recomputed from the three complete funnels
+    assert scores == {'Question type & flow': 20, 'Funnel execution': 20, 'Pain discovery': 12.5}
+    assert merged['final_score'] == 53
+
+
+def test_continued_report_extends_an_open_funnel():
+    first = report([funnel('F1', '"Why now?"', 0)])
+    rest = report([{'id': 'F1', 'execution_points': 10, 'header_note': None,
+                    'items': [{'label': 'Narrow', 'text': '"So retries first?"'}]}])
+
+    assert len(long_transcripts.merge_reports([first, rest])['funnels']) == 2
+    merged = long_transcripts.merge_reports([first, rest], continues=True)
+    assert len(merged['funnels']) == 1
+    assert merged['funnels'][0]['execution_points'] == 10
+    assert [item['text'] for item in merged['funnels'][0]['items']] == ['"Why now?"', '"So retries first?"']
+
+
+def test_analyse_windows_merges_the_window_reports():
+    windows = [utterances(['Alice: How is it going?', 'Maria: Fine.'])] * 2
+    seen = []
+
+    def analyse(fields):
+        seen.append(fields)
+        return {'analysis_text': '', 'report': report([funnel('F1', '"How is it going?"')])}, 200
+
+    payload, status = long_transcripts.analyse_windows(windows, ('', 'Alice', 'Maria'), analyse)
+
+    assert status == 200 and payload['windows'] == 2
+    assert [f['id'] for f in payload['report']['funnels']] == ['F1']
+    assert seen[0] == ('Alice: How is it going?\nMaria: Fine.', 'Alice', 'Maria')
+
+
+def test_analyse_windows_sentinels():
+    windows = [utterances(['Alice: Hi.'])] * 2
+    scored = ({'analysis_text': '', 'report': report([])}, 200)
+    outcomes = {'redacted': ({'analysis_text': 'DATA_NOT_REDACTED', 'is_error': True}, 200),
+                'short': ({'analysis_text': 'UNSUPPORTED_INPUT', 'is_error': True}, 200),
+                'failed': ({'error': 'Upstream timeout'}, 504)}
+
+    def run(first, second):
+        answers = iter([outcomes.get(first, scored), outcomes.get(second, scored)])
+        return long_transcripts.analyse_windows(windows, ('', 'Alice', 'Maria'), lambda fields: next(answers))
+
+    assert run('redacted', 'scored')[0] == {'analysis_text': 'DATA_NOT_REDACTED', 'is_error': True}
+    assert run('short', 'short')[0] == {'analysis_text': 'UNSUPPORTED_INPUT', 'is_error': True}
+    assert 'report' in run('short', 'scored')[0]
+    assert run('scored', 'failed') == outcomes['failed']
@@ -0,0 +1,69 @@
+import pytest
+
+import metrics
+from conftest import sales_call
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Keeps the metrics a test registers out of the app's /metrics output."""
+    monkeypatch.setattr(metrics, '_registry', [])
+
+
+def test_counter_renders_per_label(registry):
+    counter = metrics.Counter('test_answers_total', 'Answers by code.', ['code'])
+    counter.inc(code='ok')
+    counter.inc(2, code='ok')
+    counter.inc(code='say "no"\n')
+
+    assert counter.value(code='ok') == 3
+    assert metrics.render() == '\n'.join([
+        '# HELP test_answers_total Answers by code.',
+        '# TYPE test_answers_total counter',
+        'test_answers_total{code="ok"} 3',
+        'test_answers_total{code="say \\"no\\"\\n"} 1',
+    ]) + '\n'
+
+
+def test_counter_needs_its_labels(registry):
+    counter = metrics.Counter('test_answers_total', 'Answers by code.', ['code'])
+    with pytest.raises(ValueError):
+        counter.inc(kind='ok')
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram('test_seconds', 'Time taken.', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value)
+
+    assert metrics.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 4.25',
+        'test_seconds_count 4',
+    ]
+
+
+def test_gauges(registry):
+    metrics.Gauge('test_ratio', 'A ratio.', lambda: 0.25)
+    tracked = metrics.TrackedGauge('test_running', 'Blocks running.')
+    with tracked.track():
+        samples = [line for line in metrics.render().splitlines() if not line.startswith('#')]
+        assert samples == ['test_ratio 0.25', 'test_running 1']
+    assert tracked.current == 0
+
+
+def test_metrics_endpoint_counts_analyses(client):
+    import app
+
+    before = app.ANALYSES.value(outcome='success')
+    assert client.post('/analyze', json={'transcript': sales_call(), 'sales_rep_names': 'Alice',
+                                         'merchant_names': 'Maria'}).status_code == 200
+    assert app.ANALYSES.value(outcome='success') == before + 1
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    assert f'funnelbot_analyses_total{{outcome="success"}} {before + 1}' in response.text
+    assert 'funnelbot_request_duration_seconds_count{route="/analyze",status="200"}' in response.text
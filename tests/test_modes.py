@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app
+import modes
+
+from conftest import ROOT, sales_call
+
+
+def test_requests_without_a_mode_use_the_default():
+    options, invalid = app.analysis_options({})
+    assert invalid is None
+    assert options['mode'] == modes.DEFAULT == 'standard'
+
+
+@pytest.mark.parametrize('value, default', [(None, 'standard'), ('', 'standard'), ('quick', 'quick'),
+                                            (' Thorough ', 'thorough'), ('auto', 'auto')])
+def test_default_mode_setting(value, default):
+    assert modes._default_mode(value) == default
+
+
+def test_unknown_default_mode_falls_back_to_standard_at_import():
+    result = subprocess.run([sys.executable, '-c', 'import modes; print(modes.DEFAULT)'], cwd=ROOT,
+                            env=dict(os.environ, MODE_DEFAULT='fast'), capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == 'standard'
+    assert "Unknown MODE_DEFAULT 'fast'" in result.stderr
+
+
+def test_latency_target_alone_routes_automatically():
+    options, _ = app.analysis_options({'latency_target_seconds': '30'})
+    assert options['mode'] == modes.AUTO
+    assert options['latency_target'] == 30
+
+
+def test_unknown_mode_is_rejected():
+    _, invalid = app.analysis_options({'mode': 'instant'})
+    assert invalid[1] == 400
+
+
+def test_auto_routes_by_call_size():
+    assert modes.route(500, 10, requested=modes.AUTO)[0] is modes.QUICK
+    assert modes.route(5000, 100, requested=modes.AUTO)[0] is modes.STANDARD
+    assert modes.route(20000, 400, requested=modes.AUTO)[0] is modes.THOROUGH
+    assert modes.route(500, 10, requested='standard')[0] is modes.STANDARD
+
+
+def test_quick_mode_fits_a_full_report():
+    assert modes.QUICK.max_output_tokens >= modes.STANDARD.max_output_tokens
+
+
+def test_short_call_is_analysed_in_the_default_mode(client):
+    payload = client.post('/analyze', json={'transcript': sales_call(), 'sales_rep_names': 'Alice'}).get_json()
+    assert payload['analysis_mode'] == 'standard'
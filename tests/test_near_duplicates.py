@@ -0,0 +1,39 @@
+from conftest import sales_call
+
+import near_duplicates
+
+
+def test_signature_ignores_speaker_labels():
+    transcript = sales_call(topic='ledger')
+    relabelled = transcript.replace('Alice:', 'Alice Smith:')
+    first, second = near_duplicates.signature(transcript), near_duplicates.signature(relabelled)
+    assert near_duplicates.similarity(first, second) == 1.0
+
+
+def test_index_finds_similar_transcript_within_version(workdir):
+    index = near_duplicates.NearDuplicateIndex(f'{workdir}/index.sqlite3', threshold=0.8)
+    transcript = sales_call(topic='payouts')
+    index.add('key-1', 'v1', transcript)
+    match = index.find(transcript + '\nAlice: Great, thanks.', 'v1')
+    assert match['result_key'] == 'key-1'
+    assert index.find(transcript, 'v2') is None
+    index.remove('key-1')
+    assert index.find(transcript, 'v1') is None
+
+
+def test_near_duplicate_is_reused_for_the_same_names(client):
+    transcript = sales_call(topic='refunds')
+    first = client.post('/analyze', json={'transcript': transcript, 'sales_rep_names': 'Alice'})
+    assert first.headers['X-Cache'] == 'MISS'
+    edited = transcript.replace('which the finance team keeps asking about', 'which finance keeps asking about')
+    again = client.post('/analyze', json={'transcript': edited, 'sales_rep_names': 'Alice'})
+    assert again.headers['X-Cache'] == 'NEAR'
+
+
+def test_near_duplicate_is_not_reused_for_other_rep_names(client):
+    transcript = sales_call(topic='disputes')
+    client.post('/analyze', json={'transcript': transcript, 'sales_rep_names': 'Alice'})
+    relabelled = transcript.replace('Alice:', 'Bob:')
+    response = client.post('/analyze', json={'transcript': relabelled, 'sales_rep_names': 'Bob'})
+    assert response.headers['X-Cache'] == 'MISS'
+    assert 'near_duplicate' not in response.get_json()
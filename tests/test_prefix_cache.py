@@ -0,0 +1,106 @@
+import datetime
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import prefix_cache
+import prompt
+
+
+class FakeModel(SimpleNamespace):
+    def __init__(self, model_name, generation_config, system_instruction=None, cached_content=None):
+        super().__init__(model_name=model_name, generation_config=generation_config,
+                         system_instruction=system_instruction, cached_content=cached_content)
+
+    @classmethod
+    def from_cached_content(cls, cached_content, generation_config):
+        return cls(cached_content.name, generation_config, cached_content=cached_content.name)
+
+
+class FakeSdk:
+    """Records the models and cached-content entries the prefix caches ask the SDK for."""
+
+    GenerationConfig = dict
+    GenerativeModel = FakeModel
+
+    def __init__(self, entries=(), fail=False):
+        self.entries = list(entries)
+        self.created = []
+        self.fail = fail
+        self.caching = SimpleNamespace(CachedContent=SimpleNamespace(list=self._list, create=self._create))
+
+    def _list(self):
+        if self.fail:
+            raise RuntimeError('Caching is not supported for this model')
+        return list(self.entries)
+
+    def _create(self, model, display_name, system_instruction, ttl):
+        entry = cached_content(f'cachedContents/{len(self.created)}', display_name, ttl.total_seconds())
+        self.created.append((model, system_instruction))
+        self.entries.append(entry)
+        return entry
+
+
+def cached_content(name, display_name, expires_in):
+    expire_time = datetime.datetime.fromtimestamp(time.time() + expires_in, tz=datetime.timezone.utc)
+    return SimpleNamespace(name=name, display_name=display_name, expire_time=expire_time)
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    fake = FakeSdk()
+    monkeypatch.setattr(prefix_cache, 'gemini_sdk', lambda: fake)
+    return fake
+
+
+def test_user_prompt_leaves_the_rubric_to_the_prefix():
+    user_prompt = prompt.build_user_prompt('Alice: Hi.', 'Alice', 'Maria')
+
+    assert 'Alice: Hi.' in user_prompt and 'Merchant(s) indicated as: Maria' in user_prompt
+    assert prompt.RUBRIC[:200] not in user_prompt
+
+
+def test_local_prefix_sends_the_rubric_as_system_instruction(sdk):
+    cache = prefix_cache.LocalPrefixCache()
+    model = cache.model_for('model', {'temperature': 0})
+
+    assert model.system_instruction == prompt.RUBRIC
+    assert cache.model_for('model', {'temperature': 0}) is model
+    assert cache.model_for('model', {'temperature': 1}) is not model
+
+
+def test_context_cache_uploads_the_rubric_once(sdk):
+    cache = prefix_cache.GeminiContextCache()
+    model = cache.model_for('model', {'temperature': 0})
+
+    assert sdk.created == [('models/model', prompt.RUBRIC)]
+    assert model.cached_content == 'cachedContents/0'
+    assert cache.model_for('model', {'temperature': 0}) is model
+    # Another process finds the entry by its rubric fingerprint instead of uploading its own
+    assert prefix_cache.GeminiContextCache().model_for('model', {'temperature': 0}).cached_content == 'cachedContents/0'
+    assert len(sdk.created) == 1
+
+
+def test_context_cache_replaces_an_entry_about_to_expire(sdk):
+    cache = prefix_cache.GeminiContextCache()
+    sdk.entries.append(cached_content('cachedContents/old', cache._display_name('model'), 60))
+
+    assert cache.model_for('model', {}).cached_content == 'cachedContents/0'
+
+
+def test_context_cache_falls_back_when_refused(monkeypatch):
+    sdk = FakeSdk(fail=True)
+    monkeypatch.setattr(prefix_cache, 'gemini_sdk', lambda: sdk)
+    cache = prefix_cache.GeminiContextCache()
+
+    assert cache.model_for('model', {}).system_instruction == prompt.RUBRIC
+    sdk.fail = False
+    # The provider isn't asked again until the retry window has passed
+    assert cache.model_for('model', {}).system_instruction == prompt.RUBRIC
+    assert sdk.created == []
+
+
+def test_unknown_prefix_cache():
+    with pytest.raises(ValueError, match="Unknown prefix cache"):
+        prefix_cache.get_prefix_cache('redis')
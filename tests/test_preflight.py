@@ -0,0 +1,60 @@
+import preflight
+import transcripts
+
+from conftest import sales_call
+
+UNLABELLED = """Hi, thanks for taking the call today, how is the checkout project going?
+It is going fine but we are seeing a lot of declines on cross-border cards.
+What do you think is causing those declines?
+Our acquirer does not support retries, so every soft decline is lost."""
+
+MEETING_EXPORT = """ALICE SMITH (SALES), 00:01
+Hi Bob, thanks for joining. What prompted the call?
+BOB JONES, 00:09
+We are losing revenue to declines in Europe.
+ALICE SMITH (SALES), 00:15
+How much do you think that costs you each month?
+BOB JONES, 00:21
+About two percent of our volume."""
+
+
+def check(raw, sales_rep_names='Alice', roles=None):
+    _, utterances, _ = transcripts.normalise(raw)
+    return preflight.check(raw, utterances, sales_rep_names, roles=roles)
+
+
+def test_well_formed_call_goes_to_the_model():
+    assert check(sales_call()) is None
+
+
+def test_unlabelled_conversation_goes_to_the_model():
+    assert check(UNLABELLED) is None
+
+
+def test_unparsed_meeting_export_goes_to_the_model():
+    assert check(MEETING_EXPORT, 'Alice Smith') is None
+
+
+def test_too_short_text_is_unsupported():
+    assert check('hello there')[0] == preflight.UNSUPPORTED_INPUT
+
+
+def test_card_number_is_not_redacted():
+    raw = sales_call() + '\nMaria: My card is 4111 1111 1111 1111.'
+    assert check(raw)[0] == preflight.DATA_NOT_REDACTED
+
+
+def test_unmatched_rep_needs_speaker_roles():
+    assert check(sales_call(), 'Zed')[0] == preflight.NEED_SPEAKER_ROLES
+
+
+def test_inferred_roles_decide_speaker_checks():
+    assert check(sales_call(), 'Zed', roles={'resolved': True, 'reason': None}) is None
+    unresolved = {'resolved': False, 'reason': 'unclear'}
+    assert check(sales_call(), 'Alice', roles=unresolved) == (preflight.NEED_SPEAKER_ROLES, 'unclear')
+
+
+def test_unlabelled_conversation_is_analysed(client):
+    payload = client.post('/analyze', json={'transcript': UNLABELLED, 'sales_rep_names': 'Alice'}).get_json()
+    assert 'preflight' not in payload
+    assert payload['analysis_text']
@@ -0,0 +1,52 @@
+import llm_backends
+import report_parser
+
+SAMPLE = llm_backends.sample_report()
+
+
+def test_sample_report_is_parsed():
+    report = report_parser.parse_report(SAMPLE)
+
+    assert (report['final_score'], report['max_score'], report['band']) == (88, 100, 'Strong')
+    assert [(c['name'], c['score'], c['max']) for c in report['categories']][:3] == [
+        ('Question type & flow', 25, 30), ('Funnel execution', 20, 20), ('Pain discovery', 12.5, 15)]
+    assert report['categories'][-1]['note'] == '(e.g., Rep step + Merchant step, but no timeframe)'
+    assert [(f['id'], f['execution_points']) for f in report['funnels']] == [('F1', 10), ('F2', 10)]
+    assert report['funnels'][0]['items'][0] == {
+        'label': 'Thinking', 'text': '"How has your current process for X been impacting your team\'s efficiency?"'}
+    lists = {entry['title']: entry['items'] for entry in report['aggregate_lists']}
+    assert lists['Sweeper questions / statements'] == [
+        {'funnel': 'General', 'text': '"Before we wrap up, was there anything else you hoped to cover today?"'}]
+    assert [item['funnel'] for item in lists['Pain points identified']] == ['F1', 'F1', 'F2']
+    assert report['missed_opportunities'][0]['funnel'] == 'F1'
+    assert report['coaching_tips'][0].startswith('Great job')
+
+
+def test_markdown_drift_is_tolerated():
+    text = '\n'.join([
+        '**Final Score: 72/100 (Solid)**',
+        '',
+        '## Category breakdown:',
+        '- Question type & flow — 20/30',
+        '* Commitment - 7/15',
+        '',
+        '## Funnel summaries:',
+        '**F1** (Points earned for execution: +0)',
+        '- Thinking: "Why now?"',
+    ])
+    report = report_parser.parse_report(text)
+
+    assert (report['final_score'], report['band']) == (72, 'Solid')
+    assert [(c['name'], c['score']) for c in report['categories']] == [('Question type & flow', 20), ('Commitment', 7)]
+    assert report['funnels'][0]['id'] == 'F1'
+    assert report['funnels'][0]['execution_points'] == 0
+    assert report['funnels'][0]['items'] == [{'label': 'Thinking', 'text': '"Why now?"'}]
+
+
+def test_unrecognised_text_gives_an_empty_report():
+    assert report_parser.parse_report('The model had nothing useful to say.') == report_parser.empty_report()
+
+
+def test_rendered_report_parses_back_to_the_same_report():
+    report = report_parser.parse_report(SAMPLE)
+    assert report_parser.parse_report(report_parser.render_report(report)) == report
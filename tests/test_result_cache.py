@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import result_cache
+
+
+def make_cache(workdir, **kwargs):
+    return result_cache.ResultCache(f'{workdir}/cache.sqlite3', poll_interval=0.01, **kwargs)
+
+
+def run_together(cache, count, compute, cacheable):
+    results = [None] * count
+
+    def call(index):
+        results[index] = cache.get_or_compute('key', compute, cacheable)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def slow(value, calls):
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return value
+    return compute
+
+
+def test_waiters_share_one_computation(workdir):
+    cache, calls = make_cache(workdir), []
+    results = run_together(cache, 4, slow(['report', 200], calls), lambda result: result[1] == 200)
+
+    assert len(calls) == 1
+    assert all(value == ['report', 200] for value, _ in results)
+    assert sorted(hit for _, hit in results) == [False, True, True, True]
+    assert cache.get('key') == ['report', 200]
+
+
+def test_waiters_on_an_uncacheable_result_are_not_hits(workdir):
+    cache, calls = make_cache(workdir), []
+    results = run_together(cache, 3, slow(['upstream error', 500], calls), lambda result: result[1] == 200)
+
+    assert len(calls) == 1
+    assert [hit for _, hit in results] == [False, False, False]
+    assert cache.get('key') is None
+
+
+def test_async_waiters_on_an_uncacheable_result_are_not_hits(workdir):
+    cache, calls = make_cache(workdir), []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return ['upstream error', 500]
+
+    async def together():
+        return await asyncio.gather(*[cache.aget_or_compute('key', compute, lambda result: result[1] == 200)
+                                      for _ in range(3)])
+
+    assert [hit for _, hit in asyncio.run(together())] == [False, False, False]
+    assert len(calls) == 1
+
+
+def test_another_process_waits_on_the_lease(workdir):
+    holder, waiter = make_cache(workdir), make_cache(workdir)
+    assert holder._acquire_lease('key')
+    threading.Timer(0.1, lambda: holder.set('key', 'report')).start()
+
+    assert waiter.get_or_compute('key', lambda: 'computed again') == ('report', True)
+
+
+def test_an_expired_lease_is_taken_over(workdir):
+    holder, waiter = make_cache(workdir, lease_seconds=0.05), make_cache(workdir)
+    assert holder._acquire_lease('key')  # and never released, as by a process that died
+
+    assert waiter.get_or_compute('key', lambda: 'report') == ('report', False)
+
+
+def test_forked_workers_hold_leases_of_their_own(workdir, monkeypatch):
+    # Workers forked from a preloaded app share the cache object, so only the pid tells them apart
+    cache = make_cache(workdir)
+    monkeypatch.setattr(result_cache.os, 'getpid', lambda: 101)
+    assert cache._acquire_lease('key')
+
+    monkeypatch.setattr(result_cache.os, 'getpid', lambda: 102)
+    assert not cache._acquire_lease('key')
+    cache._release_lease('key')
+    assert cache._lease_held('key')
+
+    monkeypatch.setattr(result_cache.os, 'getpid', lambda: 101)
+    cache._release_lease('key')
+    assert not cache._lease_held('key')
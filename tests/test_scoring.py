@@ -0,0 +1,96 @@
+import pytest
+
+import llm_backends
+import report_parser
+import scoring
+
+SAMPLE = llm_backends.sample_report()
+
+
+def sample():
+    return report_parser.parse_report(SAMPLE)
+
+
+def category(report, name):
+    return next(c for c in report['categories'] if c['name'] == name)
+
+
+@pytest.mark.parametrize('value, expected', [(86.5, 87), (86.49, 86), (0.5, 1), (100, 100)])
+def test_round_half_up(value, expected):
+    assert scoring.round_half_up(value) == expected
+
+
+@pytest.mark.parametrize('score, band', [
+    (100, 'Exceptional'), (95, 'Exceptional'), (94, 'Strong'), (80, 'Strong'), (65, 'Solid'),
+    (50, 'Needs Improvement'), (49, 'Major Coaching Required'), (0, 'Major Coaching Required')])
+def test_band_for(score, band):
+    assert scoring.band_for(score) == band
+
+
+def test_rescore_corrects_the_final_score():
+    report, issues = scoring.rescore(sample())
+
+    # 25 + 20 + 12.5 + 7 + 15 + 7 = 86.5, which the model reported as 88
+    assert (report['final_score'], report['band']) == (87, 'Strong')
+    assert [(i['field'], i['reported'], i['computed']) for i in issues] == [('final_score', 88, 87)]
+
+
+def test_rescore_leaves_correct_arithmetic_alone():
+    report = dict(sample(), final_score=87)
+    assert scoring.rescore(report) == (report, [])
+
+
+def test_funnel_execution_is_recomputed_from_the_funnels():
+    report = sample()
+    report['funnels'][1] = dict(report['funnels'][1], execution_points=0)
+
+    rescored, issues = scoring.rescore(report)
+
+    assert category(rescored, 'Funnel execution')['score'] == 10
+    assert rescored['final_score'] == 77
+    assert ('categories.Funnel execution', 20, 10) in [(i['field'], i['reported'], i['computed']) for i in issues]
+
+
+def test_out_of_range_scores_and_maxima_are_clamped():
+    report = sample()
+    report['categories'][0] = dict(report['categories'][0], score=35, max=35)
+
+    rescored, issues = scoring.rescore(report)
+
+    assert (category(rescored, 'Question type & flow')['score'], category(rescored, 'Question type & flow')['max']) == (30, 30)
+    fields = [(i['field'], i['reported'], i['computed']) for i in issues]
+    assert ('categories.Question type & flow.max', 35, 30) in fields
+    assert ('categories.Question type & flow', 35, 30) in fields
+
+
+def test_unachievable_scores_are_flagged_but_kept():
+    report = sample()
+    report['categories'][4] = dict(report['categories'][4], score=9)
+
+    rescored, issues = scoring.rescore(report)
+
+    assert category(rescored, 'Commitment')['score'] == 9
+    assert {'field': 'categories.Commitment', 'reported': 9, 'computed': None,
+            'message': 'No combination of the rubric criteria adds up to this score.'} in issues
+
+
+def test_partial_reports_are_returned_unchanged():
+    report = report_parser.empty_report()
+    assert scoring.rescore(report) == (report, [])
+
+
+def test_correct_text_rewrites_only_the_scores():
+    report, _ = scoring.rescore(sample())
+    report['categories'][3] = dict(report['categories'][3], score=4)
+
+    text = scoring.correct_text(SAMPLE, report)
+
+    assert 'Final Score: 87/100  (Strong)' in text
+    assert 'Final Score: 88' not in text
+    assert category(report_parser.parse_report(text), 'Motivation probing')['score'] == 4
+    assert text.replace('87/100', '88/100').replace('4/10', '7/10', 1) == SAMPLE
+
+
+def test_correct_text_adds_a_missing_score_line():
+    report, _ = scoring.rescore(sample())
+    assert scoring.correct_text('No header here.', report) == 'Final Score: 87/100  (Strong)\n\nNo header here.'
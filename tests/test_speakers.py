@@ -0,0 +1,88 @@
+import pytest
+
+import speakers
+import transcripts
+from conftest import sales_call
+
+
+def utterances(text):
+    return transcripts.parse_utterances(text)
+
+
+@pytest.mark.parametrize('label', ['Jane Smith', 'jane smith', 'Jane', 'Smith', 'J. Smith', 'Mrs Smith', 'Jané Smith'])
+def test_label_matches_the_name(label):
+    assert speakers.name_similarity(label, 'Jane Smith') >= speakers.NAME_MATCH_THRESHOLD
+
+
+def test_small_typo_still_matches():
+    assert speakers.name_similarity('Jon S.', 'John Smith') == speakers.NAME_MATCH_THRESHOLD
+
+
+@pytest.mark.parametrize('label', ['Maria', 'J.', 'Customer'])
+def test_other_labels_do_not_match(label):
+    assert speakers.name_similarity(label, 'Jane Smith') < speakers.NAME_MATCH_THRESHOLD
+
+
+def test_rep_and_named_merchant_are_resolved():
+    roles = speakers.infer_roles(utterances(sales_call()), 'Alice')
+
+    assert roles['resolved'] and roles['reason'] is None
+    assert (roles['sales_reps'], roles['merchants']) == (['Alice'], ['Maria'])
+    assert [(s['label'], s['basis']) for s in roles['speakers']] == [('Alice', 'rep name'), ('Maria', 'question ratio')]
+
+
+def test_role_labels_are_recognised():
+    roles = speakers.infer_roles(utterances(sales_call(rep='Agent', merchant='Customer')), 'Alice')
+
+    assert roles['resolved']
+    rep = roles['speakers'][0]
+    assert (rep['label'], rep['role'], rep['name'], rep['basis']) == ('Agent', speakers.SALES_REP, 'Alice', 'role label')
+    assert roles['merchants'] == ['Customer']
+
+
+def test_merchant_names_claim_their_labels():
+    roles = speakers.infer_roles(utterances(sales_call(rep='Al', merchant='Alison')), 'Al, Alice', 'Alison')
+    assert (roles['sales_reps'], roles['merchants']) == (['Al'], ['Alison'])
+    assert roles['speakers'][1]['basis'] == 'merchant name'
+
+
+def test_no_rep_match_proposes_the_questioner():
+    roles = speakers.infer_roles(utterances(sales_call(rep='Bob')), 'Alice')
+
+    assert not roles['resolved']
+    assert 'match the sales rep name' in roles['reason']
+    assert (roles['sales_reps'], roles['merchants']) == (['Bob'], ['Maria'])
+
+
+def test_every_speaker_a_rep_is_unresolved():
+    roles = speakers.infer_roles(utterances(sales_call(rep='Alice', merchant='Agent')), 'Alice')
+    assert not roles['resolved']
+    assert roles['reason'] == 'Every speaker matches a sales rep name, so no merchant can be identified.'
+
+
+def test_unlisted_questioner_is_not_guessed():
+    call = sales_call() + '\n' + '\n'.join([
+        'Priya: Which acquirers are you using today?',
+        'Maria: Two, one per region.',
+        'Priya: How do they handle retries?',
+        'Maria: They do not.',
+        'Priya: Would you consider a third?',
+    ])
+    roles = speakers.infer_roles(utterances(call), 'Alice')
+
+    assert not roles['resolved']
+    assert roles['reason'].startswith('Priya asks questions like a sales rep')
+
+
+def test_relabel_renames_loose_rep_labels():
+    call = utterances(sales_call(rep='alice s.'))
+    roles = speakers.infer_roles(call, 'Alice Smith')
+
+    relabelled = speakers.relabel(call, roles, 'Alice Smith')
+    assert {u.speaker for u in relabelled} == {'Alice Smith', 'Maria'}
+    assert [u.text for u in relabelled] == [u.text for u in call]
+
+
+def test_relabel_keeps_exact_labels():
+    call = utterances(sales_call())
+    assert speakers.relabel(call, speakers.infer_roles(call, 'Alice'), 'Alice') is call
@@ -0,0 +1,109 @@
+import io
+import zipfile
+
+import pytest
+
+import transcript_files
+from transcript_files import InvalidTranscriptFile
+
+VTT = (b'WEBVTT\n\nNOTE exported by the meeting tool\n\n'
+       b'00:00:01.000 --> 00:00:04.000\n<v Alice Smith>What made you look at <b>payments</b> now?\n\n'
+       b'00:00:05.000 --> 00:00:09.000\n<v Maria>Card declines.\n')
+SRT = (b'1\n00:00:01,000 --> 00:00:04,000\nAlice: What made you look at payments now?\n\n'
+       b'2\n00:00:05,000 --> 00:00:09,000\nMaria: Card declines.\n')
+DOCX_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def docx(*paragraphs):
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', f'<w:document xmlns:w="{DOCX_NS}"><w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def turns(utterances):
+    return [(utterance.speaker, utterance.text) for utterance in utterances]
+
+
+def chunked(data, size=7):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('filename, content_type, head, expected', [
+    ('call.VTT', None, b'', 'vtt'),
+    ('call', 'application/x-subrip; charset=utf-8', b'', 'srt'),
+    ('upload', None, b'\xef\xbb\xbfWEBVTT\n', 'vtt'),
+    ('upload', None, SRT[:60], 'srt'),
+    ('upload', None, b'PK\x03\x04', 'docx'),
+    (None, None, b'Alice: hi', 'txt'),
+])
+def test_detect_format(filename, content_type, head, expected):
+    assert transcript_files.detect_format(filename, content_type, head) == expected
+
+
+def test_vtt_voice_tags_name_the_speakers():
+    fmt, utterances = transcript_files.parse(chunked(VTT), 'call.vtt')
+    assert fmt == 'vtt'
+    assert turns(utterances) == [('Alice Smith', 'What made you look at payments now?'), ('Maria', 'Card declines.')]
+
+
+def test_srt_cues_lose_their_numbers_and_timings():
+    fmt, utterances = transcript_files.parse(chunked(SRT), 'call.srt')
+    assert fmt == 'srt'
+    assert turns(utterances) == [('Alice', 'What made you look at payments now?'), ('Maria', 'Card declines.')]
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'utf-16'])
+def test_text_is_decoded_across_chunk_boundaries(encoding):
+    data = 'Alice: Olá, café hoje?\r\nMaria: Sí, às três.'.encode(encoding)
+    _, utterances = transcript_files.parse(chunked(data, 3), 'call.txt')
+    assert turns(utterances) == [('Alice', 'Olá, café hoje?'), ('Maria', 'Sí, às três.')]
+
+
+def test_docx_paragraphs_are_lines():
+    _, utterances = transcript_files.parse(chunked(docx('Alice: Hello?', 'Maria: Hi.'), 100), 'call.docx')
+    assert turns(utterances) == [('Alice', 'Hello?'), ('Maria', 'Hi.')]
+
+
+@pytest.mark.parametrize('chunks, filename, message', [
+    ([], 'call.txt', 'empty'),
+    ([b'not a zip'], 'call.docx', 'not a readable DOCX'),
+])
+def test_unreadable_files(chunks, filename, message):
+    with pytest.raises(InvalidTranscriptFile, match=message):
+        transcript_files.parse(chunks, filename)
+
+
+def test_too_large():
+    with pytest.raises(InvalidTranscriptFile, match='too large'):
+        transcript_files.parse([b'Alice: hello there\n' * 10], 'call.txt', max_chars=50)
+
+
+def multipart(parts, boundary='boundary'):
+    body = b''
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f'--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + value + b'\r\n'
+    return io.BytesIO(body + f'--{boundary}--\r\n'.encode()), f'multipart/form-data; boundary={boundary}'
+
+
+def test_read_upload_parses_the_file_and_keeps_the_fields():
+    stream, content_type = multipart([('sales_rep_names', b'Alice Smith', None), ('file', VTT, 'call.vtt'),
+                                      ('merchant_names', b'Maria', None)])
+    form, upload = transcript_files.read_upload(stream, content_type)
+
+    assert form == {'sales_rep_names': 'Alice Smith', 'merchant_names': 'Maria'}
+    assert (upload['filename'], upload['format']) == ('call.vtt', 'vtt')
+    assert turns(upload['utterances'])[1] == ('Maria', 'Card declines.')
+
+
+@pytest.mark.parametrize('parts, content_type, message', [
+    ([('sales_rep_names', b'Alice', None)], None, 'No transcript file'),
+    ([('file', SRT, 'call.srt')], 'application/json', 'multipart/form-data'),
+    ([('notes', b'x' * (transcript_files.MAX_FIELD_BYTES + 1), None)], None, 'too large'),
+])
+def test_read_upload_rejects(parts, content_type, message):
+    stream, multipart_type = multipart(parts)
+    with pytest.raises(InvalidTranscriptFile, match=message):
+        transcript_files.read_upload(stream, content_type or multipart_type)
@@ -0,0 +1,66 @@
+import pytest
+
+import transcripts
+from transcripts import Utterance
+
+
+def turns(utterances):
+    return [(utterance.speaker, utterance.text) for utterance in utterances]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('Alice: Hello there', ('Alice', 'Hello there', None)),
+    ('[00:01:02] Alice Smith: Hello there', ('Alice Smith', 'Hello there', '00:01:02')),
+    ('Alice [01:02]: Hello there', ('Alice', 'Hello there', '01:02')),
+])
+def test_labelled_lines(line, expected):
+    assert transcripts.parse_utterances(line) == [Utterance(*expected)]
+
+
+def test_speaker_headers_and_continuation_lines():
+    text = 'Alice  00:00:01\nHello there.\nHow are you?\n\n00:00:05 Maria\nFine, thanks.'
+    assert turns(transcripts.parse_utterances(text)) == [('Alice', 'Hello there. How are you?'),
+                                                         ('Maria', 'Fine, thanks.')]
+
+
+def test_text_without_labels_parses_to_nothing():
+    assert transcripts.parse_utterances('Just some notes, nothing else here.\nMore notes.') == []
+
+
+def test_hesitations_are_dropped_and_turns_merged():
+    utterances = transcripts.parse_utterances(
+        'Alice: Uh.\nAlice: So, um, what made you look at payments?\nMaria: Hmm.\nAlice: Take your time.')
+    # "Hmm." after a question may be the merchant's answer, so it stays
+    assert turns(transcripts.clean_utterances(utterances)) == [
+        ('Alice', 'So, what made you look at payments?'), ('Maria', 'Hmm.'), ('Alice', 'Take your time.')]
+    assert turns(transcripts.clean_utterances(transcripts.parse_utterances('Alice: Right.\nMaria: Erm.'))) == [
+        ('Alice', 'Right.')]
+
+
+@pytest.mark.parametrize('reply', ['Sure.', 'Okay.', 'Mm-hmm.', 'Yeah, got it.', "Okay, let's do it Tuesday."])
+def test_acknowledgements_after_a_statement_are_kept(reply):
+    utterances = transcripts.parse_utterances(f"Alice: I'll send the contract tomorrow.\nMaria: {reply}")
+    assert turns(transcripts.clean_utterances(utterances)) == [
+        ('Alice', "I'll send the contract tomorrow."), ('Maria', reply)]
+
+
+def test_normalise_compacts_and_reports_savings():
+    raw = '[00:00:01] Alice:   Hi Maria, um, thanks for joining.\n\n\n[00:00:04] Maria: Sure.\n[00:00:05] Maria: Happy to.'
+    prompt_text, utterances, stats = transcripts.normalise(raw)
+
+    assert prompt_text == 'Alice: Hi Maria, thanks for joining.\nMaria: Sure. Happy to.'
+    assert len(utterances) == 2
+    assert (stats['utterances_parsed'], stats['utterances_after_merge']) == (3, 2)
+    assert stats['original_chars'] == len(raw) and stats['normalised_chars'] == len(prompt_text)
+    assert stats['saved_tokens_est'] == stats['original_tokens_est'] - stats['normalised_tokens_est'] > 0
+
+
+def test_normalise_passes_unlabelled_text_through():
+    prompt_text, utterances, _ = transcripts.normalise('  First paragraph.\n\n\n\nSecond paragraph.  ')
+    assert (prompt_text, utterances) == ('First paragraph.\n\nSecond paragraph.', [])
+
+
+def test_names_are_normalised_for_keys():
+    assert transcripts.normalise_names(' bob,  Alice  Smith ,,ALICE smith') == 'alice smith, bob'
+    assert transcripts.is_rep('alice', 'Alice Smith, Bob')
+    assert not transcripts.is_rep('Maria', 'Alice Smith, Bob')
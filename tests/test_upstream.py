@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import upstream
+
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f'HTTP {code}')
+        self.code = code
+
+
+class FlakyBackend:
+    name = 'flaky'
+    is_configured = True
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate(self, user_prompt, timeout=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'report'
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (StatusError(429), True), (StatusError(503), True), (StatusError(400), False),
+    (ConnectionError(), True), (TimeoutError(), True), (ValueError(), False),
+])
+def test_is_retryable(error, retryable):
+    assert upstream.is_retryable(error) is retryable
+
+
+def test_retries_transient_errors():
+    backend = FlakyBackend([StatusError(503), StatusError(429)])
+    policy = upstream.CallPolicy(deadline_seconds=10, max_attempts=3, backoff_base_seconds=0.001)
+    assert upstream.ResilientBackend(backend, policy).generate('prompt') == 'report'
+    assert backend.calls == 3
+
+
+def test_does_not_retry_client_errors():
+    backend = FlakyBackend([StatusError(400)])
+    policy = upstream.CallPolicy(deadline_seconds=10, max_attempts=3, backoff_base_seconds=0.001)
+    with pytest.raises(StatusError):
+        upstream.ResilientBackend(backend, policy).generate('prompt')
+    assert backend.calls == 1
+
+
+def test_importing_the_app_does_not_load_grpc():
+    code = "import sys, app; print('grpc' in sys.modules or 'google.api_core' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=dict(os.environ, LLM_BACKEND='fake'), capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == 'False'
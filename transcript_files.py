@@ -0,0 +1,328 @@
+"""Transcript files: WebVTT, SRT, plain text and DOCX, parsed as they are read.
+
+Pasting an hour-long transcript into the page meant copying it in the browser,
+sending it as one JSON string and decoding that again on the server. An
+uploaded file is instead fed to one of these parsers chunk by chunk as the
+request body arrives (see read_upload), and each parser turns its format
+straight into transcripts.Utterance records:
+
+* txt  - any layout transcripts.parse_utterances understands;
+* vtt  - cue timings, NOTE/STYLE/REGION blocks and markup are dropped, and
+  `<v Speaker>` voice tags name the speaker;
+* srt  - cue numbers, timings and markup are dropped;
+* docx - the paragraphs of word/document.xml, read with a streaming XML parser.
+
+Only the parsed utterances are kept, never the whole file. DOCX is the
+exception: a zip can only be opened from its end, so it is spooled to a
+temporary file (on disk beyond a small size) before its paragraphs are read.
+"""
+import codecs
+import html
+import os
+import re
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+import transcripts
+
+FORMATS = ('vtt', 'srt', 'txt', 'docx')
+EXTENSIONS = {'.vtt': 'vtt', '.srt': 'srt', '.txt': 'txt', '.text': 'txt', '.docx': 'docx'}
+CONTENT_TYPES = {
+    'text/vtt': 'vtt',
+    'application/x-subrip': 'srt',
+    'text/plain': 'txt',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+}
+
+# Form fields are small; anything bigger is not a speaker list
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PARTS = 100
+READ_CHUNK_BYTES = 64 * 1024
+# Bytes looked at to recognise a file without a telling name or content type
+SNIFF_BYTES = 512
+# DOCX uploads below this stay in memory while spooling
+DOCX_SPOOL_BYTES = 1024 * 1024
+
+TAG_RE = re.compile(r'<[^>]*>')
+VOICE_RE = re.compile(r'<v(?:\.[\w.-]+)?\s+([^>]+)>')
+ASS_OVERRIDE_RE = re.compile(r'\{\\[^}]*\}')
+SRT_TIMING_RE = re.compile(r'^\d{1,2}:\d{2}:\d{2}[,.]\d{1,3}\s*-->')
+VTT_BLOCKS = ('NOTE', 'STYLE', 'REGION')
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class InvalidTranscriptFile(ValueError):
+    """The upload is missing, too large, or not a transcript in a supported format."""
+
+
+def detect_format(filename, content_type=None, head=b''):
+    """The format of an upload from its extension, else its content type, else its first bytes."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext]
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    if head.startswith(b'PK\x03\x04'):
+        return 'docx'
+    text = head.lstrip(codecs.BOM_UTF8).lstrip()
+    if text.startswith(b'WEBVTT'):
+        return 'vtt'
+    lines = text.split(b'\n', 2)
+    if len(lines) > 1 and lines[0].strip().isdigit() and SRT_TIMING_RE.match(lines[1].decode('ascii', 'ignore')):
+        return 'srt'
+    return 'txt'
+
+
+class TextParser:
+    """Parses a plain-text transcript from byte chunks, one complete line at a time.
+
+    UTF-8 (with or without a byte-order mark) and BOM-marked UTF-16 are decoded
+    incrementally, so a character split across two chunks is never mangled.
+    """
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.utterances = transcripts.UtteranceParser()
+        self._decoder = None
+        self._pending = ''
+
+    def feed(self, data):
+        if self._decoder is None:
+            encoding = 'utf-16' if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) else 'utf-8-sig'
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._text(self._decoder.decode(data))
+
+    def _text(self, text):
+        self.chars += len(text)
+        if self.chars > self.max_chars:
+            raise InvalidTranscriptFile('The transcript file is too large.')
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self.line(line.rstrip('\r'))
+
+    def line(self, line):
+        self.utterances.feed(line)
+
+    def close(self):
+        """Parses whatever is left and returns the utterances."""
+        if self._decoder is not None:
+            self._text(self._decoder.decode(b'', final=True))
+        if self._pending:
+            self.line(self._pending.rstrip('\r'))
+            self._pending = ''
+        self.line('')  # the end of the file ends the last block
+        return self.utterances.close()
+
+
+class SrtParser(TextParser):
+    """SubRip: numbered cues of timing and caption lines, separated by blank lines."""
+
+    def line(self, line):
+        line = ASS_OVERRIDE_RE.sub('', TAG_RE.sub('', line)).strip()
+        if line.isdigit() or SRT_TIMING_RE.match(line):
+            return
+        # Dialogue dashes ("- Alice: text") mark a change of speaker inside a cue
+        self.utterances.feed(html.unescape(line.lstrip('-–> ').strip()))
+
+
+class VttParser(TextParser):
+    """WebVTT: like SRT, plus header and NOTE/STYLE/REGION blocks and `<v Speaker>` voice tags."""
+
+    def __init__(self, max_chars):
+        super().__init__(max_chars)
+        self._skipping = True  # the WEBVTT header block
+        # The first line of a block: a cue identifier if the timing line follows it
+        self._held = None
+        self._block_start = False
+
+    def line(self, line):
+        line = line.strip()
+        if not line:
+            self._release()
+            self._skipping, self._block_start = False, True
+            return
+        if self._skipping:
+            return
+        if '-->' in line:
+            self._held, self._block_start = None, False
+            return
+        if self._block_start:
+            self._block_start = False
+            if line.split(' ', 1)[0] in VTT_BLOCKS:
+                self._skipping = True
+            else:
+                self._held = line
+            return
+        self._release()
+        self._caption(line)
+
+    def _release(self):
+        if self._held is not None:
+            held, self._held = self._held, None
+            self._caption(held)
+
+    def _caption(self, line):
+        voice = VOICE_RE.search(line)
+        text = html.unescape(TAG_RE.sub('', line)).strip()
+        if voice:
+            self.utterances.start(voice.group(1).strip(), text, continuing=True)
+        else:
+            self.utterances.feed(text)
+
+
+class DocxParser:
+    """Word documents: each paragraph of the main document part is one transcript line."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self._spool = tempfile.SpooledTemporaryFile(max_size=DOCX_SPOOL_BYTES)
+
+    def feed(self, data):
+        self._spool.write(data)
+
+    def close(self):
+        parser = transcripts.UtteranceParser()
+        chars = 0
+        try:
+            self._spool.seek(0)
+            with zipfile.ZipFile(self._spool) as archive, archive.open('word/document.xml') as document:
+                for _, element in ElementTree.iterparse(document):
+                    if element.tag != WORD_NS + 'p':
+                        continue
+                    text = ''.join(self._paragraph_text(element))
+                    element.clear()
+                    chars += len(text)
+                    if chars > self.max_chars:
+                        raise InvalidTranscriptFile('The transcript file is too large.')
+                    for line in text.split('\n'):
+                        parser.feed(line)
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+            raise InvalidTranscriptFile('The file is not a readable DOCX document.') from e
+        finally:
+            self._spool.close()
+        return parser.close()
+
+    @staticmethod
+    def _paragraph_text(paragraph):
+        for node in paragraph.iter():
+            if node.tag == WORD_NS + 't' and node.text:
+                yield node.text
+            elif node.tag == WORD_NS + 'tab':
+                yield '\t'
+            elif node.tag in (WORD_NS + 'br', WORD_NS + 'cr'):
+                yield '\n'
+
+
+PARSERS = {'txt': TextParser, 'srt': SrtParser, 'vtt': VttParser, 'docx': DocxParser}
+
+
+class FileParser:
+    """Parses a transcript file fed in byte chunks, choosing the format from its name, type and first bytes."""
+
+    def __init__(self, filename, content_type=None, max_chars=50_000_000):
+        self.filename, self.content_type, self.max_chars = filename, content_type, max_chars
+        self.format = self._parser = None
+        self._head = b''
+
+    def feed(self, data):
+        if self._parser is None:
+            self._head += data
+            if len(self._head) >= SNIFF_BYTES:
+                self._start()
+            return
+        self._parser.feed(data)
+
+    def _start(self):
+        self.format = detect_format(self.filename, self.content_type, self._head)
+        self._parser = PARSERS[self.format](self.max_chars)
+        head, self._head = self._head, b''
+        self._parser.feed(head)
+
+    def close(self):
+        """Returns the utterances; raises InvalidTranscriptFile when nothing was fed."""
+        if self._parser is None:
+            if not self._head:
+                raise InvalidTranscriptFile('The transcript file is empty.')
+            self._start()
+        return self._parser.close()
+
+
+def parse(chunks, filename, content_type=None, max_chars=50_000_000):
+    """Parses a transcript file from an iterable of byte chunks; returns (format, utterances)."""
+    parser = FileParser(filename, content_type, max_chars)
+    for chunk in chunks:
+        parser.feed(chunk)
+    utterances = parser.close()
+    return parser.format, utterances
+
+
+def read_upload(stream, content_type, file_field='file', max_bytes=50_000_000):
+    """Reads a multipart/form-data body, parsing the transcript file part as it arrives.
+
+    Returns (form, upload) where form maps the other field names to their
+    values and upload is {'filename', 'format', 'utterances'}. Raises
+    InvalidTranscriptFile for a malformed or oversized body, or one without
+    the file.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        raise InvalidTranscriptFile('Upload the transcript as multipart/form-data.')
+    decoder = MultipartDecoder(options['boundary'].encode('latin-1'), max_parts=MAX_PARTS)
+
+    form, upload = {}, None
+    field_name = field_value = parser = None
+    received = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        received += len(chunk)
+        if received > max_bytes:
+            raise InvalidTranscriptFile('The transcript file is too large.')
+        decoder.receive_data(chunk or None)
+        try:
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    field_name = None
+                    # Only the transcript is read; any other file part is skipped
+                    parser = None
+                    if event.name == file_field and upload is None:
+                        parser = FileParser(event.filename, event.headers.get('Content-Type'), max_bytes)
+                        upload = {'filename': event.filename, 'format': None, 'utterances': None}
+                elif isinstance(event, Field):
+                    field_name, field_value, parser = event.name, bytearray(), None
+                elif isinstance(event, Data):
+                    if parser is not None:
+                        parser.feed(event.data)
+                        if not event.more_data:
+                            upload['utterances'] = parser.close()
+                            upload['format'] = parser.format
+                            parser = None
+                    elif field_name is not None:
+                        field_value += event.data
+                        if len(field_value) > MAX_FIELD_BYTES:
+                            raise InvalidTranscriptFile(f'Form field {field_name!r} is too large.')
+                        if not event.more_data:
+                            form[field_name] = field_value.decode('utf-8', errors='replace')
+                            field_name = None
+                event = decoder.next_event()
+        except (ValueError, RequestEntityTooLarge) as e:  # the decoder's malformed-body errors
+            if isinstance(e, InvalidTranscriptFile):
+                raise
+            raise InvalidTranscriptFile('The upload is not a valid multipart body.') from e
+        if isinstance(event, Epilogue) or not chunk:
+            break
+
+    if upload is None:
+        raise InvalidTranscriptFile('No transcript file provided.')
+    if upload['utterances'] is None:
+        raise InvalidTranscriptFile('The upload ended before the transcript file did.')
+    return form, upload
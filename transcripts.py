@@ -0,0 +1,185 @@
+"""Transcript parsing and normalisation ahead of prompting.
+
+Exported transcripts come in many shapes: `[00:03:21] Alice: text`, `Alice
+00:03:21` on its own line followed by the text, repeated speaker headers, blank
+lines and back-channel filler. This module parses them into Utterance records
+and emits the compact `Speaker: text` form section 3 of the rubric expects, so
+we don't pay input tokens (and model time) for formatting noise.
+"""
+import re
+from collections import namedtuple
+
+Utterance = namedtuple('Utterance', 'speaker text timestamp')
+
+TIMESTAMP = r'[\[(]?\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d{1,3})?[\])]?'
+TIMESTAMP_RE = re.compile(TIMESTAMP)
+# Up to four words, so ordinary sentences containing a colon aren't mistaken for labels
+SPEAKER = r"[A-Za-z][\w.'’-]*(?: [\w.'’-]+){0,3}?"
+# "[00:01:02] Alice: text", "Alice [00:01:02]: text", "Alice: text"
+LABELLED_LINE_RE = re.compile(rf'^(?:{TIMESTAMP}\s*[-–]?\s*)?(?P<speaker>{SPEAKER})\s*(?:{TIMESTAMP})?\s*:\s*(?P<text>.*)$')
+# "Alice  00:01:02" or "00:01:02 Alice" on a line of its own, text on the following lines
+SPEAKER_HEADER_RE = re.compile(rf'^(?:(?P<ts1>{TIMESTAMP})\s+(?P<s1>{SPEAKER})|(?P<s2>{SPEAKER})\s+(?P<ts2>{TIMESTAMP}))\s*$')
+LEADING_TIMESTAMP_RE = re.compile(rf'^{TIMESTAMP}\s*[-–]?\s*')
+WEBVTT_CUE_RE = re.compile(r'^\d+$|-->')
+
+# Hesitations that carry no meaning for funnel scoring on their own. Acknowledgements ("Sure.", "Okay.",
+# "Mm-hmm.") are not among them: after a rep's proposal they are the merchant's commitment.
+FILLER_WORDS = {'um', 'umm', 'uh', 'uhh', 'erm', 'er', 'ah', 'hmm', 'mm'}
+# Hesitations that can be dropped from inside a sentence without changing its meaning
+INLINE_FILLER_RE = re.compile(r'\b(?:um+|uh+|erm|er)\b[,.]?\s*', re.IGNORECASE)
+
+# Rough size of a token for the models we use; only used for reporting savings
+CHARS_PER_TOKEN = 4
+
+
+def _timestamp_of(line):
+    match = TIMESTAMP_RE.search(line)
+    return match.group(0).strip('[]()') if match else None
+
+
+class UtteranceParser:
+    """Line-at-a-time transcript parser, for input that arrives in pieces (see parse_utterances).
+
+    Lines without a speaker label continue the previous utterance; lines before
+    the first label are dropped.
+    """
+
+    def __init__(self):
+        self.utterances = []
+        self.speaker, self._parts, self._timestamp = None, [], None
+
+    def _flush(self):
+        if self.speaker is not None and self._parts:
+            self.utterances.append(Utterance(self.speaker, ' '.join(self._parts), self._timestamp))
+
+    def start(self, speaker, text='', timestamp=None, continuing=False):
+        """Begins an utterance whose speaker is already known (e.g. from a caption voice tag).
+
+        With continuing, text from the speaker of the current utterance is
+        added to it instead; captions repeat the speaker on every cue.
+        """
+        if continuing and speaker == self.speaker:
+            if text:
+                self._parts.append(text)
+            return
+        self._flush()
+        self.speaker, self._timestamp = speaker, timestamp
+        self._parts = [text] if text else []
+
+    def feed(self, raw_line):
+        line = raw_line.strip()
+        if not line or line == 'WEBVTT' or WEBVTT_CUE_RE.search(line):
+            return
+
+        header = SPEAKER_HEADER_RE.match(line)
+        labelled = None if header else LABELLED_LINE_RE.match(line)
+        if header:
+            self.start((header.group('s1') or header.group('s2')).strip(),
+                       timestamp=(header.group('ts1') or header.group('ts2')).strip('[]()'))
+        elif labelled and not labelled.group('speaker').strip().lower().startswith(('http', 'www')):
+            self.start(labelled.group('speaker').strip(), labelled.group('text').strip(),
+                       _timestamp_of(line[:labelled.start('text')]))
+        elif self.speaker is not None:
+            self._parts.append(LEADING_TIMESTAMP_RE.sub('', line))
+
+    def close(self):
+        """Finishes the last utterance and returns them all."""
+        self._flush()
+        self.speaker, self._parts = None, []
+        return self.utterances
+
+
+def parse_utterances(text):
+    """Parses a transcript into Utterance records in order of appearance.
+
+    Lines without a speaker label continue the previous utterance. Returns an
+    empty list when no line carries a recognisable speaker label.
+    """
+    parser = UtteranceParser()
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        parser.feed(line)
+    return parser.close()
+
+
+def _is_pure_filler(text):
+    words = re.sub(r"[^\w\s'-]", ' ', text.lower()).split()
+    return all(word in FILLER_WORDS for word in words)
+
+
+def clean_utterances(utterances):
+    """Drops turns of pure hesitation and inline hesitations, then merges consecutive turns by one speaker.
+
+    Short acknowledgements ("I'll send the contract tomorrow." / "Sure.") are
+    always kept, as is a hesitation straight after a question ("Can we meet
+    Tuesday?" / "Hmm."): either may be the merchant's answer to a commitment.
+    """
+    cleaned = []
+    previous_text = ''
+    for utterance in utterances:
+        text = INLINE_FILLER_RE.sub('', utterance.text).strip()
+        answers_question = previous_text.rstrip().endswith('?')
+        previous_text = utterance.text
+        if not text or (_is_pure_filler(text) and not answers_question):
+            continue
+        if cleaned and cleaned[-1].speaker == utterance.speaker:
+            last = cleaned[-1]
+            cleaned[-1] = last._replace(text=f'{last.text} {text}')
+        else:
+            cleaned.append(utterance._replace(text=text))
+    return cleaned
+
+
+def is_rep(speaker, sales_rep_names):
+    """True if a speaker label matches one of the comma-separated rep names (or their first name)."""
+    label = speaker.casefold()
+    for name in (sales_rep_names or '').split(','):
+        name = name.strip().casefold()
+        if name and (label == name or label == name.split()[0] or name == label.split()[0]):
+            return True
+    return False
+
+
+def normalise_names(names):
+    """A comma-separated name list in a canonical form: case, spacing and order don't matter."""
+    return ', '.join(sorted({' '.join(name.split()).casefold() for name in (names or '').split(',') if name.strip()}))
+
+
+def compact(utterances):
+    """Renders utterances in the canonical `Speaker: text` form, one per line."""
+    return '\n'.join(f'{u.speaker}: {u.text}' for u in utterances)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def normalise(text, raw_utterances=None):
+    """Returns (prompt_text, utterances, stats) for a raw transcript.
+
+    When no speaker labels can be found the text is passed through with only
+    whitespace tidied, so the model can still decide it is UNSUPPORTED_INPUT.
+    Pass raw_utterances when the text has already been parsed (e.g. from an
+    uploaded file) to skip parsing it again.
+    """
+    if raw_utterances is None:
+        raw_utterances = parse_utterances(text)
+    if raw_utterances:
+        utterances = clean_utterances(raw_utterances)
+        prompt_text = compact(utterances)
+    else:
+        utterances = []
+        prompt_text = re.sub(r'\n{3,}', '\n\n', text.strip())
+
+    original_tokens = estimate_tokens(text)
+    normalised_tokens = estimate_tokens(prompt_text)
+    stats = {
+        'original_chars': len(text),
+        'normalised_chars': len(prompt_text),
+        'original_tokens_est': original_tokens,
+        'normalised_tokens_est': normalised_tokens,
+        'saved_tokens_est': original_tokens - normalised_tokens,
+        'saved_pct': round(100 * (original_tokens - normalised_tokens) / original_tokens, 1) if original_tokens else 0.0,
+        'utterances_parsed': len(raw_utterances),
+        'utterances_after_merge': len(utterances),
+    }
+    return prompt_text, utterances, stats
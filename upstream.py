@@ -0,0 +1,265 @@
+"""Deadlines, retries and hedging around model backend calls.
+
+A model call used to run with no timeout and no retry: one stuck upstream
+request held a worker for as long as the provider took, and a single 429 or
+503 reached the user as a 500. ResilientBackend wraps any backend from
+llm_backends and adds:
+
+* a per-request deadline - every attempt gets the time that is left, and the
+  call fails with DeadlineExceeded once it runs out;
+* jittered exponential backoff ("full jitter") on rate limits, 5xx responses,
+  timeouts and connection errors;
+* optional hedging - when an attempt is still running after the chosen
+  percentile of recent call latencies, a second identical request is started
+  and whichever finishes first wins. This trades extra quota for a shorter
+  tail, so it is off unless a percentile is configured.
+
+Streaming calls get the deadline and are retried only until the first chunk
+has been yielded; once text has reached the client a retry would duplicate it.
+The async methods (agenerate/astream) follow the same rules on the event loop,
+and there the losing hedged request is cancelled rather than left to finish.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+RETRYABLE_ERRORS = (ConnectionError, TimeoutError)
+
+
+class DeadlineExceeded(Exception):
+    """The model call did not finish within its deadline, retries included."""
+
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # google.api_core errors (429 TooManyRequests, 503 ServiceUnavailable, 504 DeadlineExceeded, ...) carry their
+    # HTTP status as `code`; they aren't imported here, since that loads gRPC (see llm_backends.gemini_sdk).
+    # requests/urllib3 errors raised by the REST transport carry it on their response.
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int) or isinstance(status, bool):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429 or (status is not None and 500 <= status < 600)
+
+
+class CallPolicy:
+    """How patient to be with the upstream model.
+
+    deadline_seconds: total time allowed for one call, all attempts included.
+    max_attempts: attempts per call, including the first.
+    backoff_base_seconds / backoff_max_seconds: the retry delay is drawn
+        uniformly from [0, min(max, base * 2**retry)].
+    hedge_percentile: start a hedged request once an attempt has run longer
+        than this percentile of recent latencies (0 disables hedging).
+    hedge_min_samples: latencies to observe before hedging starts.
+    """
+
+    def __init__(self, deadline_seconds=300, max_attempts=3, backoff_base_seconds=1.0, backoff_max_seconds=30.0,
+                 hedge_percentile=0, hedge_min_samples=20):
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+    @property
+    def longest_call_seconds(self):
+        """How long one call can take: the deadline, which every attempt, backoff and admission wait counts
+        against, plus a last backoff's worth for clients that overrun the time they were given."""
+        return self.deadline_seconds + self.backoff_max_seconds
+
+    def backoff(self, retry):
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** retry))
+
+
+class LatencyWindow:
+    """The most recent successful call latencies, for picking a hedge delay."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples):
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ResilientBackend:
+    """Wraps a backend with the deadline, retry and hedging rules of a CallPolicy."""
+
+    def __init__(self, backend, policy, hedge_workers=32, logger=None):
+        self.backend = backend
+        self.policy = policy
+        self.latencies = LatencyWindow()
+        self.logger = logger
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='hedge') \
+            if policy.hedge_percentile else None
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def is_configured(self):
+        return self.backend.is_configured
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.warning(message)
+
+    def _call(self, user_prompt, timeout):
+        start = time.monotonic()
+        response = self.backend.generate(user_prompt, timeout=timeout)
+        self.latencies.add(time.monotonic() - start)
+        return response
+
+    def _attempt(self, user_prompt, deadline):
+        """One attempt, hedged when the policy asks for it."""
+        remaining = deadline - time.monotonic()
+        hedge_after = self._hedge_pool and self.latencies.percentile(self.policy.hedge_percentile,
+                                                                     self.policy.hedge_min_samples)
+        if not hedge_after or hedge_after >= remaining:
+            return self._call(user_prompt, remaining)
+
+        # Copy the caller's context so admission control still knows whose call this is
+        primary = self._hedge_pool.submit(contextvars.copy_context().run, self._call, user_prompt, remaining)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+        self._log(f'Model call still running after {hedge_after:.1f}s; sending a hedged request')
+        hedge = self._hedge_pool.submit(contextvars.copy_context().run, self._call, user_prompt,
+                                        deadline - time.monotonic())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The loser keeps running until it finishes or times out; its result is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _deadline(self, timeout):
+        return time.monotonic() + min(timeout or self.policy.deadline_seconds, self.policy.deadline_seconds)
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Returns how long to wait before retrying, or raises when the call should fail."""
+        if is_retryable(error) and time.monotonic() >= deadline:
+            raise DeadlineExceeded(f'Model call did not complete within {self.policy.deadline_seconds}s') from error
+        if not is_retryable(error) or attempt + 1 == self.policy.max_attempts:
+            raise error
+        delay = self.policy.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceeded(f'Model call did not complete within {self.policy.deadline_seconds}s') from error
+        return delay
+
+    def generate(self, user_prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        for attempt in range(self.policy.max_attempts):
+            try:
+                return self._attempt(user_prompt, deadline)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                self._log(f'Model call failed ({e!r}); retry {attempt + 1} in {delay:.1f}s')
+                time.sleep(delay)
+
+    def stream(self, user_prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        for attempt in range(self.policy.max_attempts):
+            started = False
+            try:
+                for text in self.backend.stream(user_prompt, timeout=deadline - time.monotonic()):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._retry_delay(e, attempt, deadline)
+                self._log(f'Model stream failed before any output ({e!r}); retry {attempt + 1} in {delay:.1f}s')
+                time.sleep(delay)
+
+    async def _acall(self, user_prompt, timeout):
+        start = time.monotonic()
+        # wait_for enforces the deadline even if the client library ignores its timeout
+        response = await asyncio.wait_for(self.backend.agenerate(user_prompt, timeout=timeout), timeout)
+        self.latencies.add(time.monotonic() - start)
+        return response
+
+    async def _aattempt(self, user_prompt, deadline):
+        remaining = deadline - time.monotonic()
+        hedge_after = self.policy.hedge_percentile and self.latencies.percentile(self.policy.hedge_percentile,
+                                                                                 self.policy.hedge_min_samples)
+        if not hedge_after or hedge_after >= remaining:
+            return await self._acall(user_prompt, remaining)
+
+        primary = asyncio.ensure_future(self._acall(user_prompt, remaining))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        self._log(f'Model call still running after {hedge_after:.1f}s; sending a hedged request')
+        pending = {primary, asyncio.ensure_future(self._acall(user_prompt, deadline - time.monotonic()))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def agenerate(self, user_prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        for attempt in range(self.policy.max_attempts):
+            try:
+                return await self._aattempt(user_prompt, deadline)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                self._log(f'Model call failed ({e!r}); retry {attempt + 1} in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+    async def astream(self, user_prompt, timeout=None):
+        deadline = self._deadline(timeout)
+        for attempt in range(self.policy.max_attempts):
+            started = False
+            try:
+                async for text in self.backend.astream(user_prompt, timeout=deadline - time.monotonic()):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._retry_delay(e, attempt, deadline)
+                self._log(f'Model stream failed before any output ({e!r}); retry {attempt + 1} in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+
+_wrapped = {}
+_wrapped_lock = threading.Lock()
+
+
+def resilient(backend, policy, logger=None):
+    """Returns the shared ResilientBackend for a (shared) backend instance."""
+    with _wrapped_lock:
+        wrapped = _wrapped.get(id(backend))
+        if wrapped is None or wrapped.backend is not backend:
+            wrapped = _wrapped[id(backend)] = ResilientBackend(backend, policy, logger=logger)
+    return wrapped